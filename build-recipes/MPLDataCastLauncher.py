@@ -1,4 +1,8 @@
+import multiprocessing
+
 from mpl_data_cast.gui.__main__ import main
 
 if __name__ == "__main__":
+    # The GUI spawns cast worker processes (see `mpl_data_cast.worker`)
+    multiprocessing.freeze_support()
     main()
@@ -14,5 +14,6 @@ from PyInstaller.utils.hooks import collect_data_files
 datas = collect_data_files("mpl_data_cast", include_py_files=True)
 datas += collect_data_files("mpl_data_cast", subdir="gui/img")
 
-# Add the Zstandard library used by dclab
-datas += collect_data_files("hdf5plugin", includes=["plugins/libh5zstd.*"])
+# Add all HDF5 filter plugins (Zstandard used by dclab, Blosc2 used by
+# the default compression preset)
+datas += collect_data_files("hdf5plugin", includes=["plugins/libh5*"])
@@ -1,11 +1,23 @@
+import contextlib
 import inspect
+import json
 import pathlib
+import signal
+import sys
 import time
+import traceback
 from typing import List
 
 import click
 
 from .. import recipe as mpldc_recipe
+from ..control import CastControl
+
+
+#: Exit code of ``mpldc cast`` if some files could not be cast
+EXIT_ERRORS = 1
+#: Exit code of ``mpldc cast`` if the cast was cancelled
+EXIT_CANCELLED = 3
 
 
 @click.group()
@@ -19,9 +31,8 @@ def list_recipes():
     recipes = mpldc_recipe.get_available_recipe_names()
     col1len = max(len(r) for r in recipes) + 2
     for rec in recipes:
-        cls = mpldc_recipe.map_recipe_name_to_class(rec)
         col1 = rec + (" " * (col1len - len(rec)))
-        doc = cls.__doc__.strip().split("\n")[0]
+        doc = mpldc_recipe.get_recipe_description(rec)
         click.secho(f"{col1} {doc}")
 
 
@@ -42,13 +53,32 @@ def list_recipes():
 @click.option("-o", "--options", type=str, default=None,
               help="comma-separated keyword arguments passed to the recipe's "
                    + "`convert_dataset` method, e.g. "
-                   + "wavelength=984e-9,pixel_size=1.2e-6")
-def cast(path_raw, path_target, recipe="CatchAll", options=None):
+                   + "wavelength=984e-9,pixel_size=1.2e-6 or, for recipes "
+                   + "that write HDF5 files, compression=fast (presets: "
+                   + "archive, balanced, fast, gzip, none); separate "
+                   + "list items with semicolons, e.g. "
+                   + "exclude_features=image;mask;trace")
+@click.option("--json-events", type=click.Path(dir_okay=False,
+                                               allow_dash=True),
+              default=None,
+              help="write progress events as newline-delimited JSON to "
+                   + "this file; use '-' for stdout (disables all other "
+                   + "output to stdout)")
+@click.option("--non-interactive", is_flag=True,
+              help="never prompt the user (implied if stdin is not a "
+                   + "terminal)")
+def cast(path_raw, path_target, recipe="CatchAll", options=None,
+         json_events=None, non_interactive=False):
     """Cast data from a source directory to a target directory
 
     This will convert all data under the tree in PATH_RAW and
     copy them to PATH_TARGET.
+
+    The exit code is 0 if the cast was successful, 1 if some files
+    could not be cast, and 3 if the cast was cancelled.
     """
+    # JSON events on stdout must not be mixed with other output
+    quiet = json_events == "-"
     # get the actual class
     rcls = mpldc_recipe.map_recipe_name_to_class(recipe)
     # instantiate the class
@@ -74,17 +104,76 @@ def cast(path_raw, path_target, recipe="CatchAll", options=None):
                 raise ValueError("Recipe `recipe` does not implement option "
                                  + f"'{key}'; available options: "
                                  + f"{sorted(kwarg_dtypes.keys())}")
-            kwargs[key] = kwarg_dtypes[key](valuestr)
-    click.secho(f"Using recipe {recipe}.", bold=True)
-    with CLICallback() as path_callback:
-        result = rp.cast(path_callback=path_callback, **kwargs)
+            if kwarg_dtypes[key] is bool:
+                kwargs[key] = parse_bool(valuestr)
+            else:
+                kwargs[key] = kwarg_dtypes[key](valuestr)
+    if not quiet:
+        click.secho(f"Using recipe {recipe}.", bold=True)
+    control = CastControl()
+    with contextlib.ExitStack() as stack:
+        callbacks = []
+        if not quiet:
+            callbacks.append(stack.enter_context(CLICallback()))
+        if json_events is not None:
+            events = JSONEventCallback(
+                stack.enter_context(click.open_file(json_events, "w")),
+                recipe=rp)
+            callbacks.append(events)
+            events.start(recipe=recipe)
+        stack.enter_context(cancel_on_signal(control))
+
+        def path_callback(path_list):
+            for cb in callbacks:
+                cb(path_list)
+
+        try:
+            result = rp.cast(path_callback=path_callback,
+                             control=control,
+                             error_callback=(events.error if json_events
+                                             is not None else None),
+                             **kwargs)
+        except BaseException:
+            if json_events is not None:
+                # the current dataset was not finished
+                events.end_dataset(success=False)
+                events.finish({"success": False,
+                               "errors": [(None, traceback.format_exc())]})
+            raise
+
+        if result["success"]:
+            exit_code = 0
+        elif result.get("cancelled"):
+            exit_code = EXIT_CANCELLED
+        else:
+            exit_code = EXIT_ERRORS
+        if json_events is not None:
+            events.finish(result, exit_code=exit_code)
+
+    if not quiet:
+        print_result(result,
+                     interactive=not non_interactive and sys.stdin.isatty())
+    if exit_code:
+        click.get_current_context().exit(exit_code)
+
+
+def print_result(result: dict, interactive: bool = True) -> None:
+    """Print the result of a cast (see :func:`Recipe.cast`)
+
+    If `interactive` is set and errors occurred, the user is asked
+    whether the tracebacks should be written to "mpldc-dump.txt".
+    """
     if result["success"]:
         click.secho("Success!", bold=True)
+    elif result.get("cancelled"):
+        click.secho("Cancelled! Run the same command again to resume.",
+                    bold=True)
     else:
         click.secho("Errors encountered for the following files: ", bold=True)
         for path, _ in result["errors"]:
             click.echo(f" - {path}")
-        if click.confirm('Should I dump the tracebacks to "mpldc-dump.txt"?'):
+        if interactive and click.confirm(
+                'Should I dump the tracebacks to "mpldc-dump.txt"?'):
             text = ""
             for path, tb in result["errors"]:
                 text += f"PATH {path}:\n{tb}\n\n"
@@ -127,3 +216,171 @@ class CLICallback:
         print(" " * self.prev_len, end="\r")
         print(message, end="\r")
         self.prev_len = len(message)
+
+
+class JSONEventCallback:
+    def __init__(self, stream, recipe=None):
+        """Write the progress of a cast as newline-delimited JSON
+
+        Every line written to `stream` is a JSON object with the keys
+        "event" (the event type) and "time" (UNIX time stamp). Sizes
+        are given in bytes, durations in seconds, and rates in bytes
+        per second. The event types are:
+
+        - "start": the cast started ("recipe", "path_raw",
+          "path_target")
+        - "dataset_start": processing of a dataset started ("index",
+          "path", "paths", "size", "stage")
+        - "dataset_end": processing of a dataset ended ("index",
+          "path", "size", "duration", "rate", "success")
+        - "error": a dataset could not be cast ("path", "traceback");
+          written when the error occurs, followed by the "dataset_end"
+          event of the dataset with "success" set to false
+        - "end": the cast ended ("success", "cancelled", "datasets",
+          "bytes", "duration", "rate", "errors", "message",
+          "exit_code")
+
+        Parameters
+        ----------
+        stream: file-like
+            text stream the events are written to (flushed after
+            each event)
+        recipe: mpl_data_cast.recipe.Recipe
+            recipe instance performing the cast
+        """
+        self.stream = stream
+        self.recipe = recipe
+        self.counter = 0
+        self.size = 0
+        self.time_start = time.monotonic()
+        #: errors written so far (tuples of path and traceback)
+        self.errors = []
+        self._current = None  # (event, monotonic start time)
+
+    def __call__(self, path_list: List[pathlib.Path]) -> None:
+        self.end_dataset()
+        size = 0
+        for pp in path_list:
+            try:
+                size += pp.stat().st_size
+            except OSError:
+                # e.g. optional junk files that do not exist
+                pass
+        event = {"index": self.counter,
+                 "path": str(path_list[0]),
+                 "paths": [str(pp) for pp in path_list],
+                 "size": size,
+                 "stage": getattr(self.recipe, "stage", None),
+                 }
+        self.counter += 1
+        self.write("dataset_start", **event)
+        self._current = (event, time.monotonic())
+
+    def end_dataset(self, success: bool = True):
+        """Write the "dataset_end" event of the current dataset"""
+        if self._current is not None:
+            event, time_start = self._current
+            self._current = None
+            duration = time.monotonic() - time_start
+            if success:
+                self.size += event["size"]
+            self.write("dataset_end",
+                       index=event["index"],
+                       path=event["path"],
+                       size=event["size"],
+                       duration=duration,
+                       rate=event["size"] / duration if duration else None,
+                       success=success)
+
+    def error(self, path: pathlib.Path, tb: str):
+        """Write an "error" event (used as `error_callback` of a cast)
+
+        If the error belongs to the current dataset, its "dataset_end"
+        event is written (with "success" set to false).
+        """
+        self.errors.append((path, tb))
+        self.write("error",
+                   path=str(path) if path is not None else None,
+                   traceback=tb)
+        if (self._current is not None
+                and self._current[0]["path"] == str(path)):
+            self.end_dataset(success=False)
+
+    def start(self, **kwargs):
+        """Write the "start" event"""
+        self.time_start = time.monotonic()
+        if self.recipe is not None:
+            kwargs.setdefault("path_raw", str(self.recipe.path_raw))
+            kwargs.setdefault("path_target", str(self.recipe.path_tar))
+        self.write("start", **kwargs)
+
+    def finish(self, result: dict, exit_code: int = None):
+        """Write the "end" event for the result of a cast
+
+        Errors in `result` that were not reported via :func:`error`
+        are written before.
+        """
+        for path, tb in result.get("errors", []):
+            if (path, tb) not in self.errors:
+                self.error(path, tb)
+        if result.get("cancelled"):
+            # the current dataset was not finished
+            self._current = None
+        else:
+            self.end_dataset()
+        duration = time.monotonic() - self.time_start
+        self.write("end",
+                   success=result["success"],
+                   cancelled=bool(result.get("cancelled")),
+                   datasets=self.counter,
+                   bytes=self.size,
+                   duration=duration,
+                   rate=self.size / duration if duration else None,
+                   errors=len(result.get("errors", [])),
+                   message=result.get("message"),
+                   exit_code=exit_code)
+
+    def write(self, event: str, **kwargs) -> None:
+        self.stream.write(json.dumps(dict(event=event,
+                                          time=time.time(),
+                                          **kwargs)) + "\n")
+        self.stream.flush()
+
+
+@contextlib.contextmanager
+def cancel_on_signal(control: CastControl):
+    """Cancel a cast gracefully on SIGINT or SIGTERM
+
+    The cast stops at the next checkpoint and can be resumed. A
+    second signal interrupts the program immediately.
+    """
+    signums = [signal.SIGINT, signal.SIGTERM]
+    previous = {signum: signal.getsignal(signum) for signum in signums}
+
+    def handler(signum, frame):
+        # stderr, because stdout may be a stream of JSON events
+        click.echo("", err=True)
+        click.secho("Cancelling (press Ctrl+C again to abort)...",
+                    bold=True, err=True)
+        control.cancel()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    for signum in signums:
+        signal.signal(signum, handler)
+    try:
+        yield
+    finally:
+        for signum in signums:
+            signal.signal(signum, previous[signum])
+
+
+def parse_bool(valuestr: str) -> bool:
+    """Convert a boolean option string (e.g. "true" or "0") to bool"""
+    value = valuestr.strip().lower()
+    if value in ["1", "true", "yes", "on"]:
+        return True
+    elif value in ["0", "false", "no", "off"]:
+        return False
+    else:
+        raise ValueError(f"Invalid boolean value: '{valuestr}'!")
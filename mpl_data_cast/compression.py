@@ -0,0 +1,129 @@
+"""HDF5 compression presets shared by the recipes"""
+import os
+
+import h5py
+import hdf5plugin
+import psutil
+
+
+#: Number of Blosc threads set by the user (environment variable)
+USER_BLOSC_NTHREADS = os.environ.get("BLOSC_NTHREADS")
+
+#: Name of the compression preset used by default
+DEFAULT_COMPRESSION = "balanced"
+
+#: Compression presets; each preset maps to a list containing a short
+#: description and the keyword arguments for `h5py.Group.create_dataset`
+COMPRESSION_PRESETS = {
+    "archive": [
+        "maximum compression ratio (Blosc2/Zstandard level 9, slow)",
+        dict(hdf5plugin.Blosc2(cname="zstd",
+                               clevel=9,
+                               filters=hdf5plugin.Blosc2.SHUFFLE)),
+    ],
+    "balanced": [
+        "good compression ratio (Blosc2/Zstandard level 5)",
+        dict(hdf5plugin.Blosc2(cname="zstd",
+                               clevel=5,
+                               filters=hdf5plugin.Blosc2.SHUFFLE)),
+    ],
+    "fast": [
+        "fast compression (Blosc2/LZ4 level 5)",
+        dict(hdf5plugin.Blosc2(cname="lz4",
+                               clevel=5,
+                               filters=hdf5plugin.Blosc2.SHUFFLE)),
+    ],
+    "gzip": [
+        "gzip level 9 (readable without hdf5plugin, very slow)",
+        {"compression": "gzip", "compression_opts": 9, "shuffle": True},
+    ],
+    "none": [
+        "no compression",
+        {},
+    ],
+}
+
+#: HDF5 filter IDs of compression codecs that are good enough for
+#: archiving; datasets compressed with any of these are copied as-is
+#: (without decompressing and compressing them again)
+ACCEPTED_COMPRESSION_FILTERS = {
+    h5py.h5z.FILTER_DEFLATE: "gzip",
+    hdf5plugin.BLOSC_ID: "Blosc",
+    hdf5plugin.BLOSC2_ID: "Blosc2",
+    hdf5plugin.LZ4_ID: "LZ4",
+    hdf5plugin.ZSTD_ID: "Zstandard",
+}
+
+
+def get_num_threads() -> int:
+    """Return the number of CPUs this process may run on
+
+    This respects the CPU affinity (e.g. of the cast worker process,
+    see :mod:`mpl_data_cast.worker`).
+    """
+    try:
+        return len(psutil.Process().cpu_affinity())
+    except (AttributeError, OSError):
+        # CPU affinity is not supported on macOS
+        return os.cpu_count() or 1
+
+
+def set_blosc_threads(num_threads: int = None):
+    """Set the number of threads used by the HDF5 Blosc filters
+
+    The Blosc filters of hdf5plugin read the number of threads from
+    the environment variable BLOSC_NTHREADS when they create their
+    compression context (hdf5plugin does not offer an API for this).
+    Call this before writing data. A value set by the user in the
+    environment takes precedence.
+
+    Parameters
+    ----------
+    num_threads: int
+        number of threads, defaults to :func:`get_num_threads`
+    """
+    if USER_BLOSC_NTHREADS is None:
+        os.environ["BLOSC_NTHREADS"] = str(num_threads or get_num_threads())
+
+
+def get_compression_kwargs(compression: str = DEFAULT_COMPRESSION) -> dict:
+    """Return the `create_dataset` keyword arguments for a preset
+
+    Parameters
+    ----------
+    compression: str
+        name of the compression preset (see `COMPRESSION_PRESETS`)
+
+    Returns
+    -------
+    kwargs: dict
+        keyword arguments for :func:`h5py.Group.create_dataset`
+        (a copy that may be modified by the caller)
+    """
+    if compression not in COMPRESSION_PRESETS:
+        raise ValueError(f"Unknown compression preset '{compression}', "
+                         f"expected one of {sorted(COMPRESSION_PRESETS)}!")
+    return dict(COMPRESSION_PRESETS[compression][1])
+
+
+def get_compression_codec(dataset: h5py.Dataset) -> str | None:
+    """Return the name of the accepted codec a dataset is compressed with
+
+    Only the filter pipeline of `dataset` is inspected, no data are
+    read (see `ACCEPTED_COMPRESSION_FILTERS`). Returns `None` if the
+    dataset is not compressed with an accepted codec.
+    """
+    plist = dataset.id.get_create_plist()
+    for ii in range(plist.get_nfilters()):
+        filter_id = plist.get_filter(ii)[0]
+        if filter_id in ACCEPTED_COMPRESSION_FILTERS:
+            return ACCEPTED_COMPRESSION_FILTERS[filter_id]
+    return None
+
+
+def is_compressed(dataset: h5py.Dataset) -> bool:
+    """Whether a dataset is compressed with an accepted codec
+
+    See :func:`get_compression_codec`.
+    """
+    return get_compression_codec(dataset) is not None
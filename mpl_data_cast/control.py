@@ -0,0 +1,47 @@
+"""Pausing and cancelling a running cast"""
+import threading
+
+
+class CastCancelled(Exception):
+    """Raised at a checkpoint of a cast that was cancelled"""
+
+
+class CastControl:
+    def __init__(self):
+        """Pause, resume, or cancel a cast from another thread
+
+        The cast periodically calls :func:`wait` (a checkpoint), which
+        blocks while the cast is paused and raises
+        :class:`CastCancelled` if the cast was cancelled.
+        """
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def cancel(self):
+        """Cancel the cast at the next checkpoint (also when paused)"""
+        self._cancelled.set()
+        self._running.set()
+
+    def pause(self):
+        """Pause the cast at the next checkpoint"""
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self):
+        """Resume a paused cast"""
+        self._running.set()
+
+    def wait(self):
+        """Block while paused, raise `CastCancelled` if cancelled"""
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise CastCancelled("The cast was cancelled")
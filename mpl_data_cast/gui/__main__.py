@@ -1,4 +1,9 @@
 def main():
+    import multiprocessing
+    # The cast worker processes are spawned (frozen applications must
+    # handle this before anything else).
+    multiprocessing.freeze_support()
+
     from importlib import resources
     import logging
     import sys
@@ -1,19 +1,21 @@
 from importlib import resources
+import inspect
 import logging
 import os
 import time
 import signal
 import pathlib
 import sys
+import threading
 import traceback
 
-import dclab
-import h5py
-import numpy
 from PyQt6 import uic, QtCore, QtWidgets
 
 from .. import recipe as mpldc_recipe
 from .._version import version
+from ..control import CastControl
+from ..progress import CastProgress, format_duration
+from ..worker import CastWorker, get_default_cpu_affinity
 
 from . import preferences
 from . import splash
@@ -22,8 +24,14 @@ from . import widget_tree
 
 logger = logging.getLogger(__name__)
 
+#: Interval (in ms) at which the progress of a transfer is updated
+PROGRESS_INTERVAL = 100
+
 
 class MPLDataCast(QtWidgets.QMainWindow):
+    #: emitted with the result dictionary of `Recipe.cast` after a transfer
+    transfer_finished = QtCore.pyqtSignal(dict)
+
     def __init__(self, *args, **kwargs):
         """Initialize MPL-Data-Cast"""
         # Settings apply to promoted widgets as well
@@ -82,11 +90,21 @@ class MPLDataCast(QtWidgets.QMainWindow):
         else:
             default = recipes.index("CatchAll")
         self.comboBox_recipe.setCurrentIndex(default)
-        self.on_recipe_changed()
+        # importing the recipe may take a while (show the window first)
+        QtCore.QTimer.singleShot(0, self.on_recipe_changed)
 
         # load some values from the settings
         # signals
         self.pushButton_transfer.clicked.connect(self.on_task_transfer)
+        self.pushButton_pause.toggled.connect(self.on_task_pause)
+        self.pushButton_cancel.clicked.connect(self.on_task_cancel)
+        #: Pause/cancel control of the running transfer
+        self.cast_control = None
+        #: Thread of the running transfer
+        self.caster = None
+        #: Updates the progress of a transfer at a fixed rate
+        self.progress_timer = QtCore.QTimer(self)
+        self.progress_timer.setInterval(PROGRESS_INTERVAL)
         # GUI
         self.setWindowTitle(f"MPL-Data-Cast {version}")
         # Disable native menu bar (e.g. on Mac)
@@ -103,14 +121,35 @@ class MPLDataCast(QtWidgets.QMainWindow):
         self.comboBox_recipe.currentIndexChanged.connect(
             self.on_recipe_changed)
 
+        # Highlight transferred datasets in the input tree
+        self.widget_input.model.set_target_path(self.widget_output.path)
+        self.widget_output.path_changed.connect(
+            self.widget_input.model.set_target_path)
+
         self.show()
         self.raise_()
 
-        # Clean up stale temporary data
-        mpldc_recipe.cleanup_tmp_dirs()
+        # Clean up stale temporary data in the background
+        threading.Thread(target=mpldc_recipe.cleanup_tmp_dirs,
+                         name="MPLDCCleanup",
+                         daemon=True).start()
         splash.splash_close()
         logger.info("Completed initialization")
 
+    def closeEvent(self, event):
+        """Cancel a running transfer (it can be resumed later)"""
+        if self.cast_control is not None:
+            self.cast_control.cancel()
+            # wait until the checkpoint is written
+            self.caster.finished.disconnect()
+            self.caster.wait()
+            self.progress_timer.stop()
+        # stop crawling the directory trees
+        for widget in [self.widget_input, self.widget_output]:
+            widget.tree_counter.stop()
+            widget.model.shutdown()
+        super(MPLDataCast, self).closeEvent(event)
+
     @property
     def current_recipe(self):
         name = self.comboBox_recipe.currentData()
@@ -159,16 +198,19 @@ class MPLDataCast(QtWidgets.QMainWindow):
     @QtCore.pyqtSlot()
     def on_action_software(self) -> None:
         """Show used software packages and dependencies."""
-        libs = [dclab,
-                h5py,
-                numpy,
+        # read the versions from the package metadata (importing the
+        # packages would take seconds)
+        libs = ["dclab",
+                "h5py",
+                "numpy",
                 ]
 
         sw_text = f"MPL-Data-Cast {version}\n\n"
         sw_text += f"Python {sys.version}\n\n"
         sw_text += "Modules:\n"
         for lib in libs:
-            sw_text += f"- {lib.__name__} {lib.__version__}\n"
+            lib_version = mpldc_recipe.get_package_version(lib)
+            sw_text += f"- {lib} {lib_version or 'not installed'}\n"
         sw_text += f"- PyQt6 {QtCore.QT_VERSION_STR}\n"
 
         QtWidgets.QMessageBox.information(self, "Software", sw_text)
@@ -211,37 +253,77 @@ class MPLDataCast(QtWidgets.QMainWindow):
                 return
 
         self.pushButton_transfer.setEnabled(False)
-        rp = self.current_recipe(self.widget_input.path,
-                                 self.widget_output.path)
+        rec_cls = self.current_recipe
+        if int(self.settings.value("worker/enabled", 1)):
+            # isolate the cast in a supervised worker process
+            max_rss = int(self.settings.value("worker/max_rss_mb", 0))
+            num_cpus = int(self.settings.value("worker/num_cpus", 0))
+            rp = CastWorker(self.comboBox_recipe.currentData(),
+                            self.widget_input.path,
+                            self.widget_output.path,
+                            max_rss=max_rss * 1024**2 or None,
+                            cpu_affinity=get_default_cpu_affinity(num_cpus))
+        else:
+            rp = rec_cls(self.widget_input.path, self.widget_output.path)
 
         logger.info(f"Running recipe: {rp}")
 
+        # keyword arguments for the recipe from the preferences
+        kwargs = {}
+        if "compression" in inspect.signature(
+                rec_cls.convert_dataset).parameters:
+            from ..compression import DEFAULT_COMPRESSION
+            kwargs["compression"] = self.settings.value("main/compression",
+                                                        DEFAULT_COMPRESSION)
+
+        self.cast_control = CastControl()
+        self.pushButton_pause.setEnabled(True)
+        self.pushButton_cancel.setEnabled(True)
+
         tree_counter = self.widget_input.tree_counter
-        with CastingCallback(self, tree_counter) as path_callback:
-            path_callback.set_progress_text.connect(self.label_file.setText)
-            path_callback.set_progress_value.connect(self.progressBar.setValue)
-            path_callback.set_progress_mode.connect(self.on_set_progress_mode)
-            # run the casting operation in a separate thread
-            caster = CastingThread(self, rp, path_callback=path_callback)
-            caster.start()
-
-        while caster.isRunning():
-            QtWidgets.QApplication.processEvents(
-                QtCore.QEventLoop.ProcessEventsFlag.AllEvents, 300)
-            time.sleep(.1)
+        path_callback = CastingCallback(self, tree_counter, rp)
+        path_callback.set_progress_text.connect(self.label_file.setText)
+        path_callback.set_progress_value.connect(self.progressBar.setValue)
+        path_callback.set_progress_mode.connect(self.on_set_progress_mode)
+        self.progress_timer.timeout.connect(path_callback.update_progress)
+        # run the casting operation in a separate thread
+        caster = CastingThread(self, rp, path_callback=path_callback,
+                               control=self.cast_control,
+                               **kwargs)
+        caster.finished.connect(self.on_task_transfer_finished)
+        self.caster = caster
+        self.progress_timer.start()
+        caster.start()
 
-        result = caster.result
+    @QtCore.pyqtSlot()
+    def on_task_transfer_finished(self) -> None:
+        """Show the result of a transfer (`CastingThread` finished)"""
+        self.progress_timer.stop()
+        self.progress_timer.timeout.disconnect()
+        result = self.caster.result
+        self.cast_control = None
+        self.caster = None
+        self.pushButton_pause.setChecked(False)
+        self.pushButton_pause.setEnabled(False)
+        self.pushButton_cancel.setEnabled(False)
 
         self.widget_output.trigger_recount_objects()
+        self.widget_input.trigger_recount_objects()
 
-        if result["success"]:
+        if result.get("cancelled"):
+            logger.info("Transfer cancelled")
+            self.progressBar.setValue(0)
+            QtWidgets.QMessageBox.information(
+                self, "Transfer cancelled",
+                "Data transfer cancelled. Transfer the same directory "
+                "again to resume.")
+        elif result["success"]:
             logger.info("Transfer completed successfully")
+            self.on_set_progress_mode("100%")
             self.progressBar.setValue(100)
             QtWidgets.QMessageBox.information(self, "Transfer completed",
                                               "Data transfer completed.")
             self.progressBar.setValue(0)
-            QtWidgets.QApplication.processEvents(
-                QtCore.QEventLoop.ProcessEventsFlag.AllEvents, 300)
         else:
             logger.error(f"Transfer failed:\n{result}")
             msg = "Some problems occurred during data transfer:\n"
@@ -252,11 +334,34 @@ class MPLDataCast(QtWidgets.QMainWindow):
             QtWidgets.QMessageBox.information(self, "Error", msg)
 
             text = ""
-            for path, tb in result["errors"]:
+            for path, tb in result.get("errors", []):
                 text += f"PATH {path}:\n{tb}\n\n"
             pathlib.Path("mpldc-dump.txt").write_text(text)
         self.label_file.setText("")
         self.pushButton_transfer.setEnabled(True)
+        self.transfer_finished.emit(result)
+
+    @QtCore.pyqtSlot()
+    def on_task_cancel(self):
+        """Cancel the running transfer"""
+        if self.cast_control is not None:
+            self.label_file.setText("Cancelling...")
+            self.cast_control.cancel()
+            self.pushButton_pause.setEnabled(False)
+            self.pushButton_cancel.setEnabled(False)
+
+    @QtCore.pyqtSlot(bool)
+    def on_task_pause(self, paused):
+        """Pause or resume the running transfer"""
+        if self.cast_control is not None:
+            if paused:
+                self.cast_control.pause()
+                self.pushButton_pause.setText("Resume")
+            else:
+                self.cast_control.resume()
+                self.pushButton_pause.setText("Pause")
+        else:
+            self.pushButton_pause.setText("Pause")
 
     @QtCore.pyqtSlot(str)
     def on_set_progress_mode(self, mode):
@@ -275,12 +380,23 @@ class CastingCallback(QtCore.QObject):
 
     def __init__(self,
                  parent: MPLDataCast,
-                 tree_counter: widget_tree.TreeObjectCounter):
+                 tree_counter: widget_tree.TreeObjectCounter,
+                 recipe: mpldc_recipe.Recipe = None):
         super(CastingCallback, self).__init__(parent)
         self.gui = parent
         self.counter = 0
         #: This is a thread running in the background, counting recipe files.
         self.tree_counter = tree_counter
+        #: The recipe instance that is casting
+        self.recipe = recipe
+        #: Byte-weighted progress of the cast
+        self.progress = CastProgress(
+            conversion_cost=(recipe.conversion_cost if recipe is not None
+                             else 1.0))
+        #: The first path of the dataset currently processed
+        self.path = None
+        # last values emitted (only changes are emitted)
+        self._emitted = {}
 
     def __enter__(self):
         return self
@@ -289,33 +405,81 @@ class CastingCallback(QtCore.QObject):
         pass
 
     def __call__(self, path_list) -> None:
-        path = path_list[0]
-        # Let the user know where we are
-        self.set_progress_text.emit(f"Processing {path}...")
+        """Called by `Recipe.cast` (in the casting thread)"""
+        size = 0
+        for pp in path_list:
+            try:
+                size += pp.stat().st_size
+            except OSError:
+                # e.g. optional junk files that do not exist
+                pass
+        converted = self.recipe is None or self.recipe.stage != "copy"
+        self.progress.add_dataset(size, converted=converted)
+        self.path = path_list[0]
+        self.counter += len(path_list)
 
+    @QtCore.pyqtSlot()
+    def update_progress(self) -> None:
+        """Let the user know where we are
+
+        This is called by a timer at a fixed rate (independent of the
+        number of files processed) and only emits changes.
+        """
+        path = self.path
+        if path is None:
+            return
         if self.tree_counter.has_counted:
+            self.progress.total_size = self.tree_counter.size_objects
+        # bytes of the current file already copied
+        state = self.recipe.checkpoint_state if self.recipe else None
+        if state and state.get("current") and state["current"][0] == path:
+            self.progress.advance(state["current"][1])
+        rate = self.progress.update_rate()
+
+        text = f"Processing {path}..."
+        info = []
+        if rate:
+            info.append(f"{rate / 1024**2:.1f} MB/s")
+        eta = self.progress.get_eta()
+        if eta is not None:
+            info.append(f"{format_duration(eta)} remaining")
+        if info:
+            text += f" ({', '.join(info)})"
+        self.emit_changed(self.set_progress_text, text)
+
+        if self.progress.is_determined:
             # Let the user know how far we are
-            self.set_progress_mode.emit("100%")
-            self.set_progress_value.emit(
-                int(self.counter / self.tree_counter.num_objects * 100))
-
+            self.emit_changed(self.set_progress_mode, "100%")
+            self.emit_changed(self.set_progress_value,
+                              int(self.progress.get_fraction() * 100))
         else:
             # go to undetermined state
-            self.set_progress_mode.emit("undetermined")
+            self.emit_changed(self.set_progress_mode, "undetermined")
 
-        self.counter += len(path_list)
+    def emit_changed(self, signal, value):
+        """Emit `signal` unless `value` was emitted previously"""
+        key = signal.signal
+        if self._emitted.get(key) != value:
+            self._emitted[key] = value
+            signal.emit(value)
 
 
 class CastingThread(QtCore.QThread):
-    def __init__(self, parent, rp, path_callback):
+    def __init__(self, parent, rp, path_callback, control=None, **kwargs):
         super(CastingThread, self).__init__(parent)
         self.rp = rp
         self.path_callback = path_callback
+        #: pause/cancel control of the cast
+        self.control = control
+        #: keyword arguments passed to `Recipe.convert_dataset`
+        self.kwargs = kwargs
         self.result = {}
 
     def run(self):
         try:
-            self.result = self.rp.cast(path_callback=self.path_callback)
+            self.result = self.rp.cast(path_callback=self.path_callback,
+                                       control=self.control,
+                                       **self.kwargs)
         except BaseException:
             self.result = {"success": False,
                            "message": traceback.format_exc()
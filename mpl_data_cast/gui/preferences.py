@@ -26,11 +26,20 @@ class Preferences(QtWidgets.QDialog):
         self.available_recipes = mpldc_recipe.get_available_recipe_names()
         for rr in self.available_recipes:
             self.comboBox_recipe.addItem(rr, rr)
+        # Populate the compression presets (imports h5py)
+        from ..compression import COMPRESSION_PRESETS, DEFAULT_COMPRESSION
+        for name, (descr, _) in COMPRESSION_PRESETS.items():
+            self.comboBox_compression.addItem(f"{name}: {descr}", name)
         #: configuration keys, corresponding widgets, and defaults
         self.config_pairs = [
             ["main/output_path", self.lineEdit_output_path,
              pathlib.Path.home()],
-            ["main/recipe", self.comboBox_recipe, "CatchAll"]
+            ["main/recipe", self.comboBox_recipe, "CatchAll"],
+            ["main/compression", self.comboBox_compression,
+             DEFAULT_COMPRESSION],
+            ["worker/enabled", self.checkBox_worker, 1],
+            ["worker/max_rss_mb", self.spinBox_worker_rss, 0],
+            ["worker/num_cpus", self.spinBox_worker_cpus, 0],
         ]
         self.reload()
 
@@ -59,6 +68,11 @@ class Preferences(QtWidgets.QDialog):
             elif widget is self.comboBox_recipe:
                 recipe_idx = self.available_recipes.index(str(value))
                 widget.setCurrentIndex(recipe_idx)
+            elif widget is self.comboBox_compression:
+                cmp_idx = widget.findData(str(value))
+                if cmp_idx < 0:
+                    cmp_idx = widget.findData(default)
+                widget.setCurrentIndex(cmp_idx)
             else:
                 raise NotImplementedError("No rule for '{}'".format(key))
 
@@ -0,0 +1,378 @@
+import concurrent.futures
+import logging
+import pathlib
+import threading
+
+from PyQt6 import QtCore, QtGui, QtWidgets
+
+from ..scan import SCAN_CACHE
+
+
+logger = logging.getLogger(__name__)
+
+
+class TreeNode:
+    __slots__ = ["name", "path", "parent", "is_dir", "size", "children",
+                 "fetching", "row"]
+
+    def __init__(self, path, parent=None, is_dir=True, size=None, row=0):
+        """Node (file or directory) of a :class:`DirectoryTreeModel`"""
+        self.name = path.name
+        self.path = path
+        self.parent = parent
+        self.is_dir = is_dir
+        #: file size in bytes (None for directories)
+        self.size = size
+        #: child nodes (None if the directory was not listed yet)
+        self.children = None if is_dir else []
+        #: whether the directory is currently listed in the background
+        self.fetching = False
+        self.row = row
+
+
+class DirectoryTreeModel(QtCore.QAbstractItemModel):
+    #: emitted (in a worker thread) when a directory was listed
+    directory_listed = QtCore.pyqtSignal(object, object, int)
+    #: emitted (in a worker thread) when the tree statistics are ready
+    statistics_computed = QtCore.pyqtSignal(object, int)
+
+    columns = ["Name", "Size", "Datasets"]
+
+    def __init__(self, *args, **kwargs):
+        """Lazy model of a directory tree
+
+        Directories are listed in the background (using the shared
+        :const:`mpl_data_cast.scan.SCAN_CACHE`) when they are expanded
+        in the view, so that huge directory trees do not block the
+        user interface. The sizes of the subtrees and the number of
+        datasets (according to :const:`recipe`) are computed in the
+        background. Datasets whose target file exists in
+        :const:`target_path` are highlighted.
+        """
+        super(DirectoryTreeModel, self).__init__(*args, **kwargs)
+        self.root = None
+        #: recipe class for identifying datasets
+        self.recipe = None
+        #: target directory for identifying transferred datasets
+        self.target_path = None
+        #: size of each subtree in bytes
+        self.subtree_sizes = {}
+        #: number of datasets in each subtree
+        self.dataset_counts = {}
+        #: number of transferred datasets in each subtree
+        self.transferred_counts = {}
+        #: first paths of all datasets that were transferred
+        self.transferred = set()
+        self._sort_column = 0
+        self._sort_order = QtCore.Qt.SortOrder.AscendingOrder
+        # incremented whenever the tree is reset (discards results of
+        # background jobs for the previous tree)
+        self._generation = 0
+        #: whether :func:`shutdown` was called
+        self.is_shut_down = False
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="MPLDCTreeModel")
+        self._icons = QtWidgets.QFileIconProvider()
+        self.directory_listed.connect(self.on_directory_listed)
+        self.statistics_computed.connect(self.on_statistics_computed)
+
+    def set_root_path(self, path):
+        """Show the contents of the directory `path`"""
+        if self.is_shut_down:
+            return
+        self.beginResetModel()
+        self._generation += 1
+        self.root = TreeNode(pathlib.Path(path))
+        self.subtree_sizes = {}
+        self.dataset_counts = {}
+        self.transferred_counts = {}
+        self.transferred = set()
+        self.endResetModel()
+        self.fetch_node(self.root)
+        self.compute_statistics()
+
+    def set_recipe(self, recipe):
+        if recipe != self.recipe:
+            self.recipe = recipe
+            self.refresh()
+
+    def set_target_path(self, path):
+        if path != self.target_path:
+            self.target_path = path
+            self.refresh()
+
+    def refresh(self):
+        """List the directory tree again"""
+        if self.root is not None:
+            self.set_root_path(self.root.path)
+
+    def shutdown(self):
+        """Discard all background jobs"""
+        self._generation += 1
+        self.is_shut_down = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # Background jobs
+    def fetch_node(self, node):
+        if self.is_shut_down:
+            return
+        node.fetching = True
+        self._pool.submit(self._list_directory, node, self._generation)
+
+    def _list_directory(self, node, generation):
+        if generation == self._generation:
+            listing = SCAN_CACHE.list_directory(node.path)
+            self.directory_listed.emit(node, listing, generation)
+
+    @QtCore.pyqtSlot(object, object, int)
+    def on_directory_listed(self, node, listing, generation):
+        if generation != self._generation:
+            return
+        children = [TreeNode(node.path / name, node) for name in listing.dirs]
+        children += [TreeNode(node.path / name, node, is_dir=False, size=size)
+                     for name, size, _ in listing.files]
+        self._sort_nodes(children)
+        node.fetching = False
+        if children:
+            self.beginInsertRows(self.get_index(node), 0, len(children) - 1)
+            node.children = children
+            self.endInsertRows()
+        else:
+            node.children = children
+            index = self.get_index(node)
+            if index.isValid():
+                # update the expansion indicator
+                self.dataChanged.emit(index, index)
+
+    def compute_statistics(self):
+        """Compute subtree sizes and dataset counts in the background"""
+        thread = threading.Thread(target=self._compute_statistics,
+                                  args=(self.root.path,
+                                        self.recipe,
+                                        self.target_path,
+                                        self._generation),
+                                  daemon=True)
+        thread.start()
+
+    def _compute_statistics(self, root, recipe, target_path, generation):
+        def is_outdated():
+            return generation != self._generation
+
+        stats = {"sizes": {},
+                 "datasets": {},
+                 "transferred": {},
+                 "transferred_paths": set()}
+        for pdir, listing in SCAN_CACHE.walk(root, abort=is_outdated):
+            size = sum(fsize for _, fsize, _ in listing.files)
+            for pp in iter_ancestors(pdir, root):
+                stats["sizes"][pp] = stats["sizes"].get(pp, 0) + size
+        if recipe is not None and not is_outdated():
+            try:
+                rp = recipe(root, target_path or root)
+                for path_list in rp.get_raw_data_iterator():
+                    if is_outdated():
+                        break
+                    done = (target_path is not None
+                            and rp.get_target_path(path_list).exists())
+                    if done:
+                        stats["transferred_paths"].add(path_list[0])
+                    for pp in iter_ancestors(path_list[0].parent, root):
+                        stats["datasets"][pp] = \
+                            stats["datasets"].get(pp, 0) + 1
+                        if done:
+                            stats["transferred"][pp] = \
+                                stats["transferred"].get(pp, 0) + 1
+            except BaseException:
+                logger.exception(f"Could not find datasets in {root}")
+        if not is_outdated():
+            self.statistics_computed.emit(stats, generation)
+
+    @QtCore.pyqtSlot(object, int)
+    def on_statistics_computed(self, stats, generation):
+        if generation != self._generation:
+            return
+        self.subtree_sizes = stats["sizes"]
+        self.dataset_counts = stats["datasets"]
+        self.transferred_counts = stats["transferred"]
+        self.transferred = stats["transferred_paths"]
+        if self._sort_column != 0:
+            self.sort(self._sort_column, self._sort_order)
+        # update all rows that are shown
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.children:
+                self.dataChanged.emit(
+                    self.index(0, 0, self.get_index(node)),
+                    self.index(len(node.children) - 1,
+                               len(self.columns) - 1,
+                               self.get_index(node)))
+                stack += [ch for ch in node.children if ch.children]
+
+    # QAbstractItemModel implementation
+    def get_index(self, node, column=0):
+        if node is None or node is self.root:
+            return QtCore.QModelIndex()
+        return self.createIndex(node.row, column, node)
+
+    def get_node(self, index):
+        if index.isValid():
+            return index.internalPointer()
+        return self.root
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        node = self.get_node(parent)
+        if (node is None or node.children is None
+                or not 0 <= row < len(node.children)):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        return self.get_index(index.internalPointer().parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        node = self.get_node(parent)
+        if node is None or node.children is None:
+            return 0
+        return len(node.children)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self.columns)
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        node = self.get_node(parent)
+        if node is None or not node.is_dir:
+            return False
+        # unlisted directories can be expanded
+        return node.children is None or bool(node.children)
+
+    def canFetchMore(self, parent):
+        node = self.get_node(parent)
+        return (node is not None and node.is_dir
+                and node.children is None and not node.fetching)
+
+    def fetchMore(self, parent):
+        node = self.get_node(parent)
+        if self.canFetchMore(parent):
+            self.fetch_node(node)
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.ItemFlag.NoItemFlags
+        return (QtCore.Qt.ItemFlag.ItemIsEnabled
+                | QtCore.Qt.ItemFlag.ItemIsSelectable)
+
+    def headerData(self, section, orientation,
+                   role=QtCore.Qt.ItemDataRole.DisplayRole):
+        if (orientation == QtCore.Qt.Orientation.Horizontal
+                and role == QtCore.Qt.ItemDataRole.DisplayRole):
+            return self.columns[section]
+        return None
+
+    def data(self, index, role=QtCore.Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        column = index.column()
+        if role == QtCore.Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return node.name
+            elif column == 1:
+                size = node.size if not node.is_dir else \
+                    self.subtree_sizes.get(node.path)
+                return human_size(size) if size is not None else ""
+            elif column == 2:
+                return self.get_dataset_text(node)
+        elif role == QtCore.Qt.ItemDataRole.DecorationRole and column == 0:
+            if node.is_dir:
+                return self._icons.icon(
+                    QtWidgets.QFileIconProvider.IconType.Folder)
+            else:
+                return self._icons.icon(
+                    QtWidgets.QFileIconProvider.IconType.File)
+        elif role == QtCore.Qt.ItemDataRole.ForegroundRole:
+            if self.is_transferred(node):
+                return QtGui.QBrush(QtGui.QColor("#2e7d32"))
+        elif role == QtCore.Qt.ItemDataRole.ToolTipRole:
+            return str(node.path)
+        return None
+
+    def get_dataset_text(self, node):
+        if node.is_dir:
+            num = self.dataset_counts.get(node.path, 0)
+            if not num:
+                return ""
+            num_done = self.transferred_counts.get(node.path, 0)
+            if self.target_path is not None:
+                return f"{num} ({num_done} transferred)"
+            return str(num)
+        elif node.path in self.transferred:
+            return "transferred"
+        return ""
+
+    def is_transferred(self, node):
+        """Whether a dataset or all datasets in a directory exist in
+        the target directory"""
+        if node.is_dir:
+            num = self.dataset_counts.get(node.path, 0)
+            return bool(num) and \
+                self.transferred_counts.get(node.path, 0) == num
+        return node.path in self.transferred
+
+    def sort(self, column, order=QtCore.Qt.SortOrder.AscendingOrder):
+        self._sort_column = column
+        self._sort_order = order
+        if self.root is None:
+            return
+        self.layoutAboutToBeChanged.emit()
+        old = self.persistentIndexList()
+        refs = [(idx.internalPointer(), idx.column()) for idx in old]
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.children:
+                self._sort_nodes(node.children)
+                stack += node.children
+        self.changePersistentIndexList(
+            old, [self.createIndex(node.row, col, node)
+                  for node, col in refs])
+        self.layoutChanged.emit()
+
+    def _sort_nodes(self, nodes):
+        """Sort nodes in-place (directories first)"""
+        if self._sort_column == 1:
+            def key(node):
+                if node.is_dir:
+                    return self.subtree_sizes.get(node.path, -1)
+                return node.size
+        elif self._sort_column == 2:
+            def key(node):
+                return self.dataset_counts.get(node.path, 0)
+        else:
+            def key(node):
+                return node.name.casefold()
+        reverse = self._sort_order == QtCore.Qt.SortOrder.DescendingOrder
+        nodes.sort(key=key, reverse=reverse)
+        nodes.sort(key=lambda node: not node.is_dir)
+        for row, node in enumerate(nodes):
+            node.row = row
+
+
+def iter_ancestors(path, root):
+    """Yield `path` and all its parents up to (including) `root`"""
+    while True:
+        yield path
+        if path == root or path.parent == path:
+            break
+        path = path.parent
+
+
+def human_size(bt, units=None):
+    """Return a human-eadable string representation of bytes """
+    if units is None:
+        units = [' bytes', 'KB', 'MB', 'GB', 'TB', 'PB', 'EB']
+    return str(bt) + units[0] if bt < 1024 else human_size(bt >> 10, units[1:])
@@ -1,109 +1,111 @@
+import functools
 from importlib import resources
 import logging
 import pathlib
-import time
 import threading
 from typing import Literal
 
-from PyQt6 import QtWidgets, QtCore, QtGui, uic
+from PyQt6 import QtWidgets, QtCore, uic
 
 from ..recipe import IGNORED_FILE_NAMES, map_recipe_name_to_class
+from ..scan import TreeScanService, get_scan_service
+
+from .tree_model import DirectoryTreeModel, human_size
 from ..util import is_dir_writable
 
 
 logger = logging.getLogger(__name__)
 
 
-class TreeObjectCounter(threading.Thread):
-    """Thread running in the background, counting objects and their size"""
-    def __init__(self, *args, **kwargs):
-        super(TreeObjectCounter, self).__init__(*args, **kwargs)
-        self.daemon = True
-        self.recipe = None
-        self.path = None
+class TreeObjectCounter:
+    def __init__(self, service: TreeScanService = None):
+        """Count objects and their size using the shared scan service
+
+        Counting is triggered by setting :const:`path` or
+        :const:`recipe` and by :func:`reset`. Directory listings are
+        cached by the service, so recounting only lists directories
+        that changed.
+        """
+        #: scan service that counts in the background
+        self.service = service if service is not None else \
+            get_scan_service()
+        self._recipe = None
+        self._path = None
         self.num_objects = 0
         self.size_objects = 0
-        self.must_break = False
-        self.abort_current_count = False
         self.is_counting = False
         self.has_counted = False
+        #: whether :func:`stop` was called (no more requests are made)
+        self.is_stopped = False
+        self._token = None
         self.lock = threading.Lock()
 
+    @property
+    def path(self):
+        return self._path
+
+    @path.setter
+    def path(self, path):
+        if path != self._path:
+            self._path = path
+            self.reset()
+
+    @property
+    def recipe(self):
+        return self._recipe
+
+    @recipe.setter
+    def recipe(self, recipe):
+        if recipe != self._recipe:
+            self._recipe = recipe
+            self.reset()
+
     def reset(self):
+        """Count the objects again"""
         with self.lock:
-            self.abort_current_count = True
             self.num_objects = 0
             self.size_objects = 0
             self.has_counted = False
+            self._token = token = object()
+            if (self.is_stopped
+                    or self._recipe is None or self._path is None):
+                self.is_counting = False
+                self.service.cancel(self)
+                return
+            self.is_counting = True
+            ignored_names = (IGNORED_FILE_NAMES
+                             + self._recipe.ignored_file_names)
+        self.service.request(
+            self,
+            path=self._path,
+            ignored_names=ignored_names,
+            callback=functools.partial(self.on_count, token))
+
+    def stop(self):
+        """Stop counting (no more requests are made afterwards)"""
+        with self.lock:
+            self._token = None
             self.is_counting = False
+            self.is_stopped = True
+        self.service.cancel(self)
 
-    def run(self):
-        recipe = self.recipe
-        path = self.path
-        while True:
-            if self.must_break:
-                # user requested we quit
-                break
-            elif recipe is None or path is None:
-                # not initialized yet
-                recipe = self.recipe
-                path = self.path
-            elif (self.recipe is None
-                  or self.path is None
-                  or self.recipe != recipe
-                    or self.path != path):
-                # reset
-                self.num_objects = 0
-                self.size_objects = 0
-                self.has_counted = False
-                recipe = self.recipe
-                path = self.path
-            elif self.num_objects or self.has_counted:
-                # already counted
-                pass
-            else:
-                # start crawling the directory tree
-                self.is_counting = True
-                self.has_counted = False
-                ignored_files = IGNORED_FILE_NAMES + recipe.ignored_file_names
-                tree_iterator = path.rglob("*")
-                while True:
-                    # check whether we have to abort
-                    if (self.must_break
-                            or recipe != self.recipe or path != self.path):
-                        self.num_objects = 0
-                        self.size_objects = 0
-                        break
-                    try:
-                        pp = next(tree_iterator)
-                    except StopIteration:
-                        self.has_counted = True
-                        break
-                    except BaseException:
-                        # Windows might encounter PermissionError.
-                        pass
-                    else:
-                        try:
-                            if pp.is_dir() or pp.name in ignored_files:
-                                continue
-                        except BaseException:
-                            logger.warning(f"Could not stat {pp}")
-                            continue
-                        with self.lock:
-                            # check before incrementing
-                            if self.abort_current_count:
-                                self.abort_current_count = False
-                                break
-                            self.num_objects += 1
-                            try:
-                                self.size_objects += pp.stat().st_size
-                            except BaseException:
-                                pass
+    def on_count(self, token, num_objects, size_objects, done):
+        """Called by the scan service"""
+        with self.lock:
+            if token is not self._token:
+                # result of a previous request
+                return
+            self.num_objects = num_objects
+            self.size_objects = size_objects
+            if done:
                 self.is_counting = False
-            time.sleep(0.5)
+                self.has_counted = True
 
 
 class TreeWidget(QtWidgets.QWidget):
+    #: emitted when the directory changed
+    path_changed = QtCore.pyqtSignal(object)
+
     def __init__(self,
                  which: Literal["input", "output"] = "input",
                  *args,
@@ -125,13 +127,14 @@ class TreeWidget(QtWidgets.QWidget):
         #: tree data structure
         self.p_tree = None
 
-        # tree spider counter daemon
+        # tree object counter (using the shared scan service)
         self.tree_counter = TreeObjectCounter()
-        self.tree_counter.start()
 
-        # tree view model
-        self.model = QtGui.QFileSystemModel()
-        self.model.setReadOnly(True)
+        # lazy tree view model (lists directories in the background)
+        self.model = DirectoryTreeModel(self)
+        if self.which == "input":
+            # datasets are only identified in the input directory
+            self.model.recipe = self._recipe
         self.treeView.setModel(self.model)
 
         # UI update function
@@ -165,10 +168,11 @@ class TreeWidget(QtWidgets.QWidget):
             msg.exec()
         else:
             self._path = path
-            self.tree_counter.path = path
-            self.model.setRootPath(str(path))
-            self.treeView.setRootIndex(self.model.index(str(path)))
+            if self.isVisible():
+                self.scan_path()
+            # (otherwise the directory is scanned when the widget is shown)
             self.lineEdit_dir.setText(str(path))
+            self.path_changed.emit(path)
 
     @property
     def recipe(self):
@@ -179,6 +183,23 @@ class TreeWidget(QtWidgets.QWidget):
     def recipe(self, recipe):
         self._recipe = recipe
         self.tree_counter.recipe = recipe
+        if self.which == "input":
+            self.model.set_recipe(recipe)
+
+    def showEvent(self, event):
+        super(TreeWidget, self).showEvent(event)
+        # scan the directory after the window appeared
+        QtCore.QTimer.singleShot(0, self.scan_path)
+
+    @QtCore.pyqtSlot()
+    def scan_path(self):
+        """Count and list the current directory in the background"""
+        if self._path is None or self.model.is_shut_down:
+            # (e.g. queued by `showEvent` before the window was closed)
+            return
+        self.tree_counter.path = self._path
+        if self.model.root is None or self.model.root.path != self._path:
+            self.model.set_root_path(self._path)
 
     @QtCore.pyqtSlot(object)
     def dragEnterEvent(self, e) -> None:
@@ -231,10 +252,4 @@ class TreeWidget(QtWidgets.QWidget):
     @QtCore.pyqtSlot()
     def trigger_recount_objects(self):
         self.tree_counter.reset()
-
-
-def human_size(bt, units=None):
-    """Return a human-eadable string representation of bytes """
-    if units is None:
-        units = [' bytes', 'KB', 'MB', 'GB', 'TB', 'PB', 'EB']
-    return str(bt) + units[0] if bt < 1024 else human_size(bt >> 10, units[1:])
+        self.model.refresh()
@@ -1,6 +1,11 @@
+import functools
+import pathlib
+import re
+
 import h5py
+import numpy as np
 
-import re
+from .compression import get_compression_kwargs
 
 
 def is_valid_h5_file(path):
@@ -30,28 +35,257 @@ def h5_file_contains(path, location="/", attribute=None, verifier=None,
         regular expression pattern to check against (redundant to verifier)
         using `re.fullmatch(regexp, str(h5[location].attrs[attribite]))`
     """
-    contains = False
+    _check_probe_arguments(attribute, verifier, regexp)
     with h5py.File(path) as h5:
+        contains = _h5_contains(h5, location, attribute, verifier, regexp)
+    return contains
+
+
+def probe_h5(path, checks):
+    """Evaluate several `h5_file_contains` conditions at once
+
+    The file is opened only once and the results are cached using
+    the size and the modification time of `path` (i.e. repeatedly
+    probing an unchanged file does not open it again). Note that
+    the cache only works for `verifier` functions that are defined
+    once (e.g. not for lambdas created for every call).
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        path to the HDF5 file
+    checks: list of dict
+        each dictionary contains the keyword arguments `location`,
+        `attribute`, `verifier`, and `regexp` (all optional) for
+        :func:`h5_file_contains`
+
+    Returns
+    -------
+    results: list of bool
+        result for each item in `checks`; all items are `False` if
+        `path` is not a valid HDF5 file
+    """
+    checks_tuple = []
+    for check in checks:
+        unknown = set(check) - {"location", "attribute", "verifier",
+                                "regexp"}
+        if unknown:
+            raise ValueError(f"Invalid keys in check {check}: {unknown}")
+        args = (check.get("location", "/"),
+                check.get("attribute", None),
+                check.get("verifier", None),
+                check.get("regexp", None))
+        _check_probe_arguments(*args[1:])
+        checks_tuple.append(args)
+    path = pathlib.Path(path).resolve()
+    try:
+        path_stat = path.stat()
+    except OSError:
+        return [False] * len(checks_tuple)
+    return list(_probe_h5_cached(
+        path=path,
+        path_stats=(path_stat.st_mtime_ns, path_stat.st_size),
+        checks=tuple(checks_tuple)))
+
+
+@functools.lru_cache(maxsize=1000)
+def _probe_h5_cached(path, path_stats, checks):
+    """Cached `probe_h5` using stat tuple as cache
+
+    This is a private function. Please use `probe_h5` instead!
+    """
+    assert path_stats, "We need stat for validating the cache"
+    try:
+        with h5py.File(path, "r") as h5:
+            return tuple(_h5_contains(h5, *args) for args in checks)
+    except OSError:
+        # not a valid HDF5 file
+        return (False,) * len(checks)
+
+
+def _check_probe_arguments(attribute, verifier, regexp):
+    if attribute is None:
+        if verifier is not None:
+            raise ValueError("`verifier` specified without `attribute`!")
+        if regexp is not None:
+            raise ValueError("`regexp` specified without `attribute`!")
+
+
+def _h5_contains(h5, location, attribute, verifier, regexp):
+    """Implementation of `h5_file_contains` for an open file"""
+    contains = False
+    if location in h5:
+        loc = h5[location]
+        if attribute is None:
+            # we are only checking for a location
+            contains = True
+        elif attribute in loc.attrs:
+            attr = loc.attrs[attribute]
+            if verifier is not None:
+                verified = verifier(attr)
+            else:
+                verified = True
+            if regexp is not None:
+                matched = re.fullmatch(regexp, str(attr)) is not None
+            else:
+                matched = True
+            contains = verified and matched
+    return contains
+
+
+def h5_get_attribute(path, location="/", attribute=None, default=None):
+    """Return an attribute of an HDF5 file or `default`
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        path to the HDF5 file
+    location: str
+        location in the HDF5 structure (can be a dataset or a group)
+    attribute: str
+        name of the attribute
+    default:
+        value returned if the file is not a valid HDF5 file or
+        the attribute does not exist
+    """
+    try:
+        with h5py.File(path, "r") as h5:
+            if location in h5:
+                value = h5[location].attrs.get(attribute, default)
+            else:
+                value = default
+    except BaseException:
+        value = default
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    return value
+
+
+def h5_set_attribute(path, location="/", attribute=None, value=None):
+    """Set an attribute in an HDF5 file (creating `location` if necessary)
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        path to the HDF5 file
+    location: str
+        location in the HDF5 structure (can be a dataset or a group)
+    attribute: str
+        name of the attribute
+    value:
+        value of the attribute
+    """
+    with h5py.File(path, "a") as h5:
         if location in h5:
             loc = h5[location]
-            if attribute is None:
-                # we are only checking for a location
-                contains = True
-                if verifier is not None:
-                    raise ValueError(
-                        "`verifier` specified without `attribute`!")
-                if regexp is not None:
-                    raise ValueError(
-                        "`regexp` specified without `attribute`!")
-            if attribute is not None and attribute in loc.attrs:
-                attr = loc.attrs[attribute]
-                if verifier is not None:
-                    verified = verifier(attr)
-                else:
-                    verified = True
-                if regexp is not None:
-                    matched = re.fullmatch(regexp, str(attr)) is not None
-                else:
-                    matched = True
-                contains = verified and matched
-    return contains
+        else:
+            loc = h5.require_group(location)
+        loc.attrs[attribute] = value
+
+
+def write_text_dataset(group, name, lines, mode="replace",
+                       compression_kwargs=None):
+    """Write text to an HDF5 dataset
+
+    Text data are written as a fixed-length string dataset. All lines
+    are converted to one NumPy array and written at once. If lines
+    appended to a dataset are longer than its fixed length, then the
+    dataset is copied to a wider fixed-length string dataset (at least
+    twice as wide, so that a few long lines do not cause many copies).
+
+    Parameters
+    ----------
+    group: h5py.Group
+        parent group
+    name: str
+        name of the dataset containing the text
+    lines: list of str or str
+        the text, line by line
+    mode: str
+        "replace" an existing dataset or "append" to it
+    compression_kwargs: dict
+        compression keyword arguments for `create_dataset`, defaults to
+        the default compression preset
+
+    Returns
+    -------
+    txt_dset: h5py.Dataset
+        the text dataset
+    """
+    if mode not in ["replace", "append"]:
+        raise ValueError(f"Invalid mode '{mode}'!")
+    if compression_kwargs is None:
+        compression_kwargs = get_compression_kwargs()
+
+    # handle strings
+    if isinstance(lines, (str, bytes)):
+        lines = [lines]
+    lines_as_bytes = [ll if isinstance(ll, bytes) else ll.encode("UTF-8")
+                      for ll in lines]
+
+    # Determine the maximum line length and use fixed-length strings,
+    # because compression and fletcher32 filters won't work with
+    # variable length strings.
+    # https://github.com/h5py/h5py/issues/1948
+    # 100 is the recommended maximum and the default, because if
+    # `mode` is e.g. "append", then this line may not be the longest.
+    max_length = max([100] + [len(lb) for lb in lines_as_bytes])
+    dtype = f"S{max_length}"
+    dset_kwargs = dict(fletcher32=True, **compression_kwargs)
+
+    # replace text
+    if name in group and mode == "replace":
+        del group[name]
+
+    if (name in group
+            and group[name].dtype.kind == "S"
+            and group[name].dtype.itemsize < max_length):
+        # The line length of a dataset cannot be changed.
+        _widen_text_dataset(
+            group=group,
+            name=name,
+            length=max(max_length, 2 * group[name].dtype.itemsize),
+            dset_kwargs=dset_kwargs)
+
+    if name in group:
+        txt_dset = group[name]
+        line_offset = txt_dset.shape[0]
+        txt_dset.resize(line_offset + len(lines_as_bytes), axis=0)
+    else:
+        txt_dset = group.create_dataset(
+            name,
+            shape=(len(lines_as_bytes),),
+            dtype=dtype,
+            maxshape=(None,),
+            chunks=True,
+            **dset_kwargs)
+        line_offset = 0
+
+    # Write the text data in one go
+    if lines_as_bytes:
+        txt_dset[line_offset:] = np.array(lines_as_bytes,
+                                          dtype=txt_dset.dtype)
+    return txt_dset
+
+
+def _widen_text_dataset(group, name, length, dset_kwargs,
+                        max_bytes=32 * 1024**2):
+    """Copy a fixed-length string dataset to a wider one
+
+    This is a private function used by `write_text_dataset`.
+    """
+    src = group[name]
+    tmp_name = f"{name}_widen~"
+    dst = group.create_dataset(
+        tmp_name,
+        shape=src.shape,
+        dtype=f"S{length}",
+        maxshape=(None,),
+        chunks=True,
+        **dset_kwargs)
+    step = max(1, max_bytes // length)
+    for start in range(0, src.shape[0], step):
+        dst[start:start + step] = src[start:start + step]
+    dst.attrs.update(src.attrs)
+    del group[name]
+    group.move(tmp_name, name)
@@ -0,0 +1,147 @@
+"""Streaming access to MicroManager metadata files
+
+MicroManager writes the metadata of a measurement as one large JSON
+object (``*_metadata.txt``) that contains a "Summary" and one entry
+("FrameKey-...") per frame. These files can become huge, so they are
+parsed here incrementally, without reading the entire file into memory.
+"""
+import json
+import pathlib
+import re
+from typing import Callable, Iterator
+
+
+#: Number of characters read from a metadata file at once
+BLOCK_SIZE = 2**20
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"\s*")
+
+
+class _StreamBuffer:
+    def __init__(self, blocks: Iterator[str]):
+        """Text buffer that is filled from `blocks` when necessary"""
+        self.blocks = blocks
+        self.text = ""
+        self.pos = 0
+
+    def more(self) -> bool:
+        """Read the next block, discarding already parsed text"""
+        try:
+            block = next(self.blocks)
+        except StopIteration:
+            return False
+        self.text = self.text[self.pos:] + block
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character ("" at the end)"""
+        while True:
+            self.pos = _whitespace.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            elif not self.more():
+                return ""
+
+    def decode(self):
+        """Decode the JSON value at the current position"""
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                # incomplete value
+                if not self.more():
+                    raise
+            else:
+                # numbers at the end of the buffer might be incomplete
+                if end == len(self.text) and self.more():
+                    continue
+                self.pos = end
+                return value
+
+
+def iter_metadata(path: str | pathlib.Path,
+                  line_callback: Callable = None,
+                  block_size: int = BLOCK_SIZE):
+    """Yield the top-level items of a MicroManager metadata file
+
+    The file is read only once, in blocks of `block_size` characters.
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        path to the metadata file (a JSON object)
+    line_callback: Callable
+        optional function that is called with the list of text lines
+        of every block read (e.g. for storing the original file)
+    block_size: int
+        number of characters read at once
+
+    Yields
+    ------
+    key: str
+        key of the item (e.g. "Summary" or "FrameKey-0-0-0")
+    value:
+        the decoded JSON value
+    """
+    buf = _StreamBuffer(iter_blocks(path, line_callback, block_size))
+    if buf.peek() != "{":
+        raise ValueError(f"Metadata file is not a JSON object: {path}")
+    buf.pos += 1
+    while True:
+        char = buf.peek()
+        if char == "}":
+            # read the rest of the file (for `line_callback`)
+            while buf.more():
+                pass
+            break
+        elif char == ",":
+            buf.pos += 1
+            continue
+        elif char == "":
+            raise ValueError(f"Unexpected end of metadata file: {path}")
+        key = buf.decode()
+        if buf.peek() != ":":
+            raise ValueError(f"Invalid metadata file: {path}")
+        buf.pos += 1
+        buf.peek()
+        yield key, buf.decode()
+
+
+def iter_blocks(path: str | pathlib.Path,
+                line_callback: Callable = None,
+                block_size: int = BLOCK_SIZE):
+    """Yield a text file block by block
+
+    If `line_callback` is given, it is called with the complete text
+    lines of each block. The lines passed to `line_callback` are
+    identical to `path.read_text(errors="ignore").split("\\n")`.
+    """
+    partial = ""
+    with pathlib.Path(path).open(encoding="utf-8", errors="ignore") as fd:
+        while block := fd.read(block_size):
+            if line_callback is not None:
+                lines = (partial + block).split("\n")
+                partial = lines.pop(-1)
+                if lines:
+                    line_callback(lines)
+            yield block
+    if line_callback is not None:
+        line_callback([partial])
+
+
+def stream_lines(path: str | pathlib.Path,
+                 line_callback: Callable,
+                 block_size: int = BLOCK_SIZE):
+    """Pass all lines of a text file to `line_callback` block by block"""
+    for _ in iter_blocks(path, line_callback, block_size):
+        pass
+
+
+def prefix_contains(path: str | pathlib.Path,
+                    text: str,
+                    max_size: int = BLOCK_SIZE) -> bool:
+    """Check whether `text` occurs in the first `max_size` characters"""
+    with pathlib.Path(path).open(encoding="utf-8", errors="ignore") as fd:
+        return fd.read(max_size).count(text) > 0
@@ -1,6 +1,24 @@
-# flake8: noqa: F401
-# import recipes here so they get are defined and available
-from .rcp_catchall import CatchAllRecipe
-from .rcp_oah import OAHRecipe
-from .rcp_qlsi import QLSIRecipe
-from .rcp_rtdc import RTDCRecipe
+"""Recipes shipped with MPL-Data-Cast
+
+The recipe modules are imported on first access, because some of
+them import large libraries (see
+:const:`mpl_data_cast.recipe.BUILTIN_RECIPES`).
+"""
+import importlib
+
+from ..recipe import BUILTIN_RECIPES
+
+
+#: maps class names to module names of the built-in recipes
+_recipe_modules = {path.split(":")[1]: path.split(":")[0]
+                   for path, _ in BUILTIN_RECIPES.values()}
+
+
+def __getattr__(name):
+    if name in _recipe_modules:
+        return getattr(importlib.import_module(_recipe_modules[name]), name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_recipe_modules))
@@ -3,10 +3,13 @@ import warnings
 
 from ..util import hashfile
 from ..recipe import Recipe
+from ..scan import SCAN_CACHE
 
 
 class CatchAllRecipe(Recipe):
     """Just copy all files, except known junk files"""
+    #: datasets are symlinked to the temporary directory
+    conversion_cost = 0.0
 
     def convert_dataset(self, path_list, temp_path, **kwargs):
         """Create a symlink and if that fails, copy the file"""
@@ -28,6 +31,6 @@ class CatchAllRecipe(Recipe):
             "._.DS_Store",
             "Thumbs.db",
         ]
-        for pp in self.path_raw.rglob("*"):
-            if not pp.is_dir() and pp.name not in ignore_list:
-                yield [pp]
+        for pp in SCAN_CACHE.iter_files(self.path_raw,
+                                        ignored_names=ignore_list):
+            yield [pp]
@@ -2,74 +2,88 @@ import pathlib
 import h5py
 import numpy as np
 
-from ..helper import is_valid_h5_file, h5_file_contains
+from ..compression import DEFAULT_COMPRESSION
+from ..helper import probe_h5
+from ..qpformat import QPFormatWriter
 from ..recipe import Recipe
+from ..scan import SCAN_CACHE
 
 
 class OAHRecipe(Recipe):
     """Matlab file format (TopogMap.mat) for DHM data"""
+    fingerprint_location = "/"
+    fingerprint_packages = ["h5py", "numpy"]
+    in_memory_capable = True
+    #: decompressing the Matlab file and compressing every slice
+    conversion_cost = 2.0
 
     def convert_dataset(self, path_list: list, temp_path: pathlib.Path,
                         wavelength: float = None,
                         pixel_size: float = None,
                         medium_index: float = None,
+                        compression: str = DEFAULT_COMPRESSION,
                         ):
-        """Convert DHM .mat data to qpformat HDF5 format"""
-        with h5py.File(path_list[0]) as mat, h5py.File(temp_path, "w") as h5:
-            topog = mat["topogMap"][:]
-            # make sure we have a 3D stack
-            if len(topog.shape) == 2:
-                topog.reshape(1, topog.shape[0], -1)
-            for ii in range(topog.shape[0]):
-                ds = h5.create_dataset(
-                    name=str(ii),
-                    chunks=topog[ii].shape,
-                    data=topog[ii],
-                    fletcher32=True,
-                )
-                # QPI metadata
-                ds.attrs["numerical aperture"] = mat["NA"][:].item()
+        """Convert DHM .mat data to qpformat HDF5 format
 
-                ds.attrs["wavelength"] = \
-                    wavelength or mat["lambda"][:].item() * 1e-6
+        The topography map is read one slice (hyperslab) at a time.
+        """
+        with h5py.File(path_list[0]) as mat, \
+                h5py.File(temp_path, "w") as h5, \
+                QPFormatWriter(h5, compression=compression) as qpw:
+            # QPI metadata (identical for all slices)
+            position = np.ravel(mat["positionVal"][()])
+            common = {
+                "numerical aperture": read_mat_scalar(mat, "NA"),
+                "wavelength":
+                    wavelength or read_mat_scalar(mat, "lambda") * 1e-6,
+                "pos x": position[0].item() * 1e-6,
+                "pos y": position[1].item() * 1e-6,
+                "focus": position[2].item() * 1e-6,
+                "pixel size":
+                    pixel_size or read_mat_scalar(mat, "res") * 1e-6,
+            }
 
-                ds.attrs["pos x"] = mat["positionVal"][0].item() * 1e-6
-                ds.attrs["pos y"] = mat["positionVal"][1].item() * 1e-6
-                ds.attrs["focus"] = mat["positionVal"][2].item() * 1e-6
+            if "mediumIndex" in mat:  # TODO: get correct key
+                common["medium index"] = read_mat_scalar(mat, "mediumIndex")
+            elif medium_index:
+                common["medium index"] = medium_index
 
-                ds.attrs["pixel size"] = \
-                    pixel_size or mat["res"][:].item() * 1e-6
+            if "frameRate" in mat:
+                dt = 1 / read_mat_scalar(mat, "frameRate")
+            else:
+                dt = None
 
-                if "mediumIndex" in mat:  # TODO: get correct key
-                    ds.attrs["medium index"] = mat["mediumIndex"].item()
-                elif medium_index:
-                    ds.attrs["medium index"] = medium_index
-
-                if "frameRate" in mat:
-                    dt = 1 / mat["frameRate"][:].item()
-                    ds.attrs["time"] = ii * dt
-                # Create and Set image attributes:
-                # HDFView recognizes this as a series of images.
-                # Use np.string_ as per
-                # http://docs.h5py.org/en/stable/strings.html#compatibility
-                ds.attrs.create('CLASS', np.string_('IMAGE'))
-                ds.attrs.create('IMAGE_VERSION', np.string_('1.2'))
-                ds.attrs.create('IMAGE_SUBCLASS',
-                                np.string_('IMAGE_GRAYSCALE'))
+            topog = mat["topogMap"]
+            # a 2D map is a stack with only one slice
+            num_slices = 1 if topog.ndim == 2 else topog.shape[0]
+            qpw.common_attrs.update(common)
+            for ii in range(num_slices):
+                self.checkpoint()
+                attrs = {}
+                if dt is not None:
+                    attrs["time"] = ii * dt
+                image = topog[()] if topog.ndim == 2 else topog[ii]
+                qpw.write_frame(name=str(ii), image=image, attrs=attrs)
 
             # write qpformat metadata identifier
             h5.attrs["file_format"] = "qpformat"
             h5.attrs["imaging_modality"] = "off-axis holography"
+            h5.attrs["mpldc_compression"] = compression
 
     def get_raw_data_iterator(self):
-        for pp in sorted(self.path_raw.rglob("*.mat")):
-            if (is_valid_h5_file(pp)
-                and h5_file_contains(pp, "topogMap")
-                and h5_file_contains(pp, "res")
-                    and h5_file_contains(pp, "lambda")):
+        for pp in sorted(SCAN_CACHE.iter_files(self.path_raw,
+                                               pattern="*.mat")):
+            if all(probe_h5(pp, [{"location": "topogMap"},
+                                 {"location": "res"},
+                                 {"location": "lambda"}])):
                 yield [pp]
 
     def get_target_path(self, path_list):
         """Get the target path .h5 for a path_list"""
         target_mat = super(OAHRecipe, self).get_target_path(path_list)
         return target_mat.with_suffix(".h5")
+
+
+def read_mat_scalar(mat, name):
+    """Return the scalar value of a Matlab (HDF5) dataset"""
+    return np.asarray(mat[name][()]).item()
@@ -1,11 +1,16 @@
-import json
+import collections
 import warnings
 import pathlib
 import h5py
 import numpy as np
 import tifffile
 
+from ..compression import DEFAULT_COMPRESSION, get_compression_kwargs
+from ..helper import write_text_dataset
+from ..micromanager import iter_metadata, prefix_contains, stream_lines
+from ..qpformat import QPFormatWriter
 from ..recipe import Recipe
+from ..scan import SCAN_CACHE
 
 
 meta_data_mapping = {
@@ -27,14 +32,30 @@ meta_data_mapping = {
 
 class QLSIRecipe(Recipe):
     """ome.tif file format from MicroManager with Phasics SID4Bio camera"""
-    def _write_h5_dataset_metadata(self, path, ds, json_meta_data=None,
-                                   warn=True):
+    fingerprint_location = "/"
+    fingerprint_packages = ["h5py", "numpy", "tifffile"]
+    in_memory_capable = True
+    #: parsing the metadata and compressing every frame
+    conversion_cost = 2.0
+    #: Maximum number of encoded reference frames kept in memory
+    reference_cache_size = 4
+
+    def __init__(self, *args, **kwargs):
+        super(QLSIRecipe, self).__init__(*args, **kwargs)
+        #: Encoded reference frames (several measurements usually share
+        #: one reference), see :func:`QLSIRecipe.write_reference`
+        self.reference_cache = collections.OrderedDict()
+
+    def _get_h5_dataset_metadata(self, path, dsattrs, json_meta_data=None,
+                                 warn=True):
+        """Complement the dataset attributes `dsattrs` with JSON metadata"""
+        attrs = dict(dsattrs)
         if json_meta_data is None:
             json_meta_data = {}
         for key in meta_data_mapping:
             parname, spim_name, converter = meta_data_mapping[key]
             # check if the attributes are set
-            kw_ds = ds.attrs.get(key, None)
+            kw_ds = attrs.get(key, None)
             if kw_ds is None:
                 # fill in missing metadata from json dictionary
                 mval = json_meta_data.get(spim_name, None)
@@ -42,51 +63,23 @@ class QLSIRecipe(Recipe):
                     if warn:
                         warnings.warn(f"No {key} defined for {path}!")
                 else:
-                    ds.attrs[key] = converter(mval)
-
-        # Create and Set image attributes:
-        # HDFView recognizes this as a series of images.
-        # Use np.string_ as per
-        # http://docs.h5py.org/en/stable/strings.html#compatibility
-        ds.attrs.create('CLASS', np.string_('IMAGE'))
-        ds.attrs.create('IMAGE_VERSION', np.string_('1.2'))
-        ds.attrs.create('IMAGE_SUBCLASS', np.string_('IMAGE_GRAYSCALE'))
+                    attrs[key] = converter(mval)
+        return attrs
 
     def convert_dataset(self, path_list: list, temp_path: pathlib.Path,
                         wavelength: float = None,
                         pixel_size: float = None,
                         medium_index: float = None,
-                        qlsi_pitch_term: float = 1.87711e-08
+                        qlsi_pitch_term: float = 1.87711e-08,
+                        compression: str = DEFAULT_COMPRESSION,
                         ):
-        """Convert QLSI TIF data to qpformat HDF5 format"""
-        # get the metadata
-        meta_text = path_list[1].read_text(errors="ignore")
-        meta_data_full = json.loads(meta_text)
-
-        # extract the information from every frame
-        meta_data_list = []
-        for key in meta_data_full:
-            if key.startswith("FrameKey"):
-                meta_data_list.append(meta_data_full[key])
-        meta_data_list = sorted(meta_data_list,
-                                key=lambda x: x["ElapsedTime-ms"])
-
-        # get the data from the tif file
-        data = []
-        with tifffile.TiffFile(path_list[0]) as tif:
-            for ii in range(len(tif.pages)):
-                data.append(tif.asarray(ii))
-
-        # get the reference data
-        ref_data = tifffile.imread(str(path_list[2]))
-
-        # Sanity checks
-        slices = meta_data_full["Summary"].get("Slices", 1)
-        frames = meta_data_full["Summary"].get("Frames", 1)
-        # (positions are individual files)
-        # (channels are not handled here)
-        if frames * slices != len(data):
-            raise ValueError("Size mismatch in data and meta data!")
+        """Convert QLSI TIF data to qpformat HDF5 format
+
+        The MicroManager metadata files are parsed and stored in the
+        output file while they are read (see
+        :func:`mpl_data_cast.micromanager.iter_metadata`).
+        """
+        cmp_kw = get_compression_kwargs(compression)
 
         # prepare HDF5 metadata
         dsattrs = {}
@@ -101,61 +94,107 @@ class QLSIRecipe(Recipe):
         if qlsi_pitch_term:
             dsattrs["qlsi_pitch_term"] = qlsi_pitch_term
 
-        dsattrs["device"] = meta_data_full["Summary"]["ComputerName"]
-        dsattrs["software"] = "MicroManager " \
-            + meta_data_full["Summary"]["MicroManagerVersion"]
+        # only keep the frame metadata that we actually use
+        frame_keys = {mp[1] for mp in meta_data_mapping.values()}
+
+        with tifffile.TiffFile(path_list[0]) as tif, \
+                h5py.File(temp_path, "w") as h5, \
+                QPFormatWriter(h5, compression=compression) as qpw:
+            logs = h5.require_group("logs")
 
-        # Create the HDF5 file
-        with h5py.File(temp_path, "w") as h5:
-            # Store the entire meta data file
-            write_text_dataset(h5.require_group("logs"),
-                               "meta_data",
-                               meta_text.split("\n"))
+            def store_lines(name):
+                return lambda lines: write_text_dataset(
+                    logs, name, lines, mode="append",
+                    compression_kwargs=cmp_kw)
+
+            # Store the entire meta data file while parsing it
+            summary = None
+            meta_data_list = []
+            for key, value in iter_metadata(
+                    path_list[1], line_callback=store_lines("meta_data")):
+                if key == "Summary":
+                    summary = value
+                elif key.startswith("FrameKey"):
+                    # extract the information from every frame
+                    meta_data_list.append(
+                        {k: v for k, v in value.items() if k in frame_keys})
+            if summary is None:
+                raise KeyError(f"No 'Summary' in {path_list[1]}!")
+            meta_data_list = sorted(meta_data_list,
+                                    key=lambda x: x["ElapsedTime-ms"])
+
+            # Sanity checks
+            slices = summary.get("Slices", 1)
+            frames = summary.get("Frames", 1)
+            # (positions are individual files)
+            # (channels are not handled here)
+            if frames * slices != len(tif.pages):
+                raise ValueError("Size mismatch in data and meta data!")
+
+            dsattrs["device"] = summary["ComputerName"]
+            dsattrs["software"] = "MicroManager " \
+                + summary["MicroManagerVersion"]
+            # written once to the metadata table and to every frame
+            qpw.common_attrs.update(dsattrs)
 
             # Store the reference meta data file
-            write_text_dataset(
-                h5.require_group("logs"),
-                "meta_data_ref",
-                path_list[3].read_text(errors="ignore").split("\n"))
+            stream_lines(path_list[3], store_lines("meta_data_ref"))
 
             # write qpformat metadata identifier
             h5.attrs["file_format"] = "qpformat"
             h5.attrs["imaging_modality"] = \
                 "quadriwave lateral shearing interferometry"
+            h5.attrs["mpldc_compression"] = compression
 
             # Write reference data
-            ds = h5.create_dataset(
-                name="reference",
-                chunks=ref_data.shape,
-                data=ref_data,
-                fletcher32=True,
-                compression=True,
-                compression_opts=9,
-            )
-            ds.attrs.update(dsattrs)
-            self._write_h5_dataset_metadata(
+            self.write_reference(
+                qpw=qpw,
                 path=path_list[2],
-                ds=ds,
-                warn=False,
-            )
-
-            # Write series data
-            for ii, img in enumerate(data):
-                json_meta_data = meta_data_list[ii]
-                ds = h5.create_dataset(
+                attrs=self._get_h5_dataset_metadata(
+                    path=path_list[2],
+                    dsattrs=dsattrs,
+                    warn=False,
+                ))
+
+            # Write series data (one frame at a time)
+            for ii, img in enumerate(iter_tif_frames(tif)):
+                self.checkpoint()
+                qpw.write_frame(
                     name=str(ii),
-                    chunks=img.shape,
-                    data=img,
-                    fletcher32=True,
-                    compression=True,
-                    compression_opts=9,
-                )
-                ds.attrs.update(dsattrs)
-                self._write_h5_dataset_metadata(
-                    path=path_list[0],
-                    ds=ds,
-                    json_meta_data=json_meta_data
-                )
+                    image=img,
+                    attrs=self._get_h5_dataset_metadata(
+                        path=path_list[0],
+                        dsattrs=dsattrs,
+                        json_meta_data=meta_data_list[ii],
+                    ))
+
+    def write_reference(self, qpw: QPFormatWriter, path: pathlib.Path,
+                        attrs: dict):
+        """Write the reference frame to the "reference" dataset
+
+        The encoded reference frame is cached (keyed by path, size,
+        modification time, and compression), so measurements that
+        share a reference only decode and compress it once. Cached
+        frames are written via direct chunk writes.
+        """
+        stat = path.stat()
+        key = (str(path), stat.st_size, stat.st_mtime_ns, qpw.compression)
+        if key in self.reference_cache:
+            self.reference_cache.move_to_end(key)
+            shape, dtype, chunk, filter_mask = self.reference_cache[key]
+            qpw.write_frame_chunk(name="reference",
+                                  shape=shape,
+                                  dtype=dtype,
+                                  chunk=chunk,
+                                  filter_mask=filter_mask,
+                                  attrs=attrs)
+        else:
+            qpw.write_frame(name="reference",
+                            image=tifffile.imread(str(path)),
+                            attrs=attrs)
+            self.reference_cache[key] = qpw.read_frame_chunk("reference")
+            while len(self.reference_cache) > self.reference_cache_size:
+                self.reference_cache.popitem(last=False)
 
     def get_raw_data_iterator(self):
         """ Get raw data files
@@ -174,22 +213,22 @@ class QLSIRecipe(Recipe):
           - QLSI_2022-04-26_ZStack_Example_ref_1_MMStack_Pos0.ome.tif
         """
         # This is from the preliminary data
-        for pp in sorted(self.path_raw.rglob("*.tif")):
+        # (index the tree once instead of globbing reference directories)
+        index = SCAN_CACHE.index(self.path_raw)
+        tif_paths = [pdir / name for pdir, names in index.items()
+                     for name in names if name.endswith(".tif")]
+        for pp in sorted(tif_paths):
             if pp.name.count("_ref_"):
                 # ignore reference measurements
                 continue
-            if self.is_valid_file(pp):
-                meta_path = pp.with_name(pp.name[:-8] + "_metadata.txt")
-                name_stem, num = pp.parent.name.rsplit("_", 1)
-                ref_dir = pp.parent.with_name(f"{name_stem}_ref_{num}")
-                ref_pp = list(ref_dir.glob("*.tif"))[0]
-                ref_meta = ref_pp.with_name(ref_pp.name[:-8] + "_metadata.txt")
+            path_list = self.get_dataset_paths(pp, index=index)
+            if path_list:
                 # handle junk data (included, so we don't copy it)
                 junk = []
-                for pi in [pp, ref_pp]:
+                for pi in [pp, path_list[2]]:
                     junk.append(pi.parent / "comments.txt")
                     junk.append(pi.parent / "DisplaySettings.json")
-                yield [pp, meta_path, ref_pp, ref_meta] + junk
+                yield path_list + junk
 
     def get_target_path(self, path_list):
         """Get the target path .h5 for a path_list"""
@@ -199,71 +238,74 @@ class QLSIRecipe(Recipe):
         # get rid of one directory hierarchy level
         return target_p.parent.parent / name
 
+    @staticmethod
+    def get_dataset_paths(path: pathlib.Path, index: dict = None):
+        """Return the files belonging to a QLSI measurement
+
+        Parameters
+        ----------
+        path: pathlib.Path
+            path to the measurement .ome.tif file
+        index: dict
+            directory index (see
+            :func:`mpl_data_cast.scan.TreeScanCache.index`) used
+            instead of listing the directories
+
+        Returns
+        -------
+        path_list: list or None
+            measurement .ome.tif file, its metadata file, reference
+            .tif file, and its metadata file; `None` if `path` is not
+            a valid QLSI measurement
+        """
+        if not path.name.endswith(".ome.tif") or "_" not in path.parent.name:
+            return None
+        # also check for reference measurement
+        name_stem, num = path.parent.name.rsplit("_", 1)
+        ref_dir = path.parent.with_name(f"{name_stem}_ref_{num}")
+        if index is None:
+            index = {}
+            for pdir in [path.parent, ref_dir]:
+                if pdir.is_dir():
+                    index[pdir] = sorted(pp.name for pp in pdir.iterdir())
+        meta_path = path.with_name(path.name[:-8] + "_metadata.txt")
+        ref_names = index.get(ref_dir, [])
+        ref_tifs = [name for name in ref_names if name.endswith(".tif")]
+        if (any(name.endswith(".ome.tif") for name in ref_tifs)
+                and any(name.endswith("_metadata.txt") for name in ref_names)
+                and meta_path.name in index.get(path.parent, [])
+                # the camera is named in the summary at the beginning
+                and prefix_contains(meta_path, "QLSICamera")):
+            ref_pp = ref_dir / ref_tifs[0]
+            ref_meta = ref_pp.with_name(ref_pp.name[:-8] + "_metadata.txt")
+            return [path, meta_path, ref_pp, ref_meta]
+        return None
+
     @staticmethod
     def is_valid_file(path):
-        valid = False
-        if path.name.endswith(".ome.tif"):
-            meta_path = path.with_name(path.name[:-8] + "_metadata.txt")
-            # also check for reference measurement
-            name_stem, num = path.parent.name.rsplit("_", 1)
-            ref_dir = path.parent.with_name(f"{name_stem}_ref_{num}")
-            if (ref_dir.exists()
-                and bool(list(ref_dir.glob("*.ome.tif")))
-                    and bool(list(ref_dir.glob("*_metadata.txt")))
-                    and meta_path.exists()
-                    and meta_path.read_text(
-                        errors="ignore").count("QLSICamera")):
-                valid = True
-        return valid
-
-
-def write_text_dataset(group, name, lines):
-    """Write text to an HDF5 dataset
-
-    Text data are written as a fixed-length string dataset.
+        return QLSIRecipe.get_dataset_paths(path) is not None
+
+
+def iter_tif_frames(tif):
+    """Yield the images of all pages of a TIFF file one at a time
+
+    Uncompressed pages are memory-mapped and compressed pages are
+    decoded one at a time, so at most one frame is held in memory,
+    regardless of the number of pages.
 
     Parameters
     ----------
-    group: h5py.Group
-        parent group
-    name: str
-        name of the dataset containing the text
-    lines: list of str or str
-        the text, line by line
+    tif: tifffile.TiffFile
+        opened TIFF file
     """
-    # replace text
-    if name in group:
-        del group[name]
-
-    lnum = len(lines)
-    # Determine the maximum line length and use fixed-length strings,
-    # because compression and fletcher32 filters won't work with
-    # variable length strings.
-    # https://github.com/h5py/h5py/issues/1948
-    # 100 is the recommended maximum and the default, because if
-    # `mode` is e.g. "append", then this line may not be the longest.
-    max_length = 100
-    lines_as_bytes = []
-    for line in lines:
-        # convert lines to bytes
-        if not isinstance(line, bytes):
-            lbytes = line.encode("UTF-8")
+    mm = None
+    for page in tif.pages:
+        contiguous = page.is_contiguous if page.is_memmappable else None
+        if contiguous:
+            if mm is None:
+                mm = np.memmap(tif.filehandle.path, dtype=np.uint8, mode="r")
+            offset, size = contiguous
+            dtype = np.dtype(page.dtype).newbyteorder(tif.byteorder)
+            yield mm[offset:offset + size].view(dtype).reshape(page.shape)
         else:
-            lbytes = line
-        max_length = max(max_length, len(lbytes))
-        lines_as_bytes.append(lbytes)
-
-    # Create the dataset
-    txt_dset = group.create_dataset(
-        name,
-        shape=(lnum,),
-        dtype=f"S{max_length}",
-        maxshape=(None,),
-        chunks=True,
-        fletcher32=True,
-        compression="gzip",
-        compression_opts=9)
-
-    # Write the text data line-by-line
-    for ii, lbytes in enumerate(lines_as_bytes):
-        txt_dset[ii] = lbytes
+            yield page.asarray()
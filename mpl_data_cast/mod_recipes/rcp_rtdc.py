@@ -1,40 +1,142 @@
+import pathlib
+import re
+import warnings
+
 import dclab
-import dclab.cli
-import hdf5plugin
+from dclab.cli.common import assemble_warnings, get_command_log
+from dclab.definitions import feature_exists, scalar_feature_exists
+from dclab.rtdc_dataset.copier import rtdc_copy
+from dclab.util import hashfile
+import h5py
+import numpy as np
 
+from ..compression import (
+    DEFAULT_COMPRESSION, get_compression_codec, get_compression_kwargs,
+    set_blosc_threads
+)
+from ..helper import write_text_dataset
 from ..recipe import Recipe
+from ..scan import SCAN_CACHE
 
 
 class RTDCRecipe(Recipe):
     __doc__ = f"""
     Compress raw DC data and include .ini files (dclab {dclab.__version__})
     """
+    # dclab does not allow custom root attributes
+    fingerprint_location = "logs"
+    fingerprint_packages = ["dclab", "h5py", "hdf5plugin"]
+    in_memory_capable = True
+
+    def convert_dataset(self, path_list, temp_path,
+                        compression: str = DEFAULT_COMPRESSION,
+                        include_features: str = "all",
+                        exclude_features: str = "",
+                        basin_original: bool = False,
+                        ):
+        """Compress the dataset and include SoftwareSettings.ini
+
+        The features are compressed and the log files are stored while
+        the output file is open, i.e. the output file is written in
+        a single pass.
 
-    def convert_dataset(self, path_list, temp_path, **kwargs):
-        """Compress the dataset using dclab and append SoftwareSettings.ini"""
-        # first compress the .rtdc file
-        dclab.cli.compress(path_out=temp_path, path_in=path_list[0])
-        # the rest of the files should be log files
-        cmp_kw = hdf5plugin.Zstd(clevel=5)
-        if len(path_list) > 1:
-            with dclab.RTDCWriter(temp_path, compression_kwargs=cmp_kw) as hw:
+        Parameters
+        ----------
+        path_list: list of pathlib.Path
+            .rtdc file and log files
+        temp_path: pathlib.Path
+            output path
+        compression: str
+            compression preset (see :mod:`mpl_data_cast.compression`)
+        include_features: str
+            features to copy, separated by semicolons or spaces
+            (e.g. "scalar;contour"); "all" and "scalar" select all or
+            all scalar features
+        exclude_features: str
+            features not to copy (e.g. "image;mask;trace"), same
+            format as `include_features`
+        basin_original: bool
+            if features are excluded, store a basin that refers to
+            the original file, so the excluded features can still be
+            accessed with dclab while the original file exists
+        """
+        cmp_kw = get_compression_kwargs(compression)
+        set_blosc_threads()
+        # command log (as written by `dclab-compress`)
+        dclab_logs = {"dclab-compress": get_command_log(paths=[path_list[0]])}
+        with warnings.catch_warnings(record=True) as w, \
+                dclab.new_dataset(path_list[0]) as ds, \
+                h5py.File(temp_path, "w") as h5_out:
+            warnings.simplefilter("always")
+            h5_in = ds.h5file
+            # dclab does not list defective features (they are recomputed)
+            available = [feat for feat in h5_in.get("events", {})
+                         if feat in ds.features_innate]
+            features = select_features(features=available,
+                                       include=include_features,
+                                       exclude=exclude_features)
+            excluded = [feat for feat in available if feat not in features]
+            if "basin_events" in h5_in:
+                # Let dclab handle internal basins (rare case).
+                rtdc_copy(src_h5file=h5_in, dst_h5file=h5_out,
+                          features=features)
+            else:
+                # metadata, logs, tables, and basin definitions
+                rtdc_copy(src_h5file=h5_in, dst_h5file=h5_out,
+                          features="none")
+                copy_features(h5_in=h5_in,
+                              h5_out=h5_out,
+                              compression_kwargs=cmp_kw,
+                              features=features,
+                              checkpoint=self.checkpoint)
+
+            # RTDCWriter updates the metadata when it is closed
+            with dclab.RTDCWriter(h5_out) as hw:
+                if basin_original and excluded:
+                    hw.store_basin(
+                        basin_name="Original data",
+                        basin_type="file",
+                        basin_format="hdf5",
+                        basin_locs=[pathlib.Path(path_list[0]).resolve()],
+                        basin_descr="Features not included in the "
+                                    "converted file (MPL-Data-Cast)",
+                        basin_feats=excluded,
+                    )
+                logs = h5_out.require_group("logs")
+                # remember the compression preset (next to the fingerprint;
+                # features copied as-is have their own attribute)
+                logs.attrs["mpldc_compression"] = compression
+                # the rest of the files should be log files
                 for pp in path_list[1:]:
-                    while True:
-                        # avoid name clashes
-                        ii = 0
-                        log_name = pp.name + f"-{ii}" if ii else pp.name
-                        if log_name in hw.h5file.get("logs", {}):
-                            ii += 1
-                            continue
-                        # write the log file
-                        lines = pp.read_text().split("\n")
-                        lines = [ll.rstrip() for ll in lines]
-                        hw.store_log(log_name, lines)
-                        break
+                    # avoid name clashes
+                    log_name = pp.name
+                    ii = 0
+                    while log_name in logs:
+                        ii += 1
+                        log_name = f"{pp.name}-{ii}"
+                    # write the log file
+                    lines = pp.read_text().split("\n")
+                    lines = [ll.rstrip() for ll in lines]
+                    write_text_dataset(group=logs,
+                                       name=log_name,
+                                       lines=lines,
+                                       compression_kwargs=cmp_kw)
+                # rename logs from a previous `dclab-compress` run
+                # (same naming scheme as dclab)
+                for lkey in ["dclab-compress", "dclab-compress-warnings"]:
+                    if lkey in logs:
+                        md5 = hashfile(path_list[0], count=80)
+                        logs.move(lkey, f"{lkey}_{md5}")
+                if w:
+                    dclab_logs["dclab-compress-warnings"] = \
+                        assemble_warnings(w)
+                for name, lines in dclab_logs.items():
+                    hw.store_log(name, lines)
 
     def get_raw_data_iterator(self):
         """Get list of .rtdc files including associated files"""
-        for pp in self.path_raw.rglob("*.rtdc"):
+        for pp in sorted(SCAN_CACHE.iter_files(self.path_raw,
+                                               pattern="*.rtdc")):
             path_list = [pp]
             # search for matching SoftwareSettings.ini files
             if pp.name.startswith("M"):
@@ -43,3 +145,162 @@ class RTDCRecipe(Recipe):
                 if pini.exists():
                     path_list.append(pini)
             yield path_list
+
+
+def select_features(features, include="all", exclude=""):
+    """Return the features to copy
+
+    Parameters
+    ----------
+    features: list of str
+        features available in the dataset
+    include: str
+        features to include, separated by semicolons or spaces;
+        "all" and "scalar" stand for all or all scalar features
+    exclude: str
+        features to exclude, same format as `include`
+
+    Returns
+    -------
+    selected: list of str
+        the features in `features` that are included and not excluded
+    """
+    def expand(spec):
+        names = set()
+        for name in re.split(r"[;\s]+", spec.strip()):
+            if not name:
+                continue
+            elif name == "all":
+                names.update(features)
+            elif name == "scalar":
+                names.update(ft for ft in features
+                             if scalar_feature_exists(ft))
+            elif feature_exists(name):
+                names.add(name)
+            else:
+                raise ValueError(f"Unknown feature '{name}'!")
+        return names
+
+    include = expand(include)
+    exclude = expand(exclude)
+    return [ft for ft in features if ft in include and ft not in exclude]
+
+
+def copy_features(h5_in, h5_out, compression_kwargs, features=None,
+                  checkpoint=None):
+    """Copy all valid features from one RT-DC file to another
+
+    Features that already exist in `h5_out` (e.g. basin mapping
+    features copied by :func:`dclab.rtdc_dataset.copier.rtdc_copy`)
+    are not copied.
+
+    Parameters
+    ----------
+    h5_in: h5py.File
+        input RT-DC file
+    h5_out: h5py.File
+        output RT-DC file opened in write mode
+    compression_kwargs: dict
+        compression keyword arguments for `create_dataset`
+    features: list of str
+        features to copy (defaults to all features in `h5_in`);
+        defective features (which dclab recomputes) should not be
+        passed here
+    checkpoint: Callable
+        called before each feature is copied (see
+        :func:`mpl_data_cast.recipe.Recipe.checkpoint`)
+    """
+    events_in = h5_in.get("events", {})
+    events_out = h5_out.require_group("events")
+    if features is None:
+        features = list(events_in)
+    for feat in features:
+        if (feat not in events_in
+                or feat in events_out
+                or not feature_exists(feat)):
+            continue
+        if checkpoint is not None:
+            checkpoint()
+        dst = copy_compressed(src_loc=events_in,
+                              name=feat,
+                              dst_loc=events_out,
+                              compression_kwargs=compression_kwargs)
+        if scalar_feature_exists(feat):
+            # complement min/max values for all scalar features
+            for ufunc, attr in [(np.nanmin, "min"),
+                                (np.nanmax, "max"),
+                                (np.nanmean, "mean"),
+                                ]:
+                if attr not in dst.attrs:
+                    dst.attrs[attr] = ufunc(dst)
+
+
+def copy_compressed(src_loc, name, dst_loc, compression_kwargs,
+                    max_bytes=32 * 1024**2):
+    """Copy an HDF5 dataset or group (recursively) with compression
+
+    Datasets that are already compressed with an accepted codec (see
+    :func:`mpl_data_cast.compression.get_compression_codec`) are
+    copied as-is, i.e. without decompressing and compressing them
+    again (unless `compression_kwargs` is empty). Since the codec of
+    such a dataset may differ from `compression_kwargs`, its name is
+    stored in the "mpldc_compression" attribute of the dataset.
+
+    Parameters
+    ----------
+    src_loc: h5py.Group
+        source group
+    name: str
+        name of the dataset or group in `src_loc`
+    dst_loc: h5py.Group
+        destination group
+    compression_kwargs: dict
+        compression keyword arguments for `create_dataset`
+    max_bytes: int
+        maximum number of bytes read from `src_loc` at once
+
+    Returns
+    -------
+    dst: h5py.Dataset or h5py.Group
+        the copied object `dst_loc[name]`
+    """
+    src = src_loc[name]
+    if isinstance(src, h5py.Group):
+        dst = dst_loc.require_group(name)
+        for key in src:
+            copy_compressed(src_loc=src,
+                            name=key,
+                            dst_loc=dst,
+                            compression_kwargs=compression_kwargs,
+                            max_bytes=max_bytes)
+    elif src.ndim == 0 or src.size == 0:
+        # nothing to compress
+        src_loc.copy(name, dst_loc, name=name)
+        dst = dst_loc[name]
+    elif compression_kwargs and (codec := get_compression_codec(src)):
+        # already compressed (the raw chunks are copied by HDF5)
+        src_loc.copy(name, dst_loc, name=name)
+        dst = dst_loc[name]
+        dst.attrs.update(src.attrs)
+        dst.attrs["mpldc_compression"] = codec
+        return dst
+    else:
+        if src.chunks is not None and src.chunks[0] <= src.shape[0]:
+            chunks = src.chunks
+        else:
+            chunks = dclab.RTDCWriter.get_best_nd_chunks(
+                item_shape=src.shape[1:], item_dtype=src.dtype)
+            chunks = (min(chunks[0], src.shape[0]),) + chunks[1:]
+        dst = dst_loc.create_dataset(name,
+                                     shape=src.shape,
+                                     dtype=src.dtype,
+                                     chunks=chunks,
+                                     fletcher32=True,
+                                     **compression_kwargs)
+        # read as many whole chunks as fit into `max_bytes`
+        item_size = max(1, src.dtype.itemsize * int(np.prod(src.shape[1:])))
+        step = max(1, max_bytes // item_size // chunks[0]) * chunks[0]
+        for start in range(0, src.shape[0], step):
+            dst[start:start + step] = src[start:start + step]
+    dst.attrs.update(src.attrs)
+    return dst
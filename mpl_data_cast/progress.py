@@ -0,0 +1,167 @@
+"""Byte-weighted progress and ETA estimation for casts"""
+import threading
+import time
+
+
+class CastProgress:
+    def __init__(self,
+                 total_size: int = 0,
+                 conversion_cost: float = 1.0,
+                 smoothing: float = 0.3):
+        """Track the progress of a cast based on the number of bytes
+
+        Every dataset contributes work proportional to its size in
+        bytes. Copying a file costs one unit per byte; converting a
+        dataset additionally costs `conversion_cost` units per byte
+        (see :const:`mpl_data_cast.recipe.Recipe.conversion_cost`).
+        The throughput is smoothed with an exponential moving average
+        and used for estimating the remaining time.
+
+        Parameters
+        ----------
+        total_size: int
+            total size of all files in the input directory in bytes
+            (0 if unknown, e.g. while the tree is still being counted)
+        conversion_cost: float
+            relative cost of converting a byte compared to copying it
+        smoothing: float
+            weight of the latest rate sample in the moving average
+            of the throughput (between 0 and 1)
+        """
+        #: total size of the input tree in bytes
+        self.total_size = total_size
+        #: relative cost of converting a byte compared to copying it
+        self.conversion_cost = conversion_cost
+        #: weight of new samples in the moving average
+        self.smoothing = smoothing
+        #: number of bytes of all datasets finished so far
+        self.done_bytes = 0
+        #: work units of all datasets finished so far
+        self.done_work = 0.
+        #: smoothed throughput in bytes per second (None if unknown)
+        self.rate = None
+        #: smoothed throughput in work units per second (None if unknown)
+        self.work_rate = None
+        self._current = None  # [size, cost per byte, bytes processed]
+        self._sample = (time.monotonic(), 0, 0.)  # (time, bytes, work)
+        self.lock = threading.Lock()
+
+    @property
+    def is_determined(self) -> bool:
+        """Whether the total size of the input tree is known"""
+        return self.total_size > 0
+
+    def add_dataset(self, size: int, converted: bool = True):
+        """Start processing the next dataset
+
+        The previous dataset is considered finished.
+
+        Parameters
+        ----------
+        size: int
+            size of the input files of the dataset in bytes
+        converted: bool
+            whether the dataset is converted (as opposed to copied)
+        """
+        cost = 1 + self.conversion_cost if converted else 1
+        with self.lock:
+            self._finish_current()
+            self._current = [size, cost, 0]
+
+    def advance(self, offset: int):
+        """Set the number of bytes of the current dataset processed"""
+        with self.lock:
+            if self._current is not None:
+                self._current[2] = min(offset, self._current[0])
+
+    def finish(self):
+        """Mark the current dataset as finished"""
+        with self.lock:
+            self._finish_current()
+
+    def _finish_current(self):
+        if self._current is not None:
+            size, cost, _ = self._current
+            self.done_bytes += size
+            self.done_work += size * cost
+            self._current = None
+
+    def get_work(self) -> tuple:
+        """Return the bytes processed, work done, and total work
+
+        The total work is an estimate, because the stage of the
+        remaining files is unknown.
+        """
+        with self.lock:
+            done_bytes = self.done_bytes
+            done_work = self.done_work
+            seen_bytes = self.done_bytes
+            if self._current is not None:
+                size, cost, offset = self._current
+                done_bytes += offset
+                done_work += offset * cost
+                seen_bytes += size
+                current_work = size * cost
+                # Datasets are cast before the remaining files are
+                # copied. The cost of the remaining bytes is estimated
+                # from the current stage.
+                remaining_cost = cost
+            else:
+                current_work = 0
+                remaining_cost = self.done_work / self.done_bytes \
+                    if self.done_bytes else 1
+            total_work = (self.done_work
+                          + current_work
+                          + max(self.total_size - seen_bytes, 0)
+                          * remaining_cost)
+        return done_bytes, done_work, total_work
+
+    def get_fraction(self) -> float:
+        """Return the estimated fraction of the cast that is done"""
+        if not self.is_determined:
+            return 0.
+        _, done_work, total_work = self.get_work()
+        if total_work <= 0:
+            return 1.
+        return min(done_work / total_work, 1.)
+
+    def update_rate(self, now: float = None) -> float | None:
+        """Sample the throughput and update its moving average
+
+        This should be called at regular intervals (e.g. by a timer).
+        Returns the smoothed throughput in bytes per second or None
+        if unknown.
+        """
+        now = time.monotonic() if now is None else now
+        done_bytes, done_work, _ = self.get_work()
+        time_prev, bytes_prev, work_prev = self._sample
+        if now > time_prev:
+            delta = now - time_prev
+            self.rate = self._smooth(self.rate,
+                                     (done_bytes - bytes_prev) / delta)
+            self.work_rate = self._smooth(self.work_rate,
+                                          (done_work - work_prev) / delta)
+            self._sample = (now, done_bytes, done_work)
+        return self.rate
+
+    def _smooth(self, average, value):
+        if average is None:
+            return value
+        return self.smoothing * value + (1 - self.smoothing) * average
+
+    def get_eta(self) -> float | None:
+        """Return the estimated remaining time in seconds
+
+        Returns None if the total size or the throughput is unknown.
+        """
+        if not self.is_determined or not self.work_rate:
+            return None
+        _, done_work, total_work = self.get_work()
+        return max(total_work - done_work, 0) / self.work_rate
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration in seconds as "H:MM:SS" """
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
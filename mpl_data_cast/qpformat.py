@@ -0,0 +1,319 @@
+"""Writing qpformat HDF5 files (image stacks) shared by the recipes"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numbers
+import zlib
+
+import h5py
+from h5py import h5a, h5s, h5t
+import numpy as np
+
+from .compression import (
+    DEFAULT_COMPRESSION, get_compression_kwargs, get_num_threads,
+    set_blosc_threads
+)
+
+
+#: Attributes of every frame dataset (HDFView recognizes this as
+#: a series of images). Use np.bytes_ (formerly np.string_) as per
+#: http://docs.h5py.org/en/stable/strings.html#compatibility
+IMAGE_ATTRIBUTES = {
+    "CLASS": np.bytes_("IMAGE"),
+    "IMAGE_VERSION": np.bytes_("1.2"),
+    "IMAGE_SUBCLASS": np.bytes_("IMAGE_GRAYSCALE"),
+}
+
+#: Name of the dataset containing the per-frame metadata table
+TABLE_NAME = "frame_metadata"
+
+
+class QPFormatWriter:
+    def __init__(self, h5, compression: str = DEFAULT_COMPRESSION,
+                 max_workers: int = None, common_attrs: dict = None,
+                 max_pending_bytes: int = 256 * 1024**2):
+        """Write 2D frames as single-chunk HDF5 datasets
+
+        If the compression preset only uses filters that are available
+        in Python (gzip/shuffle), then the chunks are compressed and
+        checksummed (fletcher32) in a thread pool and committed in
+        order via `write_direct_chunk`. At most one frame per thread
+        (and at most `max_pending_bytes`) is kept in memory. Other
+        presets (Blosc2) are written with h5py directly and rely on
+        Blosc's internal threads (see
+        :func:`mpl_data_cast.compression.set_blosc_threads`).
+
+        Every frame dataset gets the `common_attrs` and its own
+        attributes. In addition, the numeric frame attributes that
+        are not in `common_attrs` (e.g. time, position, focus) are
+        collected in one compound table (:const:`TABLE_NAME`) which
+        also holds the common attributes.
+
+        Parameters
+        ----------
+        h5: h5py.Group
+            HDF5 file or group opened in write mode
+        compression: str
+            compression preset (see :mod:`mpl_data_cast.compression`)
+        max_workers: int
+            number of compression threads, defaults to the number of
+            CPUs available to this process
+        common_attrs: dict
+            attributes shared by all frames (can be updated until
+            the first frame is written)
+        max_pending_bytes: int
+            maximum size of the frames waiting to be committed (at
+            least one frame is always queued)
+        """
+        self.h5 = h5
+        self.compression = compression
+        self.compression_kwargs = get_compression_kwargs(compression)
+        #: whether the chunks are encoded in Python
+        self.direct = is_directly_encodable(self.compression_kwargs)
+        self.max_workers = max_workers or get_num_threads()
+        self.pool = None
+        if not self.direct:
+            set_blosc_threads(self.max_workers)
+        if self.direct and self.max_workers > 1:
+            self.pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                           thread_name_prefix="QPFWriter")
+        #: queue of frames (name, image, attrs, future) not yet committed
+        self.pending = deque()
+        #: size of the images in :const:`pending` in bytes
+        self.pending_bytes = 0
+        self.max_pending_bytes = max_pending_bytes
+        #: attributes shared by all frames
+        self.common_attrs = dict(common_attrs or {})
+        #: per-frame metadata (see :func:`write_table`)
+        self.table_rows = []
+        #: HDF5 type and space identifiers of attributes
+        self._attr_ids = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+            self.write_table()
+        self.close()
+
+    def close(self):
+        """Shut down the thread pool (pending frames are discarded)"""
+        self.pending.clear()
+        self.pending_bytes = 0
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+    def flush(self):
+        """Commit all pending frames to the HDF5 file"""
+        while self.pending:
+            self._commit_pending()
+
+    def write_table(self):
+        """Write the per-frame metadata table (called on exit)"""
+        if not self.table_rows:
+            return
+        columns = []
+        for _, row in self.table_rows:
+            columns += [col for col in row if col not in columns]
+        name_len = max(len(name) for name, _ in self.table_rows)
+        dtype = np.dtype([("name", f"S{name_len}")]
+                         + [(col, np.float64) for col in columns])
+        table = np.zeros(len(self.table_rows), dtype=dtype)
+        table["name"] = [name.encode() for name, _ in self.table_rows]
+        for col in columns:
+            table[col] = [row.get(col, np.nan) for _, row in self.table_rows]
+        if TABLE_NAME in self.h5:
+            del self.h5[TABLE_NAME]
+        ds = self.h5.create_dataset(TABLE_NAME, data=table)
+        ds.attrs.update(self.common_attrs)
+
+    def write_frame(self, name: str, image: np.ndarray, attrs: dict = None):
+        """Write a frame as an HDF5 dataset
+
+        Depending on the compression, the dataset is created when
+        later frames are written or when :func:`flush` is called.
+
+        Parameters
+        ----------
+        name: str
+            name of the dataset
+        image: np.ndarray
+            image data (the entire frame is one chunk)
+        attrs: dict
+            dataset attributes
+        """
+        image = np.ascontiguousarray(image)
+        if self.direct:
+            if self.pool is None:
+                future = None
+            else:
+                future = self.pool.submit(encode_chunk, image,
+                                          self.compression_kwargs)
+            self.pending.append((name, image, attrs, future))
+            self.pending_bytes += image.nbytes
+            # Limit the number of frames in memory.
+            while len(self.pending) > 1 and (
+                    len(self.pending) > self.max_workers
+                    or self.pending_bytes > self.max_pending_bytes):
+                self._commit_pending()
+        else:
+            self._commit(name, image, attrs, None)
+
+    def read_frame_chunk(self, name: str):
+        """Return the encoded chunk of a frame written before
+
+        The returned values can be passed to :func:`write_frame_chunk`
+        of a writer with the same compression (e.g. for another file).
+
+        Returns
+        -------
+        shape: tuple
+            shape of the frame
+        dtype: np.dtype
+            data type of the frame
+        chunk: bytes
+            the frame as stored in the HDF5 file (filtered)
+        filter_mask: int
+            HDF5 filter mask of the chunk
+        """
+        self.flush()
+        ds = self.h5[name]
+        filter_mask, chunk = ds.id.read_direct_chunk((0,) * ds.ndim)
+        return ds.shape, ds.dtype, chunk, filter_mask
+
+    def write_frame_chunk(self, name: str, shape: tuple, dtype: np.dtype,
+                          chunk: bytes, filter_mask: int = 0,
+                          attrs: dict = None):
+        """Write a frame from an already encoded chunk
+
+        The chunk must have been encoded with the compression of this
+        writer (see :func:`read_frame_chunk`).
+        """
+        # keep the order in which the datasets are created
+        self.flush()
+        ds = self._create_dataset(name, shape, dtype)
+        ds.id.write_direct_chunk((0,) * len(shape), chunk,
+                                 filter_mask=filter_mask)
+        self._set_attrs(ds, attrs)
+        return ds
+
+    def _commit(self, name, image, attrs, future):
+        """Create the dataset `name` and write its data"""
+        ds = self._create_dataset(name, image.shape, image.dtype)
+        if self.direct:
+            if future is None:
+                chunk = encode_chunk(image, self.compression_kwargs)
+            else:
+                chunk = future.result()
+            ds.id.write_direct_chunk((0,) * image.ndim, chunk, filter_mask=0)
+        else:
+            ds[...] = image
+        self._set_attrs(ds, attrs)
+        return ds
+
+    def _commit_pending(self):
+        """Commit the oldest pending frame"""
+        name, image, attrs, future = self.pending.popleft()
+        self.pending_bytes -= image.nbytes
+        self._commit(name, image, attrs, future)
+
+    def _create_dataset(self, name, shape, dtype):
+        """Create a single-chunk frame dataset"""
+        return self.h5.create_dataset(name,
+                                      shape=shape,
+                                      dtype=dtype,
+                                      chunks=shape,
+                                      fletcher32=True,
+                                      **self.compression_kwargs)
+
+    def _set_attrs(self, ds, attrs):
+        """Set the image, common, and frame attributes of a dataset"""
+        all_attrs = dict(IMAGE_ATTRIBUTES)
+        all_attrs.update(self.common_attrs)
+        row = {}
+        for key, value in (attrs or {}).items():
+            all_attrs[key] = value
+            if (isinstance(value, numbers.Real)
+                    and not isinstance(value, bool)
+                    and (key not in self.common_attrs
+                         or self.common_attrs[key] != value)):
+                row[key] = value
+        self.table_rows.append((ds.name.rsplit("/", 1)[-1], row))
+        for key, value in all_attrs.items():
+            self._write_attr(ds, key, value)
+
+    def _write_attr(self, ds, key, value):
+        """Write an attribute using cached HDF5 type/space identifiers
+
+        This is much faster than `ds.attrs[key] = value` when writing
+        the same attributes to thousands of datasets.
+        """
+        if isinstance(value, str):
+            value = np.array(value, dtype=h5py.string_dtype())
+        else:
+            value = np.asarray(value)
+        if value.dtype.kind in "OU" and value.ndim:
+            # arrays of strings or objects (rare)
+            ds.attrs[key] = value
+            return
+        id_key = (key, value.dtype, value.shape)
+        if id_key not in self._attr_ids:
+            if value.shape:
+                space = h5s.create_simple(value.shape)
+            else:
+                space = h5s.create(h5s.SCALAR)
+            self._attr_ids[id_key] = (
+                key.encode("utf-8"),
+                h5t.py_create(value.dtype, logical=True),
+                space)
+        name, tid, space = self._attr_ids[id_key]
+        h5a.create(ds.id, name, tid, space).write(value)
+
+
+def encode_chunk(image: np.ndarray, compression_kwargs: dict) -> bytes:
+    """Apply the HDF5 filter pipeline (shuffle, gzip, fletcher32)
+
+    The output is identical to what HDF5 writes to disk for a chunk
+    of a dataset created with `fletcher32=True` and the given
+    `compression_kwargs` (see :func:`is_directly_encodable`).
+    """
+    data = np.ascontiguousarray(image)
+    if compression_kwargs.get("shuffle"):
+        buf = data.view(np.uint8).reshape(-1, data.dtype.itemsize).T.tobytes()
+    else:
+        buf = data.tobytes()
+    if compression_kwargs.get("compression") == "gzip":
+        buf = zlib.compress(buf, compression_kwargs.get("compression_opts", 4))
+    return buf + fletcher32(buf)
+
+
+def fletcher32(data: bytes, block_size: int = 2**20) -> bytes:
+    """Compute the HDF5 fletcher32 checksum of a chunk
+
+    This is equivalent to `H5_checksum_fletcher32` in the HDF5 library
+    (16-bit big-endian words, odd lengths are zero-padded). The
+    checksum is returned in the byte order used by the HDF5 filter.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if buf.size % 2:
+        buf = np.concatenate([buf, np.zeros(1, dtype=np.uint8)])
+    words = buf.view(">u2")
+    sum1 = sum2 = 0
+    for start in range(0, words.size, block_size):
+        block = words[start:start + block_size].astype(np.uint64)
+        weights = np.arange(block.size, 0, -1, dtype=np.uint64)
+        sum2 += sum1 * block.size + int(np.sum(weights * block))
+        sum1 += int(np.sum(block))
+    # HDF5 uses one's complement arithmetic (0xffff instead of 0)
+    sum1 = (sum1 - 1) % 65535 + 1 if sum1 else 0
+    sum2 = (sum2 - 1) % 65535 + 1 if sum2 else 0
+    return ((sum2 << 16) | sum1).to_bytes(4, "little")
+
+
+def is_directly_encodable(compression_kwargs: dict) -> bool:
+    """Whether :func:`encode_chunk` supports the compression kwargs"""
+    return (set(compression_kwargs) <= {"compression", "compression_opts",
+                                        "shuffle"}
+            and compression_kwargs.get("compression") in [None, "gzip"])
@@ -1,6 +1,11 @@
 import hashlib
 from abc import ABC, abstractmethod
 import atexit
+import functools
+import importlib
+from importlib import metadata
+import io
+import json
 import logging
 import os
 import pathlib
@@ -12,24 +17,75 @@ from typing import Type, Callable, List
 
 import psutil
 
-from .util import HasherThread, hashfile, copyhashfile
+from ._version import version
+from .control import CastCancelled, CastControl
+from .scan import SCAN_CACHE
+from .util import HasherThread, hashfile, copyhashfile, writehashbuffer
 
 
 logger = logging.getLogger(__name__)
 
 
+#: Name of the checkpoint file of paused or cancelled casts
+#: (stored in the target directory)
+CHECKPOINT_FILE_NAME = ".mpldc-checkpoint.json"
+
 #: Files that are not copied (unless specified explicitly by a recipe)
 IGNORED_FILE_NAMES = [
     ".DS_Store",
     "._.DS_Store",
     "Thumbs.db",
+    CHECKPOINT_FILE_NAME,
 ]
 
+#: HDF5 attribute name under which the source fingerprint is stored
+FINGERPRINT_ATTRIBUTE = "mpldc_source_fingerprint"
+
+#: Datasets whose input files are smaller than this (in bytes) are
+#: converted in memory by recipes that support it (see
+#: :const:`Recipe.in_memory_capable`)
+IN_MEMORY_MAX_SIZE = 32 * 1024**2
+
+#: Recipes shipped with MPL-Data-Cast, mapping the recipe name to the
+#: class path and a one-line description (the recipe modules are only
+#: imported when a recipe is used)
+BUILTIN_RECIPES = {
+    "CatchAll": ("mpl_data_cast.mod_recipes.rcp_catchall:CatchAllRecipe",
+                 "Just copy all files, except known junk files"),
+    "OAH": ("mpl_data_cast.mod_recipes.rcp_oah:OAHRecipe",
+            "Matlab file format (TopogMap.mat) for DHM data"),
+    "QLSI": ("mpl_data_cast.mod_recipes.rcp_qlsi:QLSIRecipe",
+             "ome.tif file format from MicroManager with Phasics "
+             "SID4Bio camera"),
+    "RTDC": ("mpl_data_cast.mod_recipes.rcp_rtdc:RTDCRecipe",
+             "Compress raw DC data and include .ini files"),
+}
+
+#: Entry point group for third-party recipes; the name of an entry
+#: point is the recipe name and its value the class path, e.g.
+#: ``MyRecipe = "my_package.recipe:MyRecipe"``
+RECIPE_ENTRY_POINT_GROUP = "mpl_data_cast.recipes"
+
 
 class Recipe(ABC):
     #: Ignored files as specified by the recipe (an addition
     #: to `IGNORED_FILE_NAMES`)
     ignored_file_names: List[str] = []
+    #: Location (HDF5 group) in the converted output file where the
+    #: source fingerprint is stored; `None` disables fingerprinting
+    #: (see :func:`Recipe.get_source_fingerprint`)
+    fingerprint_location: str | None = None
+    #: Python packages whose versions affect the output of
+    #: :func:`Recipe.convert_dataset` (part of the source fingerprint)
+    fingerprint_packages: List[str] = []
+    #: Whether :func:`Recipe.convert_dataset` can write to a file
+    #: object (`io.BytesIO`) passed as `temp_path`; small datasets
+    #: are then converted in memory and streamed to the target
+    in_memory_capable: bool = False
+    #: Time it takes to convert a byte of raw data in
+    #: :func:`Recipe.convert_dataset` relative to copying it to the
+    #: target directory (used for estimating the progress of a cast)
+    conversion_cost: float = 1.0
 
     def __init__(self,
                  path_raw: str | pathlib.Path,
@@ -61,8 +117,23 @@ class Recipe(ABC):
                 dir=temp_root))
         # Make sure everything is removed in the end.
         atexit.register(shutil.rmtree, self.tempdir, ignore_errors=True)
-
-    def cast(self, path_callback: Callable = None, **kwargs) -> dict:
+        #: Maximum size of the input files of a dataset converted in
+        #: memory (set to 0 to always use the temporary directory)
+        self.in_memory_max_size = IN_MEMORY_MAX_SIZE
+        #: Pause/cancel control of the current cast
+        self.control = None
+        #: Stage of the current cast ("convert" for datasets yielded
+        #: by :func:`get_raw_data_iterator`, "copy" for all other
+        #: files, None if not casting)
+        self.stage = None
+        #: State of the current cast (see :func:`save_checkpoint`)
+        self.checkpoint_state = None
+
+    def cast(self, path_callback: Callable = None,
+             control: CastControl = None,
+             error_callback: Callable = None,
+             skip_paths: set = None,
+             **kwargs) -> dict:
         """Cast the entire data tree to the target directory
 
         Parameters
@@ -70,74 +141,316 @@ class Recipe(ABC):
         path_callback: Callable
             Callable function accepting a list of paths; used for tracking
             the progress (e.g. via the CLI)
+        control: CastControl
+            Used for pausing or cancelling the cast from another thread.
+            When the cast is paused or cancelled, a checkpoint file is
+            written to the target directory. The next cast with the
+            same recipe, raw data directory, and keyword arguments
+            skips the datasets that were already transferred and
+            resumes a partial file copy where it stopped.
+        error_callback: Callable
+            Called with the path and the formatted traceback of every
+            error when it occurs (see "errors" of the returned result)
+        skip_paths: set of pathlib.Path
+            First paths of datasets (or files) that are not cast, e.g.
+            because they crashed the worker process (see
+            :class:`mpl_data_cast.worker.CastWorker`)
+        **kwargs:
+            keyword arguments passed to :func:`convert_dataset`
 
         Returns
         -------
         result: dict
-            Results dictionary with keys "success" (bool) and "errors"
-            (list of tuples (path, formatted traceback))
+            Results dictionary with keys "success" (bool), "cancelled"
+            (bool), and "errors" (list of tuples (path, formatted
+            traceback))
         """
         errors = []
-        # TODO: use more efficient tree structure to keep track of known files
-        known_files = []
-
-        # Copy the raw data specified by the recipe
-        ds_iterator = self.get_raw_data_iterator()
-        for path_list in ds_iterator:
-            known_files += path_list
-            if path_callback is not None:
-                path_callback(path_list)
-            targ_path = self.get_target_path(path_list)
-            temp_path = self.get_temp_path(path_list)
-            try:
-                self.convert_dataset(path_list=path_list,
-                                     temp_path=temp_path,
-                                     **kwargs)
-            except BaseException:
-                errors.append((path_list[0], traceback.format_exc()))
-                continue
-            try:
-                ok = self.transfer_to_target_path(
-                    temp_path=temp_path,
-                    target_path=targ_path,
-                    delete_after=True,  # [sic!]
-                    )
-            except BaseException:
-                ok = False
-
-            if not ok:
-                errors.append((path_list[0], traceback.format_exc()))
-                continue
-
-        # Walk the directory tree and copy any other files
-        ignored = IGNORED_FILE_NAMES + self.ignored_file_names
-        for pp in self.path_raw.rglob("*"):
-            if pp.is_dir() or pp.name in ignored:
-                continue
-            elif pp in known_files:  # this might be slow
-                continue
-            else:
+        known_files = set()
+        skip_paths = skip_paths or set()
+        self.control = control
+
+        def add_error(path):
+            errors.append((path, traceback.format_exc()))
+            if error_callback is not None:
+                error_callback(*errors[-1])
+
+        completed, resume = self.load_checkpoint(**kwargs)
+        self.checkpoint_state = {"kwargs": kwargs,
+                                 "completed": completed,
+                                 "current": None}
+        try:
+            # Copy the raw data specified by the recipe
+            self.stage = "convert"
+            ds_iterator = self.get_raw_data_iterator()
+            for path_list in ds_iterator:
+                known_files.update(path_list)
                 if path_callback is not None:
-                    path_callback([pp])
-                prel = pp.relative_to(self.path_raw)
-                target_path = self.path_tar / prel
-                target_path.parent.mkdir(parents=True, exist_ok=True)
+                    path_callback(path_list)
+                prel = self.get_relative_path(path_list[0])
+                if prel in completed or path_list[0] in skip_paths:
+                    # transferred before the cast was paused/cancelled
+                    # or excluded by the caller
+                    continue
+                self.checkpoint(path=path_list[0])
+                targ_path = self.get_target_path(path_list)
+                in_memory = self.is_in_memory(path_list)
+                if in_memory:
+                    temp_path = io.BytesIO()
+                else:
+                    temp_path = self.get_temp_path(path_list)
                 try:
-                    ok = self.transfer_to_target_path(
-                        temp_path=pp,
-                        target_path=target_path,
-                        delete_after=False,  # [sic!]
+                    fingerprint = self.get_source_fingerprint(path_list,
+                                                              **kwargs)
+                    if (fingerprint is not None
+                            and self.get_target_fingerprint(targ_path)
+                            == fingerprint):
+                        # The target was converted from this exact source
+                        # with the same settings, no need to convert again.
+                        logger.info(
+                            f"Unchanged source, skipping: {targ_path}")
+                        completed.add(prel)
+                        continue
+                    self.convert_dataset(path_list=path_list,
+                                         temp_path=temp_path,
+                                         **kwargs)
+                    if fingerprint is not None:
+                        from .helper import h5_set_attribute
+                        h5_set_attribute(path=temp_path,
+                                         location=self.fingerprint_location,
+                                         attribute=FINGERPRINT_ATTRIBUTE,
+                                         value=fingerprint)
+                except (CastCancelled, KeyboardInterrupt):
+                    raise
+                except BaseException:
+                    add_error(path_list[0])
+                    continue
+                try:
+                    if in_memory:
+                        ok = self.transfer_buffer_to_target_path(
+                            buffer=temp_path,
+                            target_path=targ_path,
                         )
+                    else:
+                        # A partial transfer can only be resumed if the
+                        # temporary file is the raw file (e.g. a symbolic
+                        # link created by the CatchAll recipe).
+                        if temp_path.samefile(path_list[0]):
+                            offset = self.get_resume_offset(resume,
+                                                            path_list[0])
+                        else:
+                            offset = 0
+                        ok = self.transfer_to_target_path(
+                            temp_path=temp_path,
+                            target_path=targ_path,
+                            delete_after=True,  # [sic!]
+                            checkpoint=functools.partial(self.checkpoint,
+                                                         path_list[0]),
+                            resume_offset=offset,
+                            )
+                except (CastCancelled, KeyboardInterrupt):
+                    raise
                 except BaseException:
                     ok = False
-                if not ok:
-                    errors.append((pp, traceback.format_exc()))
+                finally:
+                    # free memory
+                    del temp_path
+                    # the target file was written in place
+                    SCAN_CACHE.invalidate(targ_path.parent)
 
+                if not ok:
+                    add_error(path_list[0])
+                    continue
+                completed.add(prel)
+
+            # Walk the directory tree and copy any other files (do not
+            # trust cached listings here; modification times of
+            # directories are unreliable on some file systems and
+            # files must not be missed)
+            self.stage = "copy"
+            ignored = IGNORED_FILE_NAMES + self.ignored_file_names
+            for pp in SCAN_CACHE.iter_files(self.path_raw,
+                                            ignored_names=ignored,
+                                            refresh=True):
+                if pp in known_files:
+                    continue
+                else:
+                    if path_callback is not None:
+                        path_callback([pp])
+                    prel = self.get_relative_path(pp)
+                    if prel in completed or pp in skip_paths:
+                        continue
+                    self.checkpoint(path=pp)
+                    target_path = self.path_tar / prel
+                    target_path.parent.mkdir(parents=True, exist_ok=True)
+                    offset = self.get_resume_offset(resume, pp)
+                    try:
+                        ok = self.transfer_to_target_path(
+                            temp_path=pp,
+                            target_path=target_path,
+                            delete_after=False,  # [sic!]
+                            checkpoint=functools.partial(self.checkpoint,
+                                                         pp),
+                            resume_offset=offset,
+                            )
+                    except (CastCancelled, KeyboardInterrupt):
+                        raise
+                    except BaseException:
+                        ok = False
+                    finally:
+                        SCAN_CACHE.invalidate(target_path.parent)
+                    if not ok:
+                        add_error(pp)
+                    else:
+                        completed.add(prel)
+        except CastCancelled:
+            logger.info("Cast cancelled")
+            self.save_checkpoint()
+            return {
+                "success": False,
+                "cancelled": True,
+                "errors": errors,
+            }
+        except KeyboardInterrupt:
+            # hard abort, but a partially copied file can be resumed
+            self.save_checkpoint()
+            raise
+        finally:
+            self.control = None
+            self.stage = None
+
+        self.get_checkpoint_path().unlink(missing_ok=True)
         return {
             "success": not bool(errors),
+            "cancelled": False,
             "errors": errors,
         }
 
+    def checkpoint(self, path: pathlib.Path = None, offset: int = 0):
+        """Pause or cancel the cast (called during :func:`cast`)
+
+        This method returns immediately unless the cast is controlled
+        by a :class:`mpl_data_cast.control.CastControl` that is paused
+        (blocks until resumed) or cancelled (raises
+        :class:`mpl_data_cast.control.CastCancelled`). Recipes should
+        call it regularly in :func:`convert_dataset`.
+
+        Parameters
+        ----------
+        path: pathlib.Path
+            raw data file that is currently processed (defaults to the
+            previous one)
+        offset: int
+            number of bytes of `path` already copied to the target
+        """
+        if path is not None and self.checkpoint_state is not None:
+            self.checkpoint_state["current"] = (path, offset)
+        control = self.control
+        if control is None:
+            return
+        if control.paused:
+            logger.info("Cast paused")
+            self.save_checkpoint()
+        control.wait()
+
+    def get_checkpoint_path(self) -> pathlib.Path:
+        """Return the path of the checkpoint file of a cast"""
+        return self.path_tar / CHECKPOINT_FILE_NAME
+
+    def get_relative_path(self, path: pathlib.Path) -> str:
+        """Return the POSIX path of `path` relative to `path_raw`"""
+        try:
+            return path.relative_to(self.path_raw).as_posix()
+        except ValueError:
+            return str(path)
+
+    def get_resume_offset(self, resume: dict | None,
+                          path: pathlib.Path) -> int:
+        """Return the offset at which a partial copy of `path` resumes
+
+        Parameters
+        ----------
+        resume: dict or None
+            partially copied file from :func:`load_checkpoint`
+        path: pathlib.Path
+            raw data file
+
+        Returns
+        -------
+        offset: int
+            number of bytes already copied to the target, 0 if `path`
+            is not the partially copied file or if it was modified
+        """
+        if resume is None or resume["path"] != self.get_relative_path(path):
+            return 0
+        try:
+            pst = path.stat()
+        except OSError:
+            return 0
+        if (resume["size"] == pst.st_size
+                and resume["mtime_ns"] == pst.st_mtime_ns):
+            return resume["offset"]
+        return 0
+
+    def load_checkpoint(self, **kwargs):
+        """Load the checkpoint of a paused or cancelled cast
+
+        Returns
+        -------
+        completed: set of str
+            relative paths of the datasets and files transferred
+        resume: dict or None
+            partially copied file ("path", "size", "mtime_ns", "offset")
+        """
+        completed = set()
+        resume = None
+        path = self.get_checkpoint_path()
+        if path.exists():
+            try:
+                data = json.loads(path.read_text())
+            except BaseException:
+                logger.warning(f"Ignoring invalid checkpoint {path}")
+            else:
+                if (data.get("recipe") == self.format
+                        and data.get("path_raw") == str(self.path_raw)
+                        and data.get("kwargs") == self._kwargs_repr(kwargs)):
+                    logger.info(f"Resuming cast from checkpoint {path}")
+                    completed = set(data["completed"])
+                    resume = data["current"]
+        return completed, resume
+
+    def save_checkpoint(self):
+        """Write the state of the current cast to the checkpoint file"""
+        state = self.checkpoint_state
+        if state is None:
+            return
+        current = None
+        if state["current"] is not None:
+            path, offset = state["current"]
+            try:
+                pst = path.stat()
+            except OSError:
+                pass
+            else:
+                current = {"path": self.get_relative_path(path),
+                           "size": pst.st_size,
+                           "mtime_ns": pst.st_mtime_ns,
+                           "offset": offset,
+                           }
+        data = {"recipe": self.format,
+                "path_raw": str(self.path_raw),
+                "kwargs": self._kwargs_repr(state["kwargs"]),
+                "completed": sorted(state["completed"]),
+                "current": current,
+                }
+        path = self.get_checkpoint_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, indent=1))
+
+    @staticmethod
+    def _kwargs_repr(kwargs):
+        return {key: repr(kwargs[key]) for key in sorted(kwargs)}
+
     @abstractmethod
     def convert_dataset(self, path_list, temp_path, **kwargs):
         """Implement in subclass to do conversion"""
@@ -153,6 +466,69 @@ class Recipe(ABC):
             each item contains all files that belong to one dataset.
         """
 
+    def get_source_fingerprint(self, path_list: list, **kwargs) -> str | None:
+        """Return a fingerprint of the source data of a dataset
+
+        The fingerprint is computed from the relative paths, sizes and
+        modification times of all files in `path_list`, the recipe name,
+        the versions of MPL-Data-Cast and of `fingerprint_packages`,
+        and the keyword arguments passed to :func:`convert_dataset`.
+        If the fingerprint matches the one stored in an existing
+        target file, then :func:`cast` does not convert the dataset
+        again.
+
+        Parameters
+        ----------
+        path_list: list of pathlib.Path
+            the input paths corresponding to a dataset
+        **kwargs:
+            keyword arguments passed to :func:`convert_dataset`
+
+        Returns
+        -------
+        fingerprint: str or None
+            MD5 hex digest or None if `fingerprint_location` is not set
+        """
+        if self.fingerprint_location is None:
+            return None
+        files = []
+        for pp in path_list:
+            try:
+                prel = pp.relative_to(self.path_raw).as_posix()
+            except ValueError:
+                prel = str(pp)
+            try:
+                pst = pp.stat()
+            except OSError:
+                # e.g. optional junk files that do not exist
+                files.append([prel, None, None])
+            else:
+                files.append([prel, pst.st_size, pst.st_mtime_ns])
+        info = {
+            "recipe": self.format,
+            "versions": {"mpl_data_cast": version} | {
+                pkg: get_package_version(pkg)
+                for pkg in self.fingerprint_packages},
+            "kwargs": self._kwargs_repr(kwargs),
+            "files": files,
+        }
+        dump = json.dumps(info, sort_keys=True).encode("utf-8")
+        return hashlib.md5(dump).hexdigest()
+
+    def get_target_fingerprint(self, target_path: pathlib.Path) -> str | None:
+        """Return the source fingerprint stored in a target file
+
+        Returns None if fingerprinting is disabled for this recipe,
+        the target file does not exist, or does not contain a
+        fingerprint (e.g. partial transfers or invalid files).
+        """
+        if self.fingerprint_location is None or not target_path.exists():
+            return None
+        from .helper import h5_get_attribute
+        return h5_get_attribute(path=target_path,
+                                location=self.fingerprint_location,
+                                attribute=FINGERPRINT_ATTRIBUTE)
+
     def get_target_path(self, path_list: list) -> pathlib.Path:
         """Get the target path for a path_list
 
@@ -183,12 +559,81 @@ class Recipe(ABC):
         hash1 = hashlib.md5(str(path_list[0]).encode("utf-8")).hexdigest()
         return self.tempdir / f"{hash1}_{uuid.uuid4()}_{path_list[0].name}"
 
+    def is_in_memory(self, path_list: list) -> bool:
+        """Whether a dataset is converted in memory
+
+        This is the case for recipes that are :const:`in_memory_capable`
+        if the total size of the input files does not exceed
+        :const:`in_memory_max_size`.
+        """
+        if not self.in_memory_capable or self.in_memory_max_size <= 0:
+            return False
+        size = 0
+        for pp in path_list:
+            try:
+                size += pp.stat().st_size
+            except OSError:
+                # e.g. optional junk files that do not exist
+                pass
+        return size <= self.in_memory_max_size
+
+    @staticmethod
+    def transfer_buffer_to_target_path(buffer: io.BytesIO,
+                                       target_path: pathlib.Path,
+                                       ) -> bool:
+        """Write an in-memory file to the target location
+
+        The data are hashed in memory while being written; afterwards,
+        the target file is hashed again and compared (verification).
+        If the target file exists and is identical, nothing is written.
+
+        Parameters
+        ----------
+        buffer: io.BytesIO
+            converted data
+        target_path: pathlib.Path
+            target location of the output file (including file name)
+
+        Returns
+        -------
+        success: bool
+            whether everything went as planned
+        """
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        data = buffer.getbuffer()
+        try:
+            hash_input = hashlib.md5(data).hexdigest()
+
+            if target_path.exists():
+                if (target_path.stat().st_size == len(data)
+                        and hashfile(target_path) == hash_input):
+                    logger.info(f"Already transferred: {target_path}")
+                    return True
+                else:
+                    logger.info(f"Replacing {target_path}")
+                    target_path.unlink()
+
+            hash_input_verify = writehashbuffer(data, target_path)
+            hash_target = hashfile(target_path)
+        finally:
+            data.release()
+
+        # compare md5 hashes (verification)
+        success = hash_input == hash_target == hash_input_verify
+        if not success:
+            # Since we wrote the wrong file, we are responsible for
+            # deleting it.
+            target_path.unlink(missing_ok=True)
+        return success
+
     @staticmethod
     def transfer_to_target_path(temp_path: pathlib.Path,
                                 target_path: pathlib.Path,
                                 check_existing: bool = True,
                                 delete_after: bool = False,
-                                hash_input: str = None
+                                hash_input: str = None,
+                                checkpoint: Callable = None,
+                                resume_offset: int = 0,
                                 ) -> bool:
         """Transfer a file to another location
 
@@ -208,6 +653,12 @@ class Recipe(ABC):
             whether to delete `temp_path` after transfer
         hash_input: str
             optional hash of the input file
+        checkpoint: Callable
+            called with the number of bytes copied (see
+            :func:`mpl_data_cast.util.copyhashfile`)
+        resume_offset: int
+            if `target_path` is a partial copy of at least this size
+            (from a cancelled cast), resume copying at this offset
 
         Returns
         -------
@@ -216,14 +667,21 @@ class Recipe(ABC):
         """
         target_path.parent.mkdir(parents=True, exist_ok=True)
 
+        resuming = False
         # Quick check for size (probably a partial transfer)
         if (target_path.exists()
                 and target_path.stat().st_size != temp_path.stat().st_size):
-            logger.info(f"Deleting partial transfer {target_path}")
-            # remove target path with mismatch in size
-            target_path.unlink()
+            if (resume_offset
+                    and target_path.stat().st_size >= resume_offset):
+                logger.info(f"Resuming partial transfer {target_path} "
+                            f"at byte {resume_offset}")
+                resuming = True
+            else:
+                logger.info(f"Deleting partial transfer {target_path}")
+                # remove target path with mismatch in size
+                target_path.unlink()
 
-        if target_path.exists():
+        if target_path.exists() and not resuming:
             if check_existing:
                 if hash_input is None:
                     hash_input = hashfile(temp_path)
@@ -238,6 +696,7 @@ class Recipe(ABC):
                         check_existing=False,
                         delete_after=False,  # [sic!]
                         hash_input=hash_input,
+                        checkpoint=checkpoint,
                     )
                 else:
                     # The file is the same, everything is good.
@@ -249,7 +708,11 @@ class Recipe(ABC):
                 success = True
         else:
             # transfer to target_path
-            hash_input_verify = copyhashfile(temp_path, target_path)
+            hash_input_verify = copyhashfile(
+                temp_path,
+                target_path,
+                checkpoint=checkpoint,
+                offset=resume_offset if resuming else 0)
 
             # Compute the hash of the target path *and* the hash of the
             # input path (you never know) again. We save some time here
@@ -316,13 +779,53 @@ def cleanup_tmp_dirs():
                 )
 
 
+@functools.lru_cache(maxsize=32)
+def get_package_version(name: str) -> str | None:
+    """Return the installed version of a Python package (or None)"""
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+@functools.lru_cache(maxsize=1)
+def get_recipe_registry() -> dict[str, str]:
+    """Return the class paths ("module:Class") of all registered recipes
+
+    This includes the :const:`BUILTIN_RECIPES` and third-party recipes
+    registered via the :const:`RECIPE_ENTRY_POINT_GROUP` entry point
+    group. No recipe module is imported.
+    """
+    registry = {name: path for name, (path, _) in BUILTIN_RECIPES.items()}
+    for ep in metadata.entry_points(group=RECIPE_ENTRY_POINT_GROUP):
+        if ep.name in registry:
+            logger.warning(f"Ignoring recipe entry point {ep.value}, "
+                           f"'{ep.name}' is already registered")
+        else:
+            registry[ep.name] = ep.value
+    return registry
+
+
 def get_available_recipe_names() -> list[str]:
-    names = []
+    names = set(get_recipe_registry())
+    # recipes defined at runtime
     for cls in Recipe.__subclasses__():
-        names.append(map_class_to_recipe_name(cls))
+        names.add(map_class_to_recipe_name(cls))
     return sorted(names)
 
 
+def get_recipe_description(recipe_name: str) -> str:
+    """Return a one-line description of a recipe
+
+    For the built-in recipes, this does not import the recipe module.
+    """
+    for name, (_, description) in BUILTIN_RECIPES.items():
+        if name.lower() == recipe_name.lower():
+            return description
+    cls = map_recipe_name_to_class(recipe_name)
+    return (cls.__doc__ or "").strip().split("\n")[0]
+
+
 def map_class_to_recipe_name(cls: Type[Recipe]) -> str:
     cls_name = cls.__name__
     assert cls_name.endswith("Recipe")
@@ -330,8 +833,13 @@ def map_class_to_recipe_name(cls: Type[Recipe]) -> str:
 
 
 def map_recipe_name_to_class(recipe_name: str) -> Type[Recipe]:
+    """Return the recipe class, importing its module if necessary"""
     for cls in Recipe.__subclasses__():
         if cls.__name__.lower() == recipe_name.lower() + "recipe":
             return cls
-    else:
-        raise KeyError(f"Could not find class recipe for '{recipe_name}'!")
+    for name, path in get_recipe_registry().items():
+        if name.lower() == recipe_name.lower():
+            module_name, _, class_name = path.partition(":")
+            module = importlib.import_module(module_name)
+            return getattr(module, class_name)
+    raise KeyError(f"Could not find class recipe for '{recipe_name}'!")
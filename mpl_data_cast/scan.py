@@ -0,0 +1,379 @@
+"""Cached scanning of directory trees"""
+import concurrent.futures
+import fnmatch
+import functools
+import logging
+import os
+import pathlib
+import threading
+import time
+from typing import Callable, List, NamedTuple
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Directory listings that were modified less than this number of
+#: seconds before they were scanned are not cached, because some file
+#: systems only have a coarse modification time resolution
+RACY_INTERVAL = 2.0
+
+#: Maximum number of directories listed concurrently
+CRAWL_MAX_WORKERS = 16
+
+
+class DirListing(NamedTuple):
+    #: modification time of the directory (None if not cacheable)
+    mtime_ns: int | None
+    #: tuples (name, size, mtime_ns) of the files in the directory
+    files: List[tuple]
+    #: names of the subdirectories
+    dirs: List[str]
+
+
+class TreeScanCache:
+    def __init__(self):
+        """Directory listings cached and validated by modification time
+
+        Adding, removing, or renaming an entry of a directory changes
+        its modification time, so only those directories of a tree
+        that changed since the last scan are listed again. Files that
+        are modified in place (e.g. while data are written to them)
+        do not change the modification time of their directory; call
+        :func:`invalidate` in that case.
+        """
+        self._listings = {}
+        self.lock = threading.Lock()
+
+    def clear(self):
+        """Remove all cached directory listings"""
+        with self.lock:
+            self._listings.clear()
+
+    def invalidate(self, path: str | pathlib.Path):
+        """Remove the cached listing of a directory"""
+        with self.lock:
+            self._listings.pop(pathlib.Path(path), None)
+
+    def list_directory(self,
+                       path: pathlib.Path,
+                       refresh: bool = False) -> DirListing:
+        """Return the (cached) listing of a directory
+
+        Symbolic links to directories are not followed and broken
+        symbolic links are ignored. Directories that cannot be
+        listed are treated as empty. If `refresh` is set, the
+        directory is listed again regardless of the cached listing
+        (e.g. on file systems with unreliable modification times,
+        such as FAT/exFAT or SMB shares).
+        """
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except OSError:
+            logger.warning(f"Cannot stat directory: '{path}'")
+            return DirListing(None, [], [])
+        with self.lock:
+            cached = self._listings.get(path)
+        if (not refresh
+                and cached is not None and cached.mtime_ns == mtime_ns):
+            return cached
+
+        files = []
+        dirs = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                dirs.append(entry.name)
+                        else:
+                            # `DirEntry.stat` is free on Windows
+                            st = entry.stat()
+                            files.append(
+                                (entry.name, st.st_size, st.st_mtime_ns))
+                    except OSError:
+                        logger.warning(
+                            f"Could not stat {path / entry.name}")
+        except OSError:
+            logger.warning(f"Cannot list directory: '{path}'")
+            return DirListing(None, [], [])
+
+        files.sort()
+        dirs.sort()
+        if time.time_ns() - mtime_ns < RACY_INTERVAL * 1e9:
+            # the directory might change within its mtime resolution
+            listing = DirListing(None, files, dirs)
+        else:
+            listing = DirListing(mtime_ns, files, dirs)
+        with self.lock:
+            self._listings[path] = listing
+        return listing
+
+    def walk(self,
+             path: str | pathlib.Path,
+             abort: Callable = None,
+             refresh: bool = False):
+        """Yield tuples (directory path, listing) of a directory tree
+
+        The directories are listed concurrently by a bounded thread
+        pool (see :const:`CRAWL_MAX_WORKERS`), because on network
+        shares every listing is a round trip to the server. Listing
+        continues in the background while the caller processes the
+        results. The directories are yielded in the order in which
+        they were listed.
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            root directory of the tree
+        abort: Callable
+            stop walking when this function returns True
+        refresh: bool
+            list all directories again (see :func:`list_directory`)
+        """
+        path = pathlib.Path(path)
+        if refresh:
+            list_directory = functools.partial(self.list_directory,
+                                               refresh=True)
+        else:
+            list_directory = self.list_directory
+        pending = {}
+        try:
+            pending[_crawl_pool.submit(list_directory, path)] = path
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    pdir = pending.pop(future)
+                    listing = future.result()
+                    for name in listing.dirs:
+                        psub = pdir / name
+                        pending[_crawl_pool.submit(list_directory,
+                                                   psub)] = psub
+                    if abort is not None and abort():
+                        return
+                    yield pdir, listing
+        except RuntimeError:
+            # `submit` fails when the interpreter is shutting down
+            # while the tree is scanned in a background thread
+            logger.info(f"Scan of {path} interrupted")
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def index(self, path: str | pathlib.Path) -> dict:
+        """Return the names of the files of all directories in a tree
+
+        Returns a dictionary that maps each directory
+        (`pathlib.Path`, including `path`) to the sorted list of the
+        names of the files it contains.
+        """
+        return {pdir: [name for name, _, _ in listing.files]
+                for pdir, listing in self.walk(path)}
+
+    def iter_entries(self,
+                     path: str | pathlib.Path,
+                     ignored_names: List[str] = None,
+                     pattern: str = None,
+                     refresh: bool = False):
+        """Yield tuples (path, size, mtime_ns) of the files in a tree
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            root directory of the tree
+        ignored_names: list of str
+            names of files that are ignored
+        pattern: str
+            only yield files whose names match this shell-style
+            wildcard pattern (e.g. "*.rtdc")
+        refresh: bool
+            list all directories again (see :func:`list_directory`)
+        """
+        ignored_names = set(ignored_names or [])
+        for pdir, listing in self.walk(path, refresh=refresh):
+            for name, size, mtime_ns in listing.files:
+                if name in ignored_names:
+                    continue
+                if pattern is not None and not fnmatch.fnmatch(name,
+                                                               pattern):
+                    continue
+                yield pdir / name, size, mtime_ns
+
+    def iter_files(self,
+                   path: str | pathlib.Path,
+                   ignored_names: List[str] = None,
+                   pattern: str = None,
+                   refresh: bool = False):
+        """Yield the paths of the files in a tree
+
+        See :func:`iter_entries` for the parameters.
+        """
+        for pp, _, _ in self.iter_entries(path, ignored_names, pattern,
+                                          refresh):
+            yield pp
+
+    def count(self,
+              path: str | pathlib.Path,
+              ignored_names: List[str] = None,
+              abort: Callable = None,
+              callback: Callable = None) -> tuple:
+        """Return the number and total size of the files in a tree
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            root directory of the tree
+        ignored_names: list of str
+            names of files that are not counted
+        abort: Callable
+            stop counting when this function returns True
+        callback: Callable
+            called with the intermediate number of files and their
+            size after each directory
+        """
+        ignored_names = set(ignored_names or [])
+        num = 0
+        size = 0
+        for _, listing in self.walk(path, abort=abort):
+            for name, fsize, _ in listing.files:
+                if name not in ignored_names:
+                    num += 1
+                    size += fsize
+            if callback is not None:
+                callback(num, size)
+        return num, size
+
+
+class TreeScanService(threading.Thread):
+    def __init__(self, cache: TreeScanCache = None, *args, **kwargs):
+        """Count the files in directory trees in the background
+
+        Clients submit count requests via :func:`request`. A new
+        request of a client supersedes its previous one. The thread
+        sleeps until there is something to count.
+        """
+        super(TreeScanService, self).__init__(*args, **kwargs)
+        self.daemon = True
+        #: directory listing cache
+        self.cache = cache if cache is not None else SCAN_CACHE
+        self.must_break = False
+        self._jobs = {}
+        self._pending = []
+        self._wake = threading.Event()
+        self.lock = threading.Lock()
+
+    def request(self,
+                client: object,
+                path: pathlib.Path,
+                ignored_names: List[str],
+                callback: Callable):
+        """Count the files in `path` for `client`
+
+        `callback` is called with the number of files, their total
+        size, and whether counting is complete.
+        """
+        job = (path, ignored_names, callback)
+        with self.lock:
+            self._jobs[client] = job
+            if client not in self._pending:
+                self._pending.append(client)
+        self._wake.set()
+
+    def cancel(self, client: object):
+        """Cancel the current request of `client`"""
+        with self.lock:
+            self._jobs.pop(client, None)
+            if client in self._pending:
+                self._pending.remove(client)
+
+    def stop(self):
+        """Stop the thread"""
+        self.must_break = True
+        self._wake.set()
+
+    def run(self):
+        while not self.must_break:
+            self._wake.wait()
+            self._wake.clear()
+            self.process_pending()
+
+    def process_pending(self):
+        """Process all pending requests
+
+        The requests are processed concurrently (one directory at a
+        time per request), so that counting a large tree does not
+        delay counting a small one.
+        """
+        active = {}
+        while not self.must_break:
+            with self.lock:
+                for client in self._pending:
+                    job = self._jobs[client]
+                    active[client] = (job, self.process(job), (0, 0))
+                self._pending.clear()
+                for client in list(active):
+                    if self._jobs.get(client) is not active[client][0]:
+                        # superseded or cancelled (stop listing)
+                        active.pop(client)[1].close()
+            if not active:
+                break
+            for client, (job, steps, counts) in list(active.items()):
+                try:
+                    active[client] = (job, steps, next(steps))
+                except StopIteration:
+                    self._finish(client, job)
+                    active.pop(client)
+                except BaseException:
+                    # Do not let one job (e.g. a directory that vanished
+                    # or a failing callback) stop the service.
+                    logger.exception(f"Failed to count files in {job[0]}")
+                    self._finish(client, job)
+                    active.pop(client)
+                    try:
+                        job[2](*counts, True)
+                    except BaseException:
+                        logger.exception("Scan service callback failed")
+        for _, steps, _ in active.values():
+            steps.close()
+
+    def _finish(self, client, job):
+        """Remove a finished job (unless it was superseded)"""
+        with self.lock:
+            if self._jobs.get(client) is job:
+                self._jobs.pop(client)
+
+    def process(self, job):
+        """Count the files of a job, one directory per iteration
+
+        Yields the intermediate number of files and their size.
+        """
+        path, ignored_names, callback = job
+        ignored_names = set(ignored_names)
+        num = 0
+        size = 0
+        for _, listing in self.cache.walk(path):
+            for name, fsize, _ in listing.files:
+                if name not in ignored_names:
+                    num += 1
+                    size += fsize
+            callback(num, size, False)
+            yield num, size
+        callback(num, size, True)
+
+
+#: Thread pool listing directories (shared by all scans)
+_crawl_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=CRAWL_MAX_WORKERS, thread_name_prefix="MPLDCCrawler")
+
+#: Directory listing cache shared by all scans
+SCAN_CACHE = TreeScanCache()
+
+
+@functools.lru_cache(maxsize=1)
+def get_scan_service() -> TreeScanService:
+    """Return the (running) scan service shared by all clients"""
+    service = TreeScanService(cache=SCAN_CACHE)
+    service.start()
+    return service
@@ -9,6 +9,8 @@ import time
 import traceback
 from typing import Callable
 
+from .control import CastCancelled
+
 
 DEFAULT_BLOCK_SIZE = 4 * (1024 ** 2)
 logger = logging.getLogger(__name__)
@@ -51,7 +53,9 @@ class HasherThread(threading.Thread):
 def copyhashfile(path_in: str | pathlib.Path,
                  path_out: str | pathlib.Path,
                  blocksize: int = DEFAULT_BLOCK_SIZE,
-                 constructor: Callable = hashlib.md5) -> str:
+                 constructor: Callable = hashlib.md5,
+                 checkpoint: Callable = None,
+                 offset: int = 0) -> str:
     """Copy a file while computing its md5sum
 
     This is the critical code in MPLDC that performs actual
@@ -69,17 +73,47 @@ def copyhashfile(path_in: str | pathlib.Path,
         Number of bytes to copy at once
     constructor:
         Which hash to use
+    checkpoint: Callable
+        Called with the number of bytes copied after every block;
+        may block (pause) or raise
+        :class:`mpl_data_cast.control.CastCancelled` (cancel), in
+        which case the partial output file is kept (the same applies
+        to a `KeyboardInterrupt`, which is not retried)
+    offset: int
+        Resume a partial copy; the first `offset` bytes of `path_out`
+        are assumed to be identical to those of `path_in`
     """
-    hasher = constructor()
+    path_in = pathlib.Path(path_in)
+    path_out = pathlib.Path(path_out)
     num_retries = 3
     for ii in range(num_retries):
+        hasher = constructor()
         try:
-            with path_in.open('rb') as fd, path_out.open("wb") as fo:
+            if offset:
+                # hash the part that was already copied
+                with path_in.open('rb') as fd:
+                    remaining = offset
+                    while remaining and (
+                            buf := fd.read(min(blocksize, remaining))):
+                        hasher.update(buf)
+                        remaining -= len(buf)
+            with path_in.open('rb') as fd, \
+                    path_out.open("r+b" if offset else "wb") as fo:
+                fd.seek(offset)
+                fo.seek(offset)
+                fo.truncate()
+                copied = offset
                 while buf := fd.read(blocksize):
                     hasher.update(buf)
                     fo.write(buf)
+                    copied += len(buf)
+                    if checkpoint is not None:
+                        checkpoint(copied)
+        except (CastCancelled, KeyboardInterrupt):
+            raise
         except BaseException:
             path_out.unlink(missing_ok=True)
+            offset = 0
             logger.error(traceback.format_exc())
             logger.error(f"Retrying {ii+1}/{num_retries}")
             time.sleep(5)
@@ -99,6 +133,49 @@ def copyhashfile(path_in: str | pathlib.Path,
     return hasher.hexdigest()
 
 
+def writehashbuffer(data: bytes | memoryview,
+                    path_out: str | pathlib.Path,
+                    blocksize: int = DEFAULT_BLOCK_SIZE,
+                    constructor: Callable = hashlib.md5) -> str:
+    """Write data from memory to a file while computing its md5sum
+
+    This is the in-memory equivalent of :func:`copyhashfile`.
+
+    Parameters
+    ----------
+    data:
+        Data to write (e.g. `io.BytesIO.getbuffer()`)
+    path_out:
+        Output path
+    blocksize: int
+        Number of bytes to write at once
+    constructor:
+        Which hash to use
+    """
+    path_out = pathlib.Path(path_out)
+    data = memoryview(data).cast("B")
+    num_retries = 3
+    for ii in range(num_retries):
+        hasher = constructor()
+        try:
+            with path_out.open("wb") as fo:
+                for start in range(0, len(data), blocksize):
+                    buf = data[start:start + blocksize]
+                    hasher.update(buf)
+                    fo.write(buf)
+        except BaseException:
+            path_out.unlink(missing_ok=True)
+            logger.error(traceback.format_exc())
+            logger.error(f"Retrying {ii+1}/{num_retries}")
+            time.sleep(5)
+            continue
+        else:
+            break
+    else:
+        raise ValueError(f"Failed to write {path_out}")
+    return hasher.hexdigest()
+
+
 def hashfile(fname: str | pathlib.Path,
              blocksize: int = DEFAULT_BLOCK_SIZE,
              count: int = 0,
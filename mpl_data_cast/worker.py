@@ -0,0 +1,354 @@
+"""Run casts in a supervised subprocess"""
+import logging
+import multiprocessing
+import pathlib
+import threading
+import time
+import traceback
+from typing import Callable, List
+
+import psutil
+
+from .control import CastControl
+from .recipe import map_recipe_name_to_class
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Interval (in seconds) at which the worker reports its state and
+#: the supervisor checks the worker process
+POLL_INTERVAL = 0.1
+
+
+class CastWorker:
+    def __init__(self,
+                 recipe_name: str,
+                 path_raw: str | pathlib.Path,
+                 path_tar: str | pathlib.Path,
+                 max_rss: int = None,
+                 cpu_affinity: List[int] = None,
+                 max_restarts: int = 3):
+        """Run :func:`mpl_data_cast.recipe.Recipe.cast` in a subprocess
+
+        A crash or memory exhaustion in the (native) conversion code
+        only affects the worker process, which is then restarted.
+        The dataset that was processed when the worker died is
+        recorded as an error and skipped by the restarted worker.
+        Before restarting, a checkpoint is written, so that the
+        restarted cast skips all datasets and files that were already
+        transferred (see :func:`mpl_data_cast.recipe.Recipe.cast`).
+
+        Parameters
+        ----------
+        recipe_name: str
+            name of the recipe (see
+            :func:`mpl_data_cast.recipe.get_available_recipe_names`)
+        path_raw: str or pathlib.Path
+            directory tree containing raw experimental data
+        path_tar: str or pathlib.Path
+            target directory for converted data
+        max_rss: int
+            maximum resident set size of the worker process in bytes;
+            the worker is killed and restarted if it uses more memory
+        cpu_affinity: list of int
+            CPUs the worker process may run on (not supported on macOS)
+        max_restarts: int
+            maximum number of times the worker is restarted if the
+            worker died before it processed a dataset (restarts that
+            skip a dataset are not limited)
+        """
+        self.recipe_name = recipe_name
+        self.path_raw = pathlib.Path(path_raw)
+        self.path_tar = pathlib.Path(path_tar)
+        self.max_rss = max_rss
+        self.cpu_affinity = cpu_affinity
+        self.max_restarts = max_restarts
+        #: relative conversion cost of the recipe
+        self.conversion_cost = \
+            map_recipe_name_to_class(recipe_name).conversion_cost
+        #: stage of the cast in the worker process (see `Recipe.stage`)
+        self.stage = None
+        #: state of the cast in the worker process (only the "current"
+        #: path and offset of `Recipe.checkpoint_state` are mirrored)
+        self.checkpoint_state = {"current": None}
+        #: the current worker process
+        self.process = None
+
+    def __repr__(self):
+        return f"<CastWorker {self.recipe_name} {self.path_raw}>"
+
+    def cast(self, path_callback: Callable = None,
+             control: CastControl = None,
+             error_callback: Callable = None,
+             **kwargs) -> dict:
+        """Cast the data tree in a worker process
+
+        The parameters and the returned dictionary are the same as
+        for :func:`mpl_data_cast.recipe.Recipe.cast`. Each crash of
+        the worker process is recorded in the "errors" of the result.
+        """
+        control = control if control is not None else CastControl()
+        errors = []
+        # datasets reported to `path_callback`
+        seen = set()
+        # datasets with errors (not cast again by a restarted worker)
+        skip = set()
+        failures = 0
+
+        def on_error(path, tb):
+            errors.append((path, tb))
+            skip.add(path)
+            if error_callback is not None:
+                error_callback(path, tb)
+
+        while True:
+            num_errors = len(errors)
+            result, crash = self.run_worker(path_callback=path_callback,
+                                            control=control,
+                                            error_callback=on_error,
+                                            seen=seen,
+                                            skip=skip,
+                                            kwargs=kwargs)
+            if result is not None:
+                # (the errors of this worker were already reported)
+                result["errors"] = errors[:num_errors] + result["errors"]
+                result["success"] = result["success"] and not errors
+                return result
+            logger.error(f"Cast worker failed: {crash[1]}")
+            path = crash[0]
+            if path is None or path in skip:
+                # The worker did not get to the next dataset.
+                path = None
+                failures += 1
+            on_error(*crash)
+            if control.cancelled or failures > self.max_restarts:
+                break
+            self.save_checkpoint(completed=seen - skip - {path},
+                                 kwargs=kwargs)
+            logger.warning(f"Restarting cast worker ({len(errors)} errors)")
+        return {"success": False,
+                "cancelled": control.cancelled,
+                "errors": errors,
+                "message": "The cast worker process failed "
+                           f"{failures} times."}
+
+    def save_checkpoint(self, completed, kwargs):
+        """Write the checkpoint file for a restarted worker
+
+        Parameters
+        ----------
+        completed: set of pathlib.Path
+            first paths of the datasets and files transferred
+        kwargs: dict
+            keyword arguments of the cast
+        """
+        rp = map_recipe_name_to_class(self.recipe_name)(self.path_raw,
+                                                        self.path_tar)
+        prev_completed, _ = rp.load_checkpoint(**kwargs)
+        rp.checkpoint_state = {
+            "kwargs": kwargs,
+            "completed": prev_completed | {rp.get_relative_path(pp)
+                                           for pp in completed},
+            "current": None}
+        rp.save_checkpoint()
+
+    def run_worker(self, path_callback, control, error_callback, seen,
+                   skip, kwargs):
+        """Start a worker process and wait until it finished
+
+        Returns a tuple (result, crash), where `result` is the result
+        dictionary of the cast (None if the worker died) and `crash`
+        is a tuple (path being processed, reason) if the worker died.
+        """
+        ctx = multiprocessing.get_context("spawn")
+        conn, child_conn = ctx.Pipe()
+        process = ctx.Process(target=worker_main,
+                              args=(child_conn,
+                                    self.recipe_name,
+                                    str(self.path_raw),
+                                    str(self.path_tar),
+                                    kwargs,
+                                    self.cpu_affinity,
+                                    sorted(str(pp) for pp in skip)),
+                              name="MPLDCCastWorker",
+                              daemon=True)
+        process.start()
+        child_conn.close()
+        self.process = process
+        ps = psutil.Process(process.pid)
+        current = None
+        paused = False
+        cancel_sent = False
+        time_check = 0
+        try:
+            while True:
+                # forward pause/resume/cancel to the worker
+                try:
+                    if control.cancelled and not cancel_sent:
+                        conn.send(("cancel",))
+                        cancel_sent = True
+                    elif control.paused != paused:
+                        paused = control.paused
+                        conn.send(("pause",) if paused else ("resume",))
+                except OSError:
+                    pass  # worker died
+
+                if conn.poll(POLL_INTERVAL):
+                    try:
+                        message = conn.recv()
+                    except EOFError:
+                        process.join()
+                        return None, (current, "The worker process exited "
+                                               f"({process.exitcode}).")
+                    if message[0] == "dataset":
+                        _, paths, self.stage = message
+                        path_list = [pathlib.Path(pp) for pp in paths]
+                        current = path_list[0]
+                        if current not in seen:
+                            # not reported by a previous worker
+                            seen.add(current)
+                            if path_callback is not None:
+                                path_callback(path_list)
+                    elif message[0] == "error":
+                        _, path, tb = message
+                        error_callback(pathlib.Path(path), tb)
+                    elif message[0] == "state":
+                        _, self.stage, state = message
+                        if state is not None:
+                            state = (pathlib.Path(state[0]), state[1])
+                        self.checkpoint_state["current"] = state
+                    elif message[0] == "result":
+                        result = message[1]
+                        result["errors"] = [(pathlib.Path(pp), tb)
+                                            for pp, tb in result["errors"]]
+                        return result, None
+                elif not process.is_alive():
+                    return None, (current, "The worker process exited "
+                                           f"({process.exitcode}).")
+
+                now = time.monotonic()
+                if self.max_rss and now - time_check > POLL_INTERVAL:
+                    time_check = now
+                    try:
+                        rss = ps.memory_info().rss
+                    except psutil.Error:
+                        continue
+                    if rss > self.max_rss:
+                        process.kill()
+                        return None, (current,
+                                      f"The worker process exceeded the "
+                                      f"memory limit ({rss} > "
+                                      f"{self.max_rss} bytes).")
+        finally:
+            self.stage = None
+            conn.close()
+            if process.is_alive():
+                process.kill()
+            process.join()
+            self.process = None
+
+
+def worker_main(conn, recipe_name, path_raw, path_tar, kwargs,
+                cpu_affinity=None, skip_paths=None):
+    """Entry point of the worker process (see :class:`CastWorker`)"""
+    if cpu_affinity:
+        try:
+            psutil.Process().cpu_affinity(list(cpu_affinity))
+        except (AttributeError, OSError, ValueError):
+            logger.warning(f"Could not set CPU affinity {cpu_affinity}")
+
+    rcls = map_recipe_name_to_class(recipe_name)
+    rp = rcls(path_raw, path_tar)
+    control = CastControl()
+    send_lock = threading.Lock()
+    done = threading.Event()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def handle(command):
+        if command == "cancel":
+            control.cancel()
+        elif command == "pause":
+            control.pause()
+        elif command == "resume":
+            control.resume()
+
+    def listen():
+        while True:
+            try:
+                handle(conn.recv()[0])
+            except (EOFError, OSError):
+                # the supervisor is gone
+                control.cancel()
+                break
+
+    def report():
+        last = None
+        while not done.wait(POLL_INTERVAL):
+            state = rp.checkpoint_state
+            current = state.get("current") if state else None
+            if current is not None:
+                current = (str(current[0]), current[1])
+            if (rp.stage, current) != last:
+                last = (rp.stage, current)
+                send(("state", rp.stage, current))
+
+    def path_callback(path_list):
+        send(("dataset", [str(pp) for pp in path_list], rp.stage))
+
+    def error_callback(path, tb):
+        send(("error", str(path), tb))
+
+    # commands sent before the worker was ready
+    while conn.poll():
+        handle(conn.recv()[0])
+    threading.Thread(target=listen, daemon=True).start()
+    threading.Thread(target=report, daemon=True).start()
+
+    try:
+        result = rp.cast(path_callback=path_callback,
+                         control=control,
+                         error_callback=error_callback,
+                         skip_paths={pathlib.Path(pp)
+                                     for pp in skip_paths or []},
+                         **kwargs)
+    except BaseException:
+        result = {"success": False,
+                  "cancelled": False,
+                  "errors": [],
+                  "message": traceback.format_exc()}
+    finally:
+        done.set()
+    result["errors"] = [(str(pp), tb) for pp, tb in result["errors"]]
+    send(("result", result))
+    conn.close()
+
+
+def get_default_cpu_affinity(num_cpus: int = 0) -> List[int] | None:
+    """Return the CPUs for a worker process
+
+    Parameters
+    ----------
+    num_cpus: int
+        number of CPUs; if set to 0, all CPUs available to this
+        process except the first one (which is left for the user
+        interface) are used
+
+    Returns
+    -------
+    cpu_affinity: list of int or None
+        None if CPU affinity is not supported (macOS) or if there
+        is only one CPU
+    """
+    try:
+        cpus = psutil.Process().cpu_affinity()
+    except (AttributeError, OSError):
+        return None
+    if len(cpus) < 2:
+        return None
+    if num_cpus <= 0:
+        return cpus[1:]
+    return cpus[-num_cpus:]
@@ -0,0 +1,94 @@
+import json
+import pathlib
+import tempfile
+from unittest import mock
+
+from click.testing import CliRunner
+
+from mpl_data_cast.cli import cli
+from mpl_data_cast.mod_recipes import CatchAllRecipe
+
+
+def make_input():
+    tmpdir = pathlib.Path(tempfile.mkdtemp(prefix="cli"))
+    one = tmpdir / "input" / "folder" / "a.txt"
+    one.parent.mkdir(parents=True)
+    one.write_text("hello testing world")
+    two = tmpdir / "input" / "1.txt"
+    two.write_text("Another file!")
+    return tmpdir / "input", tmpdir / "output"
+
+
+def test_cast_json_events_stdout():
+    path_raw, target = make_input()
+    res = CliRunner().invoke(cli.cli, ["cast", "--json-events", "-",
+                                       str(path_raw), str(target)])
+    assert res.exit_code == 0
+    # stdout contains only JSON events
+    events = [json.loads(line) for line in res.output.splitlines()]
+    assert [ev["event"] for ev in events] == [
+        "start",
+        "dataset_start", "dataset_end",
+        "dataset_start", "dataset_end",
+        "end"]
+    assert events[0]["recipe"] == "CatchAll"
+    assert events[0]["path_raw"] == str(path_raw)
+    paths = sorted(ev["path"] for ev in events if ev["event"] == "dataset_end")
+    assert paths == [str(path_raw / "1.txt"),
+                     str(path_raw / "folder" / "a.txt")]
+    assert events[-1]["success"]
+    assert events[-1]["datasets"] == 2
+    assert events[-1]["bytes"] == 32
+    assert events[-1]["exit_code"] == 0
+    assert (target / "1.txt").read_text() == "Another file!"
+
+
+def test_cast_json_events_file_errors(tmp_path):
+    path_raw, target = make_input()
+    path_events = tmp_path / "events.ndjson"
+
+    def convert_dataset(self, path_list, temp_path, **kwargs):
+        raise ValueError("Unknown format")
+
+    with mock.patch.object(CatchAllRecipe, "convert_dataset",
+                           convert_dataset):
+        res = CliRunner().invoke(cli.cli, ["cast",
+                                           "--json-events", str(path_events),
+                                           "--non-interactive",
+                                           str(path_raw), str(target)])
+    assert res.exit_code == cli.EXIT_ERRORS
+    # human-readable output (without prompt)
+    assert "Errors encountered" in res.output
+    assert "mpldc-dump.txt" not in res.output
+    events = [json.loads(line)
+              for line in path_events.read_text().splitlines()]
+    # errors are written when they occur
+    assert [ev["event"] for ev in events] == [
+        "start",
+        "dataset_start", "error", "dataset_end",
+        "dataset_start", "error", "dataset_end",
+        "end"]
+    errors = [ev for ev in events if ev["event"] == "error"]
+    assert "ValueError: Unknown format" in errors[0]["traceback"]
+    assert not any(ev["success"] for ev in events
+                   if ev["event"] == "dataset_end")
+    assert events[-1]["event"] == "end"
+    assert not events[-1]["success"]
+    assert events[-1]["errors"] == 2
+    assert events[-1]["bytes"] == 0
+    assert events[-1]["exit_code"] == cli.EXIT_ERRORS
+
+
+def test_json_event_callback_missing_file(tmp_path):
+    path_events = tmp_path / "events.ndjson"
+    (tmp_path / "data.txt").write_text("data")
+    with path_events.open("w") as fd:
+        events = cli.JSONEventCallback(fd)
+        # optional companion files may not exist
+        events([tmp_path / "data.txt", tmp_path / "missing.ini"])
+        events.finish({"success": True, "errors": []}, exit_code=0)
+    events = [json.loads(line)
+              for line in path_events.read_text().splitlines()]
+    assert events[0]["size"] == 4
+    assert events[1]["event"] == "dataset_end"
+    assert events[1]["success"]
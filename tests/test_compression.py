@@ -0,0 +1,69 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from mpl_data_cast import compression
+from mpl_data_cast.compression import (
+    COMPRESSION_PRESETS, DEFAULT_COMPRESSION, get_compression_codec,
+    get_compression_kwargs, is_compressed
+)
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESSION_PRESETS))
+def test_compression_presets_roundtrip(compression, tmp_path):
+    data = np.arange(200 * 300, dtype=np.uint16).reshape(200, 300)
+    with h5py.File(tmp_path / "test.h5", "w") as h5:
+        h5.create_dataset("data",
+                          data=data,
+                          chunks=data.shape,
+                          fletcher32=True,
+                          **get_compression_kwargs(compression))
+    with h5py.File(tmp_path / "test.h5") as h5:
+        assert np.all(h5["data"][:] == data)
+
+
+def test_compression_default():
+    assert DEFAULT_COMPRESSION in COMPRESSION_PRESETS
+    assert get_compression_kwargs() == get_compression_kwargs("balanced")
+
+
+def test_compression_kwargs_copy():
+    kw = get_compression_kwargs("gzip")
+    kw["compression_opts"] = 1
+    assert get_compression_kwargs("gzip")["compression_opts"] == 9
+
+
+def test_compression_invalid():
+    with pytest.raises(ValueError, match="Unknown compression preset"):
+        get_compression_kwargs("peter")
+
+
+def test_is_compressed(tmp_path):
+    with h5py.File(tmp_path / "test.h5", "w") as h5:
+        for name in COMPRESSION_PRESETS:
+            h5.create_dataset(name, data=np.arange(100),
+                              **get_compression_kwargs(name))
+        h5.create_dataset("lzf", data=np.arange(100), compression="lzf")
+        assert is_compressed(h5["balanced"])
+        assert is_compressed(h5["gzip"])
+        assert not is_compressed(h5["none"])
+        assert not is_compressed(h5["lzf"])
+        assert get_compression_codec(h5["balanced"]) == "Blosc2"
+        assert get_compression_codec(h5["gzip"]) == "gzip"
+        assert get_compression_codec(h5["lzf"]) is None
+
+
+def test_set_blosc_threads(monkeypatch):
+    monkeypatch.delenv("BLOSC_NTHREADS", raising=False)
+    monkeypatch.setattr(compression, "USER_BLOSC_NTHREADS", None)
+    compression.set_blosc_threads(3)
+    assert os.environ["BLOSC_NTHREADS"] == "3"
+    compression.set_blosc_threads()
+    assert os.environ["BLOSC_NTHREADS"] == str(compression.get_num_threads())
+    # the user setting takes precedence
+    monkeypatch.setattr(compression, "USER_BLOSC_NTHREADS", "2")
+    monkeypatch.setenv("BLOSC_NTHREADS", "2")
+    compression.set_blosc_threads(5)
+    assert os.environ["BLOSC_NTHREADS"] == "2"
@@ -1,4 +1,7 @@
 """basic tests"""
+import os
+import subprocess
+import sys
 from unittest import mock
 
 from PyQt6 import QtCore, QtTest, QtWidgets
@@ -9,6 +12,12 @@ from mpl_data_cast.gui.widget_output import OutputWidget
 from mpl_data_cast.gui.widget_input import InputWidget
 
 
+#: Maximum time (in seconds) for showing the main window; only checked
+#: if set via the environment variable, because wall-clock times are
+#: unreliable on loaded CI runners (e.g. "MPLDC_STARTUP_BUDGET=3.0")
+STARTUP_BUDGET = os.environ.get("MPLDC_STARTUP_BUDGET")
+
+
 def test_simple(qtbot):
     """Open the main window and close it again, check that some basic
     attributes exist."""
@@ -42,3 +51,27 @@ def test_on_action_about(qtbot):
         assert mock_about.call_args.args[1] == \
             f"MPL-Data-Cast {mpl_data_cast.__version__}"
         assert "MPL-Data-Cast" in mock_about.call_args.args[2]
+
+
+def test_startup_time():
+    """The main window must not import heavy modules at startup"""
+    code = "\n".join([
+        "import sys, time",
+        "t0 = time.perf_counter()",
+        "from PyQt6 import QtWidgets",
+        "from mpl_data_cast.gui.main import MPLDataCast",
+        "app = QtWidgets.QApplication(sys.argv)",
+        "mw = MPLDataCast()",
+        "print(time.perf_counter() - t0)",
+        "heavy = ['dclab', 'h5py', 'numpy', 'tifffile']",
+        "print(','.join(m for m in heavy if m in sys.modules))",
+        "mw.close()",
+    ])
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    out = subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                         capture_output=True, text=True).stdout.split("\n")
+    # heavy modules are imported when needed
+    assert out[1] == ""
+    if STARTUP_BUDGET:
+        # regression budget (startup takes about 0.5 s on a laptop)
+        assert float(out[0]) < float(STARTUP_BUDGET)
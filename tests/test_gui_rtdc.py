@@ -2,8 +2,10 @@ from PyQt6 import QtCore, QtTest, QtWidgets
 import pathlib
 import tempfile as tf
 import shutil
+from unittest import mock
 
-from mpl_data_cast.gui.main import MPLDataCast
+from mpl_data_cast.gui.main import CastingCallback, MPLDataCast
+from mpl_data_cast.mod_recipes import CatchAllRecipe
 from helper import retrieve_data
 
 data_path = pathlib.Path(__file__).resolve().parent / "data"
@@ -54,9 +56,15 @@ def test_transfer_data_simple(qtbot, tmp_path, monkeypatch):
     monkeypatch.setattr(QtWidgets.QMessageBox,
                         "information",
                         lambda *args: QtWidgets.QMessageBox.StandardButton.Ok)
-    qtbot.mouseClick(bt, QtCore.Qt.MouseButton.LeftButton)
+    with qtbot.waitSignal(mw.transfer_finished, timeout=60000) as blocker:
+        qtbot.mouseClick(bt, QtCore.Qt.MouseButton.LeftButton)
+    assert blocker.args[0]["success"]
 
     assert (tmp_out / "M001_data.rtdc").exists()
+    # transfer controls are only enabled during a transfer
+    assert not mw.pushButton_pause.isEnabled()
+    assert not mw.pushButton_cancel.isEnabled()
+    assert mw.pushButton_transfer.isEnabled()
 
     mw.close()
     QtTest.QTest.qWait(100)
@@ -104,7 +112,9 @@ def test_transfer_data_advanced(qtbot, tmp_path, monkeypatch):
     monkeypatch.setattr(QtWidgets.QMessageBox,
                         "information",
                         lambda *args: QtWidgets.QMessageBox.StandardButton.Ok)
-    qtbot.mouseClick(bt, QtCore.Qt.MouseButton.LeftButton)
+    with qtbot.waitSignal(mw.transfer_finished, timeout=60000) as blocker:
+        qtbot.mouseClick(bt, QtCore.Qt.MouseButton.LeftButton)
+    assert blocker.args[0]["success"]
 
     assert tmp_file1.exists()
     assert tmp_file2.exists()
@@ -112,3 +122,85 @@ def test_transfer_data_advanced(qtbot, tmp_path, monkeypatch):
     QtTest.QTest.qWait(100)
     QtWidgets.QApplication.processEvents(
         QtCore.QEventLoop.ProcessEventsFlag.AllEvents, 5000)
+
+
+def test_tree_object_counter(qtbot, tmp_path):
+    """The input widget counts files and their size in the background"""
+    mw = MPLDataCast()
+    qtbot.addWidget(mw)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.txt").write_text("hello")
+    (tmp_path / "b.txt").write_text("world!")
+    (tmp_path / "Thumbs.db").write_text("ignored")
+    mw.widget_input.path = tmp_path
+    counter = mw.widget_input.tree_counter
+    qtbot.waitUntil(lambda: counter.has_counted, timeout=5000)
+    assert counter.num_objects == 2
+    assert counter.size_objects == 11
+    # recount after changes
+    (tmp_path / "sub" / "c.txt").write_text("again")
+    mw.widget_input.trigger_recount_objects()
+    qtbot.waitUntil(lambda: counter.has_counted, timeout=5000)
+    assert counter.num_objects == 3
+    mw.close()
+
+
+def test_tree_object_counter_closed(qtbot, tmp_path):
+    """A closed window does not request any more scans"""
+    mw = MPLDataCast()
+    qtbot.addWidget(mw)
+    mw.widget_input.path = tmp_path
+    mw.close()
+    service = mw.widget_input.tree_counter.service
+    # e.g. `scan_path` queued by `showEvent` before the window was closed
+    mw.widget_input.scan_path()
+    mw.widget_input.tree_counter.reset()
+    assert mw.widget_input.tree_counter not in service._jobs
+
+
+def test_progress_signals_coalesced(qtbot, tmp_path):
+    """Progress signals are emitted by a timer, not for every file"""
+    mw = MPLDataCast()
+    qtbot.addWidget(mw)
+    for ii in range(100):
+        (tmp_path / f"{ii}.txt").write_text("data")
+    rp = CatchAllRecipe(tmp_path, tmp_path / "out")
+    callback = CastingCallback(mw, mw.widget_input.tree_counter, rp)
+    texts = []
+    callback.set_progress_text.connect(texts.append)
+    for ii in range(100):
+        callback([tmp_path / f"{ii}.txt"])
+    assert not texts
+    callback.update_progress()
+    assert len(texts) == 1
+    assert texts[0].startswith(f"Processing {tmp_path / '99.txt'}")
+    # unchanged values are not emitted again
+    callback.emit_changed(callback.set_progress_text, "text")
+    callback.emit_changed(callback.set_progress_text, "text")
+    assert texts[1:] == ["text"]
+    mw.close()
+
+
+def test_progress_moves_during_large_file(qtbot, tmp_path):
+    """The progress bar advances while a large dataset is transferred"""
+    mw = MPLDataCast()
+    qtbot.addWidget(mw)
+    path_raw = tmp_path / "raw"
+    path_raw.mkdir()
+    size = 10 * 1024**2
+    (path_raw / "large.bin").write_bytes(b"\0" * size)
+    rp = CatchAllRecipe(path_raw, tmp_path / "out")
+    callback = CastingCallback(mw, mw.widget_input.tree_counter, rp)
+    callback.progress.total_size = size
+    values = []
+    callback.set_progress_value.connect(values.append)
+
+    def checkpoint(path=None, offset=0):
+        CatchAllRecipe.checkpoint(rp, path, offset)
+        callback.update_progress()
+
+    with mock.patch.object(rp, "checkpoint", side_effect=checkpoint):
+        assert rp.cast(path_callback=callback)["success"]
+    # intermediate values while the file was copied
+    assert [vv for vv in values if 0 < vv < 100]
+    mw.close()
@@ -0,0 +1,100 @@
+import shutil
+
+from PyQt6 import QtCore
+
+from mpl_data_cast.gui.tree_model import DirectoryTreeModel
+from mpl_data_cast.mod_recipes import RTDCRecipe
+
+from helper import retrieve_data
+
+
+def names(model, parent=QtCore.QModelIndex()):
+    return [model.index(row, 0, parent).data()
+            for row in range(model.rowCount(parent))]
+
+
+def test_tree_model_lazy(qtbot, tmp_path):
+    (tmp_path / "b_dir" / "sub").mkdir(parents=True)
+    (tmp_path / "a_dir").mkdir()
+    (tmp_path / "b_dir" / "sub" / "data.txt").write_text("hello")
+    (tmp_path / "a.txt").write_text("world!")
+    model = DirectoryTreeModel()
+    model.set_root_path(tmp_path)
+    qtbot.waitUntil(lambda: model.rowCount() == 3, timeout=5000)
+    # directories first
+    assert names(model) == ["a_dir", "b_dir", "a.txt"]
+    idx_b = model.index(1, 0)
+    # subdirectories are only listed on demand
+    assert model.rowCount(idx_b) == 0
+    assert model.hasChildren(idx_b)
+    assert model.canFetchMore(idx_b)
+    model.fetchMore(idx_b)
+    qtbot.waitUntil(lambda: model.rowCount(idx_b) == 1, timeout=5000)
+    assert names(model, idx_b) == ["sub"]
+    # empty directory
+    idx_a = model.index(0, 0)
+    model.fetchMore(idx_a)
+    qtbot.waitUntil(lambda: not model.hasChildren(idx_a), timeout=5000)
+    # file size and aggregated subtree size
+    qtbot.waitUntil(lambda: bool(model.subtree_sizes), timeout=5000)
+    assert model.index(2, 1).data() == "6 bytes"
+    assert model.index(1, 1).data() == "5 bytes"
+    assert model.parent(model.index(0, 0, idx_b)) == idx_b
+    model.shutdown()
+
+
+def test_tree_model_sort(qtbot, tmp_path):
+    (tmp_path / "a.txt").write_text("a" * 10)
+    (tmp_path / "b.txt").write_text("b" * 30)
+    (tmp_path / "c.txt").write_text("c" * 20)
+    model = DirectoryTreeModel()
+    model.set_root_path(tmp_path)
+    qtbot.waitUntil(lambda: model.rowCount() == 3, timeout=5000)
+    model.sort(1, QtCore.Qt.SortOrder.DescendingOrder)
+    assert names(model) == ["b.txt", "c.txt", "a.txt"]
+    model.sort(0, QtCore.Qt.SortOrder.AscendingOrder)
+    assert names(model) == ["a.txt", "b.txt", "c.txt"]
+    model.shutdown()
+
+
+def test_tree_model_datasets(qtbot, tmp_path):
+    path_in = tmp_path / "in"
+    path_out = tmp_path / "out"
+    data = retrieve_data("rcp_rtdc_mask-contour_2018.zip")
+    shutil.copytree(data, path_in / "one")
+    shutil.copytree(data, path_in / "two")
+    # only one of the datasets has been transferred
+    (path_out / "one").mkdir(parents=True)
+    (path_out / "one" / "M001_data.rtdc").write_text("converted")
+
+    model = DirectoryTreeModel()
+    model.recipe = RTDCRecipe
+    model.target_path = path_out
+    model.set_root_path(path_in)
+    qtbot.waitUntil(lambda: bool(model.dataset_counts), timeout=10000)
+    assert model.dataset_counts[path_in] == 2
+    assert model.transferred_counts[path_in] == 1
+    qtbot.waitUntil(lambda: model.rowCount() == 2, timeout=5000)
+    assert names(model) == ["one", "two"]
+    assert model.index(0, 2).data() == "1 (1 transferred)"
+    assert model.index(1, 2).data() == "1 (0 transferred)"
+    # transferred datasets are highlighted
+    assert model.index(0, 0).data(
+        QtCore.Qt.ItemDataRole.ForegroundRole) is not None
+    assert model.index(1, 0).data(
+        QtCore.Qt.ItemDataRole.ForegroundRole) is None
+    model.shutdown()
+
+
+def test_tree_model_consistency(qtbot, qtmodeltester, tmp_path):
+    (tmp_path / "dir" / "sub").mkdir(parents=True)
+    (tmp_path / "dir" / "sub" / "data.txt").write_text("hello")
+    (tmp_path / "file.txt").write_text("world!")
+    model = DirectoryTreeModel()
+    model.set_root_path(tmp_path)
+    qtbot.waitUntil(lambda: model.rowCount() == 2, timeout=5000)
+    model.fetchMore(model.index(0, 0))
+    qtbot.waitUntil(lambda: model.rowCount(model.index(0, 0)) == 1,
+                    timeout=5000)
+    qtmodeltester.check(model, force_py=True)
+    model.shutdown()
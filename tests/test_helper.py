@@ -0,0 +1,125 @@
+import os
+from unittest import mock
+
+import h5py
+import pytest
+
+from mpl_data_cast.compression import get_compression_kwargs
+from mpl_data_cast.helper import h5_file_contains, probe_h5, write_text_dataset
+
+
+def is_positive(value):
+    return value > 0
+
+
+def test_write_text_dataset_basic(tmp_path):
+    lines = [f"line {ii}" for ii in range(1000)] + ["ümlaut", ""]
+    with h5py.File(tmp_path / "test.h5", "w") as h5:
+        ds = write_text_dataset(h5, "text", lines)
+        assert ds.dtype.itemsize == 100
+        assert ds.fletcher32
+    with h5py.File(tmp_path / "test.h5") as h5:
+        assert [ll.decode("utf-8") for ll in h5["text"][:]] == lines
+
+
+def test_write_text_dataset_append(tmp_path):
+    with h5py.File(tmp_path / "test.h5", "w") as h5:
+        write_text_dataset(h5, "text", ["peter", "hans"])
+        write_text_dataset(h5, "text", ["gustav"], mode="append")
+        assert list(h5["text"][:]) == [b"peter", b"hans", b"gustav"]
+        # longer lines than the current dataset allows
+        write_text_dataset(h5, "text", ["x" * 200], mode="append")
+        assert list(h5["text"][:]) == [b"peter", b"hans", b"gustav",
+                                       b"x" * 200]
+        # append to a non-existent dataset
+        write_text_dataset(h5, "other", "single line", mode="append")
+        assert list(h5["other"][:]) == [b"single line"]
+
+
+def test_write_text_dataset_append_long_lines(tmp_path):
+    lines = []
+    with h5py.File(tmp_path / "test.h5", "w") as h5:
+        write_text_dataset(h5, "text", ["short"], mode="append")
+        lines.append(b"short")
+        for ii in range(1, 20):
+            line = b"x" * 100 * ii
+            write_text_dataset(h5, "text", [line], mode="append")
+            lines.append(line)
+        assert list(h5["text"][:]) == lines
+        # still a compressed fixed-length string dataset
+        assert h5["text"].dtype.kind == "S"
+        assert h5["text"].dtype.itemsize >= 1900
+        assert h5["text"].fletcher32
+        # no temporary datasets left behind
+        assert list(h5) == ["text"]
+    with h5py.File(tmp_path / "test.h5") as h5:
+        assert list(h5["text"][:]) == lines
+
+
+def test_write_text_dataset_append_long_line_later_block(tmp_path):
+    """A long line in a later block (QLSI metadata) keeps the format"""
+    cmp_kw = get_compression_kwargs("gzip")
+    block_1 = [f"{ii:050d}" for ii in range(10000)]
+    block_2 = ["y" * 150, "short"]
+    with h5py.File(tmp_path / "test.h5", "w") as h5:
+        write_text_dataset(h5, "meta_data", block_1, mode="append",
+                           compression_kwargs=cmp_kw)
+        ds = write_text_dataset(h5, "meta_data", block_2, mode="append",
+                                compression_kwargs=cmp_kw)
+        assert ds.dtype.kind == "S"
+        assert ds.dtype.itemsize == 200
+        assert ds.compression == "gzip"
+        assert ds.fletcher32
+    with h5py.File(tmp_path / "test.h5") as h5:
+        assert [ll.decode("utf-8") for ll in h5["meta_data"][:]] \
+            == block_1 + block_2
+
+
+def test_write_text_dataset_replace(tmp_path):
+    with h5py.File(tmp_path / "test.h5", "w") as h5:
+        write_text_dataset(h5, "text", ["peter", "hans"])
+        write_text_dataset(h5, "text", [b"gustav"])
+        assert list(h5["text"][:]) == [b"gustav"]
+        write_text_dataset(h5, "text", [])
+        assert h5["text"].shape == (0,)
+
+
+def test_probe_h5(tmp_path):
+    path = tmp_path / "test.h5"
+    with h5py.File(path, "w") as h5:
+        h5["data"] = [1, 2, 3]
+        h5["data"].attrs["value"] = 5
+        h5.attrs["name"] = "peter"
+    checks = [{"location": "data"},
+              {"location": "missing"},
+              {"location": "data", "attribute": "value",
+               "verifier": is_positive},
+              {"attribute": "name", "regexp": "pet.*"},
+              {"attribute": "name", "regexp": "paul"},
+              ]
+    expected = [True, False, True, True, False]
+    assert probe_h5(path, checks) == expected
+    for check, exp in zip(checks, expected):
+        assert h5_file_contains(path, **check) == exp
+
+    # results are cached
+    with mock.patch("h5py.File", side_effect=AssertionError):
+        assert probe_h5(path, checks) == expected
+
+    # cache is invalidated when the file changes
+    with h5py.File(path, "a") as h5:
+        h5["missing"] = 1
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert probe_h5(path, checks)[1]
+
+
+def test_probe_h5_invalid(tmp_path):
+    path = tmp_path / "test.h5"
+    path.write_text("not an HDF5 file")
+    assert probe_h5(path, [{"location": "/"}, {}]) == [False, False]
+    assert probe_h5(tmp_path / "missing.h5", [{}]) == [False]
+    with pytest.raises(ValueError, match="without `attribute`"):
+        probe_h5(path, [{"regexp": "peter"}])
+    with pytest.raises(ValueError, match="Invalid keys"):
+        probe_h5(path, [{"locaton": "/"}])
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from mpl_data_cast.micromanager import (
+    iter_metadata, prefix_contains, stream_lines)
+
+
+def make_metadata(path, num_frames=50):
+    meta = {"Summary": {"Frames": num_frames,
+                        "Camera": "QLSICamera",
+                        "Note": "braces {} and \"quotes\" in strings"}}
+    for ii in range(num_frames):
+        meta[f"FrameKey-{ii}-0-0"] = {"ElapsedTime-ms": 10.5 * ii,
+                                      "ZPositionUm": -3 * ii,
+                                      "Values": [ii, ii + 1, None, True]}
+    meta["Number"] = 123456789
+    path.write_text(json.dumps(meta, indent=2))
+    return meta
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 100, 2**20])
+def test_iter_metadata(block_size, tmp_path):
+    path = tmp_path / "meta_data.txt"
+    meta = make_metadata(path)
+    lines = []
+    items = dict(iter_metadata(path,
+                               line_callback=lines.extend,
+                               block_size=block_size))
+    assert items == meta
+    assert list(items) == list(meta)
+    assert lines == path.read_text().split("\n")
+
+
+def test_iter_metadata_truncated(tmp_path):
+    path = tmp_path / "meta_data.txt"
+    make_metadata(path)
+    text = path.read_text()
+    path.write_text(text[:len(text) // 2])
+    with pytest.raises(ValueError):
+        list(iter_metadata(path, block_size=100))
+
+
+def test_prefix_contains(tmp_path):
+    path = tmp_path / "meta_data.txt"
+    make_metadata(path)
+    assert prefix_contains(path, "QLSICamera")
+    assert not prefix_contains(path, "QLSICamera", max_size=10)
+    assert not prefix_contains(path, "FrameKey-49-0-0", max_size=100)
+
+
+def test_stream_lines(tmp_path):
+    path = tmp_path / "text.txt"
+    path.write_text("a\nbb\n\nccc\n")
+    lines = []
+    stream_lines(path, lines.extend, block_size=2)
+    assert lines == ["a", "bb", "", "ccc", ""]
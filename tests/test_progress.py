@@ -0,0 +1,52 @@
+import pytest
+
+from mpl_data_cast.progress import CastProgress, format_duration
+
+
+def test_progress_byte_weighted():
+    progress = CastProgress(total_size=1000, conversion_cost=1.0)
+    assert progress.is_determined
+    assert progress.get_fraction() == 0
+    # a small file does not count as much as a large file
+    progress.add_dataset(100, converted=False)
+    progress.add_dataset(900, converted=False)
+    assert progress.get_fraction() == pytest.approx(0.1)
+    progress.advance(450)
+    assert progress.get_fraction() == pytest.approx(0.55)
+    progress.finish()
+    assert progress.get_fraction() == 1
+
+
+def test_progress_conversion_cost():
+    progress = CastProgress(total_size=1000, conversion_cost=3.0)
+    # converting 500 bytes costs 4 units per byte, copying 1 unit
+    progress.add_dataset(500, converted=True)
+    progress.add_dataset(500, converted=False)
+    assert progress.get_fraction() == pytest.approx(2000 / 2500)
+
+
+def test_progress_undetermined():
+    progress = CastProgress()
+    progress.add_dataset(100)
+    assert not progress.is_determined
+    assert progress.get_fraction() == 0
+    assert progress.get_eta() is None
+
+
+def test_progress_rate_eta():
+    progress = CastProgress(total_size=1000, smoothing=0.5)
+    progress._sample = (0, 0, 0)
+    progress.add_dataset(400, converted=False)
+    progress.add_dataset(600, converted=False)
+    assert progress.update_rate(now=2) == pytest.approx(200)
+    assert progress.get_eta() == pytest.approx(3)
+    progress.advance(300)
+    # smoothed rate: 0.5 * 150 + 0.5 * 200
+    assert progress.update_rate(now=4) == pytest.approx(175)
+    assert progress.get_eta() == pytest.approx(300 / 175)
+
+
+def test_format_duration():
+    assert format_duration(0) == "0:00:00"
+    assert format_duration(61.4) == "0:01:01"
+    assert format_duration(3 * 3600 + 125) == "3:02:05"
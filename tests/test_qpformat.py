@@ -0,0 +1,129 @@
+import h5py
+import numpy as np
+import pytest
+
+from mpl_data_cast.compression import get_compression_kwargs
+from mpl_data_cast.qpformat import (
+    QPFormatWriter, TABLE_NAME, encode_chunk, fletcher32,
+    is_directly_encodable
+)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.float64])
+@pytest.mark.parametrize("compression", ["gzip", "none"])
+def test_encode_chunk_same_as_hdf5(dtype, compression, tmp_path):
+    cmp_kw = get_compression_kwargs(compression)
+    assert is_directly_encodable(cmp_kw)
+    # odd number of bytes for uint8
+    image = np.random.default_rng(7).integers(0, 200, size=(31, 17))
+    image = image.astype(dtype)
+    with h5py.File(tmp_path / "test.h5", "w") as h5:
+        ds = h5.create_dataset("data", data=image, chunks=image.shape,
+                               fletcher32=True, **cmp_kw)
+        filter_mask, chunk = ds.id.read_direct_chunk((0, 0))
+    assert filter_mask == 0
+    assert encode_chunk(image, cmp_kw) == chunk
+
+
+def test_fletcher32_one_complement():
+    assert fletcher32(b"") == b"\x00\x00\x00\x00"
+    # sum is a multiple of 65535
+    assert fletcher32(b"\xff\xff") == b"\xff\xff\xff\xff"
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+@pytest.mark.parametrize("compression", ["balanced", "gzip", "none"])
+def test_writer(max_workers, compression, tmp_path):
+    rng = np.random.default_rng(42)
+    frames = [rng.integers(0, 2**12, size=(40, 50), dtype=np.uint16)
+              for _ in range(10)]
+    with h5py.File(tmp_path / "test.h5", "w") as h5:
+        with QPFormatWriter(h5, compression=compression,
+                            max_workers=max_workers) as qpw:
+            for ii, image in enumerate(frames):
+                qpw.write_frame(str(ii), image, attrs={"index": ii})
+
+    with h5py.File(tmp_path / "test.h5") as h5:
+        # frames and metadata table
+        assert len(h5) == 11
+        for ii, image in enumerate(frames):
+            ds = h5[str(ii)]
+            assert np.all(ds[:] == image)
+            assert ds.attrs["index"] == ii
+            assert ds.attrs["CLASS"] == b"IMAGE"
+            assert ds.fletcher32
+            assert ds.chunks == image.shape
+
+
+@pytest.mark.parametrize("max_workers,max_pending_bytes,max_pending", [
+    (4, 256 * 1024**2, 4),  # one frame per thread
+    (4, 2 * 4000, 2),  # bounded by size
+    (4, 10, 1),  # at least one frame
+])
+def test_writer_pending_bounded(max_workers, max_pending_bytes, max_pending,
+                                tmp_path):
+    image = np.zeros((40, 50), dtype=np.uint16)
+    with h5py.File(tmp_path / "test.h5", "w") as h5:
+        with QPFormatWriter(h5, compression="gzip",
+                            max_workers=max_workers,
+                            max_pending_bytes=max_pending_bytes) as qpw:
+            for ii in range(10):
+                qpw.write_frame(str(ii), image)
+                assert len(qpw.pending) <= max_pending
+                assert qpw.pending_bytes == len(qpw.pending) * image.nbytes
+        assert len(h5) == 11
+
+
+def test_writer_not_directly_encodable():
+    assert not is_directly_encodable(get_compression_kwargs("fast"))
+
+
+@pytest.mark.parametrize("compression", ["balanced", "gzip"])
+def test_writer_frame_chunk(compression, tmp_path):
+    image = np.random.default_rng(3).integers(0, 2**12, size=(40, 50),
+                                              dtype=np.uint16)
+    with h5py.File(tmp_path / "a.h5", "w") as h5, \
+            QPFormatWriter(h5, compression=compression) as qpw:
+        qpw.write_frame("reference", image)
+        encoded = qpw.read_frame_chunk("reference")
+    with h5py.File(tmp_path / "b.h5", "w") as h5, \
+            QPFormatWriter(h5, compression=compression) as qpw:
+        qpw.write_frame_chunk("reference", *encoded, attrs={"a": 1})
+    with h5py.File(tmp_path / "b.h5") as h5:
+        assert np.all(h5["reference"][:] == image)
+        assert h5["reference"].attrs["a"] == 1
+        assert h5["reference"].attrs["CLASS"] == b"IMAGE"
+
+
+def test_writer_common_attrs_and_table(tmp_path):
+    image = np.zeros((10, 12), dtype=np.uint16)
+    with h5py.File(tmp_path / "test.h5", "w") as h5, \
+            QPFormatWriter(h5, common_attrs={"device": "SPIM",
+                                             "pixel size": 1e-7}) as qpw:
+        qpw.write_frame("reference", image)
+        for ii in range(3):
+            attrs = {"time": 0.5 * ii, "focus": 1e-6 * ii,
+                     "date": "2022-04-26", "pixel size": 1e-7,
+                     "array": np.arange(3)}
+            if ii == 2:
+                attrs["pos x"] = 3e-6
+            qpw.write_frame(str(ii), image, attrs)
+
+    with h5py.File(tmp_path / "test.h5") as h5:
+        for ii in range(3):
+            attrs = h5[str(ii)].attrs
+            assert attrs["device"] == "SPIM"
+            assert attrs["date"] == "2022-04-26"
+            assert attrs["time"] == 0.5 * ii
+            assert attrs["pixel size"] == 1e-7
+            assert np.all(attrs["array"] == np.arange(3))
+            assert attrs["IMAGE_VERSION"] == b"1.2"
+        assert h5["reference"].attrs["device"] == "SPIM"
+
+        table = h5[TABLE_NAME]
+        assert table.attrs["device"] == "SPIM"
+        assert table.dtype.names == ("name", "time", "focus", "pos x")
+        assert list(table["name"]) == [b"reference", b"0", b"1", b"2"]
+        assert np.allclose(table["time"][1:], [0, 0.5, 1.0])
+        assert np.isnan(table["pos x"][1])
+        assert table["pos x"][3] == 3e-6
@@ -1,7 +1,15 @@
+import json
+import os
 import pathlib
 import tempfile
+from unittest import mock
 
+import pytest
+
+from mpl_data_cast import Recipe
+from mpl_data_cast.control import CastControl
 from mpl_data_cast.mod_recipes import CatchAllRecipe
+from mpl_data_cast.util import copyhashfile
 
 
 def test_basic():
@@ -20,3 +28,67 @@ def test_basic():
 
     assert (target / "folder" / "a.txt").read_text() == "hello testing world"
     assert (target / "1.txt").read_text() == "Another file!"
+
+
+def test_cancel_resume_offset(tmp_path):
+    """A partial transfer of a large file is resumed where it stopped"""
+    path_raw = tmp_path / "raw"
+    path_raw.mkdir()
+    data = os.urandom(10 * 1024**2 + 17)
+    (path_raw / "large.bin").write_bytes(data)
+    path_tar = tmp_path / "tar"
+    control = CastControl()
+
+    def checkpoint(path=None, offset=0):
+        if offset >= 4 * 1024**2:
+            control.cancel()
+        Recipe.checkpoint(rcp, path, offset)
+
+    rcp = CatchAllRecipe(path_raw=path_raw, path_tar=path_tar)
+    with mock.patch.object(rcp, "checkpoint", side_effect=checkpoint):
+        assert rcp.cast(control=control)["cancelled"]
+    state = json.loads(rcp.get_checkpoint_path().read_text())
+    assert state["current"]["path"] == "large.bin"
+    assert state["current"]["offset"] == 4 * 1024**2
+    # the partial file is kept
+    assert (path_tar / "large.bin").stat().st_size == 4 * 1024**2
+
+    rcp2 = CatchAllRecipe(path_raw=path_raw, path_tar=path_tar)
+    with mock.patch("mpl_data_cast.recipe.copyhashfile",
+                    wraps=copyhashfile) as chf:
+        assert rcp2.cast()["success"]
+    assert chf.call_args.kwargs["offset"] == 4 * 1024**2
+    assert (path_tar / "large.bin").read_bytes() == data
+
+
+def test_keyboard_interrupt_during_copy(tmp_path):
+    """A KeyboardInterrupt during a copy is not retried and can be resumed"""
+    path_raw = tmp_path / "raw"
+    path_raw.mkdir()
+    data = os.urandom(10 * 1024**2 + 17)
+    (path_raw / "large.bin").write_bytes(data)
+    path_tar = tmp_path / "tar"
+
+    def control(path=None, offset=0):
+        Recipe.checkpoint(rcp, path, offset)
+        if offset >= 4 * 1024**2:
+            raise KeyboardInterrupt
+
+    rcp = CatchAllRecipe(path_raw=path_raw, path_tar=path_tar)
+    with mock.patch.object(rcp, "checkpoint", side_effect=control), \
+            mock.patch("mpl_data_cast.util.time.sleep") as sleep:
+        with pytest.raises(KeyboardInterrupt):
+            rcp.cast()
+    assert not sleep.called
+    state = json.loads(rcp.get_checkpoint_path().read_text())
+    assert state["current"]["path"] == "large.bin"
+    assert state["current"]["offset"] == 4 * 1024**2
+    # the partial file is kept
+    assert (path_tar / "large.bin").stat().st_size == 4 * 1024**2
+
+    rcp2 = CatchAllRecipe(path_raw=path_raw, path_tar=path_tar)
+    with mock.patch("mpl_data_cast.recipe.copyhashfile",
+                    wraps=copyhashfile) as chf:
+        assert rcp2.cast()["success"]
+    assert chf.call_args.kwargs["offset"] == 4 * 1024**2
+    assert (path_tar / "large.bin").read_bytes() == data
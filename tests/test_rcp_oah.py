@@ -0,0 +1,67 @@
+import h5py
+import numpy as np
+import pytest
+
+from mpl_data_cast.mod_recipes import OAHRecipe
+
+
+def make_oah_data(path, num_frames=3):
+    """Create a Matlab v7.3 (HDF5) file as written for DHM data"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    topog = np.random.default_rng(42).normal(size=(num_frames, 30, 20))
+    with h5py.File(path, "w") as mat:
+        mat["topogMap"] = topog
+        mat["NA"] = np.array([[0.8]])
+        mat["lambda"] = np.array([[0.647]])
+        mat["res"] = np.array([[0.2]])
+        mat["positionVal"] = np.array([[10.], [20.], [30.]])
+        mat["frameRate"] = np.array([[5.]])
+    return topog
+
+
+@pytest.mark.parametrize("compression", ["balanced", "gzip", "none"])
+def test_rcp_oah_base(compression, tmp_path):
+    path_in = tmp_path / "in"
+    path_out = tmp_path / "out"
+    topog = make_oah_data(path_in / "sub" / "TopogMap.mat")
+    (path_in / "sub" / "invalid.mat").write_text("not an HDF5 file")
+
+    rcp = OAHRecipe(path_raw=path_in, path_tar=path_out)
+    assert len(list(rcp.get_raw_data_iterator())) == 1
+    assert rcp.cast(compression=compression)["success"]
+
+    with h5py.File(path_out / "sub" / "TopogMap.h5") as h5:
+        assert h5.attrs["file_format"] == "qpformat"
+        assert h5.attrs["imaging_modality"] == "off-axis holography"
+        assert h5.attrs["mpldc_compression"] == compression
+        for ii in range(len(topog)):
+            ds = h5[str(ii)]
+            assert np.all(ds[:] == topog[ii])
+            assert np.allclose(ds.attrs["wavelength"], 647e-9)
+            assert np.allclose(ds.attrs["pixel size"], 0.2e-6)
+            assert np.allclose(ds.attrs["pos y"], 20e-6)
+            assert np.allclose(ds.attrs["time"], ii / 5)
+            assert ds.attrs["CLASS"] == b"IMAGE"
+    # invalid file is copied as-is
+    assert (path_out / "sub" / "invalid.mat").exists()
+
+
+def test_rcp_oah_2d(tmp_path):
+    path_in = tmp_path / "in"
+    path_out = tmp_path / "out"
+    make_oah_data(path_in / "TopogMap.mat")
+    topog = np.arange(30 * 20, dtype=float).reshape(30, 20)
+    with h5py.File(path_in / "TopogMap.mat", "a") as mat:
+        del mat["topogMap"]
+        mat["topogMap"] = topog
+        mat["mediumIndex"] = np.array([[1.335]])
+
+    rcp = OAHRecipe(path_raw=path_in, path_tar=path_out)
+    assert rcp.cast()["success"]
+
+    with h5py.File(path_out / "TopogMap.h5") as h5:
+        # a single 2D slice
+        assert sorted(h5.keys()) == ["0", "frame_metadata"]
+        assert np.all(h5["0"][:] == topog)
+        assert np.allclose(h5["0"].attrs["medium index"], 1.335)
+        assert np.allclose(h5["0"].attrs["focus"], 30e-6)
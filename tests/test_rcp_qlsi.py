@@ -0,0 +1,146 @@
+import json
+import shutil
+from unittest import mock
+import warnings
+
+import h5py
+import numpy as np
+import pytest
+import tifffile
+
+from mpl_data_cast.mod_recipes import QLSIRecipe
+from mpl_data_cast.mod_recipes.rcp_qlsi import iter_tif_frames
+
+
+def make_qlsi_data(path, num_frames=3, compression=None):
+    """Create a MicroManager QLSI measurement with a reference"""
+    data = {}
+    for name in ["QLSI_2022-04-29_ZStack_Example_1",
+                 "QLSI_2022-04-29_ZStack_Example_ref_1"]:
+        pdir = path / name
+        pdir.mkdir(parents=True)
+        num = num_frames if name.count("_ref_") == 0 else 1
+        stack = np.random.default_rng(42).integers(
+            0, 2**12, size=(num, 32, 40), dtype=np.uint16)
+        stem = name.replace("2022-04-29", "2022-04-26") + "_MMStack_Pos0"
+        tifffile.imwrite(pdir / f"{stem}.ome.tif", stack,
+                         compression=compression)
+        meta = {"Summary": {"Slices": 1,
+                            "Frames": num,
+                            "ComputerName": "SPIM",
+                            "MicroManagerVersion": "2.0.0",
+                            "Camera": "QLSICamera",
+                            }}
+        for ii in range(num):
+            meta[f"FrameKey-{ii}-0-0"] = {
+                "ElapsedTime-ms": 10.0 * ii,
+                "PixelSizeUm": 0.1,
+                "ReceivedTime": "2022-04-26 10:00:00.000 +0200",
+                "UUID": f"frame-{ii}",
+                "XPositionUm": 1.0,
+                "YPositionUm": 2.0,
+                "ZPositionUm": 3.0 * ii,
+            }
+        (pdir / f"{stem}_metadata.txt").write_text(json.dumps(meta,
+                                                              indent=2))
+        (pdir / "comments.txt").write_text("")
+        (pdir / "DisplaySettings.json").write_text("{}")
+        data[name] = stack
+    return data
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_iter_tif_frames(compression, tmp_path):
+    stack = np.arange(5 * 6 * 7, dtype=np.uint16).reshape(5, 6, 7)
+    tifffile.imwrite(tmp_path / "test.tif", stack, compression=compression)
+    with tifffile.TiffFile(tmp_path / "test.tif") as tif:
+        frames = list(iter_tif_frames(tif))
+    assert len(frames) == 5
+    for ii in range(5):
+        assert np.all(frames[ii] == stack[ii])
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_rcp_qlsi_base(compression, tmp_path):
+    path_in = tmp_path / "in"
+    path_out = tmp_path / "out"
+    data = make_qlsi_data(path_in, compression=compression)
+
+    rcp = QLSIRecipe(path_raw=path_in, path_tar=path_out)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        assert rcp.cast()["success"]
+
+    pout = path_out / "QLSI_2022-04-26_ZStack_Example_1_MMStack_Pos0.h5"
+    assert pout.exists()
+    with h5py.File(pout) as h5:
+        assert h5.attrs["file_format"] == "qpformat"
+        ref = data["QLSI_2022-04-29_ZStack_Example_ref_1"][0]
+        assert np.all(h5["reference"][:] == ref)
+        stack = data["QLSI_2022-04-29_ZStack_Example_1"]
+        for ii in range(len(stack)):
+            assert np.all(h5[str(ii)][:] == stack[ii])
+            assert np.allclose(h5[str(ii)].attrs["focus"], 3e-6 * ii)
+            assert h5[str(ii)].attrs["pixel size"] == 0.1e-6
+            assert h5[str(ii)].attrs["CLASS"] == b"IMAGE"
+        table = h5["frame_metadata"]
+        assert table.attrs["device"] == "SPIM"
+        assert np.allclose(table["focus"][1:], 3e-6 * np.arange(len(stack)))
+        meta_text = b"\n".join(h5["logs/meta_data"][:]).decode()
+        assert json.loads(meta_text)["Summary"]["Camera"] == "QLSICamera"
+
+
+def test_rcp_qlsi_reference_cache(tmp_path):
+    path_in = tmp_path / "in"
+    path_out = tmp_path / "out"
+    data = make_qlsi_data(path_in)
+    # second position sharing the same reference
+    pdir = path_in / "QLSI_2022-04-29_ZStack_Example_1"
+    for pp in list(pdir.glob("*_MMStack_Pos0*")):
+        shutil.copy2(pp, pp.with_name(pp.name.replace("Pos0", "Pos1")))
+
+    rcp = QLSIRecipe(path_raw=path_in, path_tar=path_out)
+    with warnings.catch_warnings(), \
+            mock.patch("tifffile.imread", wraps=tifffile.imread) as imread:
+        warnings.simplefilter("ignore")
+        assert rcp.cast()["success"]
+    # the reference is only read once
+    assert imread.call_count == 1
+    assert len(rcp.reference_cache) == 1
+
+    ref = data["QLSI_2022-04-29_ZStack_Example_ref_1"][0]
+    for pos in ["Pos0", "Pos1"]:
+        pout = path_out / f"QLSI_2022-04-26_ZStack_Example_1_MMStack_{pos}.h5"
+        with h5py.File(pout) as h5:
+            assert np.all(h5["reference"][:] == ref)
+            assert h5["reference"].attrs["device"] == "SPIM"
+
+
+def test_rcp_qlsi_discovery_without_glob(tmp_path):
+    path_in = tmp_path / "in"
+    make_qlsi_data(path_in)
+    # invalid measurement without reference
+    (path_in / "other" / "Example_2").mkdir(parents=True)
+    (path_in / "other" / "Example_2" / "data.ome.tif").write_bytes(b"")
+
+    rcp = QLSIRecipe(path_raw=path_in, path_tar=tmp_path / "out")
+    with mock.patch("pathlib.Path.glob", side_effect=AssertionError), \
+            mock.patch("pathlib.Path.rglob", side_effect=AssertionError):
+        path_lists = list(rcp.get_raw_data_iterator())
+    assert len(path_lists) == 1
+    pdir = path_in / "QLSI_2022-04-29_ZStack_Example_1"
+    rdir = path_in / "QLSI_2022-04-29_ZStack_Example_ref_1"
+    stem = "QLSI_2022-04-26_ZStack_Example_1_MMStack_Pos0"
+    rstem = "QLSI_2022-04-26_ZStack_Example_ref_1_MMStack_Pos0"
+    assert path_lists[0] == [pdir / f"{stem}.ome.tif",
+                             pdir / f"{stem}_metadata.txt",
+                             rdir / f"{rstem}.ome.tif",
+                             rdir / f"{rstem}_metadata.txt",
+                             pdir / "comments.txt",
+                             pdir / "DisplaySettings.json",
+                             rdir / "comments.txt",
+                             rdir / "DisplaySettings.json",
+                             ]
+    assert QLSIRecipe.is_valid_file(path_lists[0][0])
+    assert not QLSIRecipe.is_valid_file(
+        path_in / "other" / "Example_2" / "data.ome.tif")
@@ -1,8 +1,14 @@
+import os
+from unittest import mock
+
+import h5py
 import numpy as np
+import pytest
 
 from helper import retrieve_data
 
 from mpl_data_cast.mod_recipes import RTDCRecipe
+from mpl_data_cast.mod_recipes.rcp_rtdc import select_features
 
 import dclab
 
@@ -50,3 +56,195 @@ def test_rcp_rtdc_with_other_files(tmp_path):
     rcp.cast()
 
     assert (tmp_path / "additional.docx").exists()
+
+
+def test_rcp_rtdc_skip_unchanged_source(tmp_path):
+    path_in = retrieve_data("rcp_rtdc_mask-contour_2018.zip")
+    pin = path_in / "M001_data.rtdc"
+    pout = tmp_path / "M001_data.rtdc"
+
+    rcp = RTDCRecipe(path_raw=path_in, path_tar=tmp_path)
+    assert rcp.cast()["success"]
+    fingerprint = rcp.get_target_fingerprint(pout)
+    assert fingerprint == rcp.get_source_fingerprint(
+        [pin, path_in / "M001_SoftwareSettings.ini"])
+
+    # The output file must still be readable with dclab
+    with dclab.new_dataset(pout) as ds:
+        assert "M001_SoftwareSettings.ini" in ds.logs
+
+    # Nothing changed, so nothing should be converted
+    rcp2 = RTDCRecipe(path_raw=path_in, path_tar=tmp_path)
+    with mock.patch.object(rcp2, "convert_dataset") as convert:
+        assert rcp2.cast()["success"]
+        assert not convert.called
+
+    # Modifying the source file results in a different fingerprint
+    os.utime(pin, ns=(pin.stat().st_atime_ns, pin.stat().st_mtime_ns + 1))
+    rcp3 = RTDCRecipe(path_raw=path_in, path_tar=tmp_path)
+    assert rcp3.get_source_fingerprint(
+        [pin, path_in / "M001_SoftwareSettings.ini"]) != fingerprint
+    with mock.patch.object(rcp3, "convert_dataset") as convert:
+        rcp3.cast()
+        assert convert.called
+
+
+def test_rcp_rtdc_fingerprint_kwargs(tmp_path):
+    path_in = retrieve_data("rcp_rtdc_mask-contour_2018.zip")
+    path_list = [path_in / "M001_data.rtdc"]
+    rcp = RTDCRecipe(path_raw=path_in, path_tar=tmp_path)
+    assert (rcp.get_source_fingerprint(path_list)
+            == rcp.get_source_fingerprint(path_list))
+    assert (rcp.get_source_fingerprint(path_list)
+            != rcp.get_source_fingerprint(path_list, peter="hans"))
+
+
+def test_rcp_rtdc_compression(tmp_path):
+    path_in = retrieve_data("rcp_rtdc_mask-contour_2018.zip")
+
+    rcp = RTDCRecipe(path_raw=path_in, path_tar=tmp_path)
+    assert rcp.cast(compression="fast")["success"]
+
+    pout = tmp_path / "M001_data.rtdc"
+    with h5py.File(pout) as h5:
+        assert h5["logs"].attrs["mpldc_compression"] == "fast"
+        log = h5["logs/M001_SoftwareSettings.ini"]
+        # Blosc2 filter
+        assert log.id.get_create_plist().get_filter_by_id(32026)
+
+
+def test_rcp_rtdc_features_compressed(tmp_path):
+    path_in = retrieve_data("rcp_rtdc_mask-contour_2018.zip")
+    rcp = RTDCRecipe(path_raw=path_in, path_tar=tmp_path)
+    assert rcp.cast(compression="balanced")["success"]
+
+    pin = path_in / "M001_data.rtdc"
+    pout = tmp_path / "M001_data.rtdc"
+    with dclab.new_dataset(pin) as ds1, dclab.new_dataset(pout) as ds2:
+        assert set(ds1.features_innate) == set(ds2.features_innate)
+        for feat in ds1.features_innate:
+            if feat == "contour":
+                assert np.all(ds1[feat][3] == ds2[feat][3])
+            else:
+                assert np.all(ds1[feat][:] == ds2[feat][:]), feat
+
+    with h5py.File(pout) as h5:
+        for feat in h5["events"]:
+            ds = h5["events"][feat]
+            if isinstance(ds, h5py.Dataset):
+                plist = ds.id.get_create_plist()
+                assert plist.get_filter_by_id(32026), feat  # Blosc2
+                assert plist.get_filter_by_id(3), feat  # fletcher32
+
+
+def test_rcp_rtdc_log_name_clash(tmp_path):
+    """Casting data that already contain the log must not hang"""
+    path_in = retrieve_data("rcp_rtdc_mask-contour_2018.zip")
+    path_mid = tmp_path / "mid"
+    path_out = tmp_path / "out"
+    assert RTDCRecipe(path_raw=path_in, path_tar=path_mid).cast()["success"]
+    # put the .ini file next to the converted file again
+    (path_mid / "M001_SoftwareSettings.ini").write_text(
+        (path_in / "M001_SoftwareSettings.ini").read_text())
+    assert RTDCRecipe(path_raw=path_mid, path_tar=path_out).cast()["success"]
+
+    with dclab.new_dataset(path_out / "M001_data.rtdc") as ds:
+        assert "M001_SoftwareSettings.ini" in ds.logs
+        assert "M001_SoftwareSettings.ini-1" in ds.logs
+
+
+def test_rcp_rtdc_already_compressed_passthrough(tmp_path):
+    path_in = retrieve_data("rcp_rtdc_mask-contour_2018.zip")
+    path_mid = tmp_path / "mid"
+    path_out = tmp_path / "out"
+    assert RTDCRecipe(path_raw=path_in, path_tar=path_mid).cast(
+        compression="gzip")["success"]
+    assert RTDCRecipe(path_raw=path_mid, path_tar=path_out).cast(
+        compression="balanced")["success"]
+
+    with h5py.File(path_mid / "M001_data.rtdc") as h5_mid, \
+            h5py.File(path_out / "M001_data.rtdc") as h5_out:
+        for feat in ["deform", "image", "mask"]:
+            ds_mid = h5_mid["events"][feat]
+            ds_out = h5_out["events"][feat]
+            # not recompressed with Blosc2
+            assert ds_out.id.get_create_plist().get_filter_by_id(1)
+            assert not ds_out.id.get_create_plist().get_filter_by_id(32026)
+            # identical raw chunks
+            assert (ds_mid.id.read_direct_chunk((0,) * ds_mid.ndim)
+                    == ds_out.id.read_direct_chunk((0,) * ds_out.ndim))
+            # the actual codec is recorded
+            assert ds_out.attrs["mpldc_compression"] == "gzip"
+
+    # explicitly requesting no compression decompresses the data
+    path_none = tmp_path / "none"
+    assert RTDCRecipe(path_raw=path_mid, path_tar=path_none).cast(
+        compression="none")["success"]
+    with h5py.File(path_none / "M001_data.rtdc") as h5:
+        assert not h5["events/image"].compression
+
+
+def test_rcp_rtdc_command_log(tmp_path):
+    path_in = retrieve_data("rcp_rtdc_mask-contour_2018.zip")
+    path_mid = tmp_path / "mid"
+    path_out = tmp_path / "out"
+    assert RTDCRecipe(path_raw=path_in, path_tar=path_mid).cast()["success"]
+    with dclab.new_dataset(path_mid / "M001_data.rtdc") as ds:
+        log = "\n".join(ds.logs["dclab-compress"])
+        assert "M001_data.rtdc" in log
+        assert dclab.__version__ in log
+
+    # casting again keeps the previous command log
+    assert RTDCRecipe(path_raw=path_mid, path_tar=path_out).cast()["success"]
+    with dclab.new_dataset(path_out / "M001_data.rtdc") as ds:
+        assert "dclab-compress" in ds.logs
+        old = [name for name in ds.logs if name.startswith("dclab-compress_")]
+        assert len(old) == 1
+
+
+def test_rcp_rtdc_exclude_features(tmp_path):
+    path_in = retrieve_data("rcp_rtdc_mask-contour_2018.zip")
+    path_out = tmp_path / "out"
+    rcp = RTDCRecipe(path_raw=path_in, path_tar=path_out)
+    assert rcp.cast(exclude_features="image;mask contour",
+                    basin_original=True)["success"]
+
+    pin = path_in / "M001_data.rtdc"
+    pout = path_out / "M001_data.rtdc"
+    with h5py.File(pout) as h5:
+        assert "image" not in h5["events"]
+        assert "mask" not in h5["events"]
+        assert "contour" not in h5["events"]
+        assert "deform" in h5["events"]
+    # the excluded features are available via the basin
+    with dclab.new_dataset(pin) as ds1, dclab.new_dataset(pout) as ds2:
+        assert "image" not in ds2.features_innate
+        assert "image" in ds2.features_basin
+        assert np.all(ds1["image"][2] == ds2["image"][2])
+
+
+def test_rcp_rtdc_include_scalar_features(tmp_path):
+    path_in = retrieve_data("rcp_rtdc_mask-contour_2018.zip")
+    path_out = tmp_path / "out"
+    rcp = RTDCRecipe(path_raw=path_in, path_tar=path_out)
+    assert rcp.cast(include_features="scalar")["success"]
+
+    with h5py.File(path_out / "M001_data.rtdc") as h5:
+        assert "image" not in h5["events"]
+        assert "deform" in h5["events"]
+        assert "basins" not in h5
+    with dclab.new_dataset(path_out / "M001_data.rtdc") as ds:
+        assert "image" not in ds
+
+
+def test_select_features():
+    features = ["deform", "image", "mask", "trace", "area_um"]
+    assert select_features(features) == features
+    assert select_features(features, include="scalar") \
+        == ["deform", "area_um"]
+    assert select_features(features, exclude="image; mask\ttrace") \
+        == ["deform", "area_um"]
+    assert select_features(features, include="scalar;image",
+                           exclude="deform") == ["image", "area_um"]
+    with pytest.raises(ValueError, match="Unknown feature"):
+        select_features(features, exclude="imag")
@@ -1,12 +1,25 @@
 import atexit
 import hashlib
+from importlib import metadata
+import io
+import json
 import os
 import pathlib
 import shutil
+import subprocess
+import sys
 import tempfile
+import threading
+from unittest import mock
 import uuid
 
+import pytest
+
 from mpl_data_cast import Recipe, cleanup_tmp_dirs
+from mpl_data_cast import recipe as mpldc_recipe
+from mpl_data_cast.control import CastControl
+from mpl_data_cast.scan import SCAN_CACHE
+from mpl_data_cast.util import copyhashfile
 
 
 def make_example_data():
@@ -116,6 +129,74 @@ def test_pipeline_cast_delete_after():
     assert len(temp_files) == 0
 
 
+def test_pipeline_cast_skip_paths_error_callback(tmp_path):
+    path_raw = make_example_data()
+    (path_raw / "other.dat").write_text("other data")
+    errors = []
+
+    def convert_dataset(path_list, temp_path, **kwargs):
+        raise ValueError("Cannot convert")
+
+    pl = DummyRecipe(path_raw, tmp_path)
+    with mock.patch.object(pl, "convert_dataset",
+                           side_effect=convert_dataset):
+        result = pl.cast(
+            error_callback=lambda *args: errors.append(args),
+            skip_paths={path_raw / "fliege" / "1.txt",
+                        path_raw / "other.dat"})
+    # errors are reported when they occur
+    assert errors == result["errors"]
+    # (DummyRecipe yields "hans" and "hans/peter" with the same first path)
+    assert {pp for pp, _ in errors} == {path_raw / "hans" / "peter" / "a.txt"}
+    assert "ValueError: Cannot convert" in errors[0][1]
+    # skipped datasets and files are not cast
+    assert not (tmp_path / "fliege").exists()
+    assert not (tmp_path / "other.dat").exists()
+
+
+def test_pipeline_cast_keyboard_interrupt(tmp_path):
+    """A KeyboardInterrupt (e.g. second Ctrl+C) aborts the cast"""
+    path_raw = make_example_data()
+    pl = DummyRecipe(path_raw, tmp_path)
+    with mock.patch.object(pl, "convert_dataset",
+                           side_effect=KeyboardInterrupt):
+        with pytest.raises(KeyboardInterrupt):
+            pl.cast()
+    assert pl.stage is None
+
+
+def test_pipeline_cast_stale_directory_mtime(tmp_path):
+    """Files are not missed if directory mtimes are not updated"""
+    path_raw = make_example_data()
+    for pdir in [path_raw] + [pp for pp in path_raw.rglob("*")
+                              if pp.is_dir()]:
+        os.utime(pdir, (1e9, 1e9))
+    SCAN_CACHE.count(path_raw)
+    (path_raw / "fliege" / "other.dat").write_text("other data")
+    os.utime(path_raw / "fliege", (1e9, 1e9))
+    pl = DummyRecipe(path_raw, tmp_path)
+    assert pl.cast()["success"]
+    assert (tmp_path / "fliege" / "other.dat").read_text() == "other data"
+
+
+def test_pipeline_cast_stage():
+    path_raw = make_example_data()
+    (path_raw / "fliege" / "notes.dat").write_text("other file")
+    path_tar = pathlib.Path(tempfile.mkdtemp()) / "test"
+    pl = DummyRecipe(path_raw, path_tar)
+    stages = []
+
+    def path_callback(path_list):
+        stages.append((path_list[0].name, pl.stage))
+
+    assert pl.cast(path_callback=path_callback)["success"]
+    # datasets are converted, all other files are copied
+    assert ("1.txt", "convert") in stages
+    assert ("a.txt", "convert") in stages
+    assert stages[-1] == ("notes.dat", "copy")
+    assert pl.stage is None
+
+
 def test_pipeline_get_target_path():
     path_raw = make_example_data()
     path_tar = pathlib.Path(tempfile.mkdtemp()) / "test"
@@ -210,3 +291,190 @@ def test_transfer_to_target_path_hash_input_control(tmp_path):
     assert pin.exists()
     assert pin.read_text() == "peter"
     assert not pout.exists()
+
+
+def test_transfer_buffer_to_target_path(tmp_path):
+    pout = tmp_path / "sub" / "out.txt"
+    assert Recipe.transfer_buffer_to_target_path(
+        buffer=io.BytesIO(b"peter"),
+        target_path=pout)
+    assert pout.read_text() == "peter"
+    # existing identical file is not written again
+    mtime = pout.stat().st_mtime_ns
+    assert Recipe.transfer_buffer_to_target_path(
+        buffer=io.BytesIO(b"peter"),
+        target_path=pout)
+    assert pout.stat().st_mtime_ns == mtime
+    # existing different file (same size) is replaced
+    pout.write_text("hanse")
+    assert Recipe.transfer_buffer_to_target_path(
+        buffer=io.BytesIO(b"peter"),
+        target_path=pout)
+    assert pout.read_text() == "peter"
+
+
+class InMemoryRecipe(DummyRecipe):
+    in_memory_capable = True
+
+    def convert_dataset(self, path_list, temp_path, **kwargs):
+        data = ""
+        for pp in path_list:
+            data += pp.read_text()
+        if isinstance(temp_path, io.BytesIO):
+            temp_path.write(data.encode())
+        else:
+            temp_path.write_text(data)
+
+
+def test_pipeline_cast_in_memory(tmp_path):
+    path_raw = make_example_data()
+    rp = InMemoryRecipe(path_raw, tmp_path / "mem")
+    assert rp.is_in_memory([path_raw / "fliege" / "1.txt"])
+    assert rp.cast()["success"]
+    # nothing was written to the temporary directory
+    assert not list(rp.tempdir.iterdir())
+
+    rp2 = InMemoryRecipe(path_raw, tmp_path / "disk")
+    rp2.in_memory_max_size = 0
+    assert not rp2.is_in_memory([path_raw / "fliege" / "1.txt"])
+    assert rp2.cast()["success"]
+
+    for pp in (tmp_path / "mem").rglob("*.txt"):
+        prel = pp.relative_to(tmp_path / "mem")
+        assert pp.read_text() == (tmp_path / "disk" / prel).read_text()
+    assert (tmp_path / "mem" / "fliege" / "1.txt").read_text() \
+        == "lorem ipsum dolor sit amet."
+
+
+def test_pipeline_cast_cancel_resume(tmp_path):
+    path_raw = make_example_data()
+    (path_raw / "other.dat").write_text("other data")
+    path_tar = tmp_path / "test"
+    control = CastControl()
+    processed = []
+
+    def cancel_after_first(path_list):
+        processed.append(path_list[0])
+        if len(processed) == 2:
+            control.cancel()
+
+    pl = DummyRecipe(path_raw, path_tar)
+    ret = pl.cast(path_callback=cancel_after_first, control=control)
+    assert not ret["success"]
+    assert ret["cancelled"]
+    checkpoint = json.loads(pl.get_checkpoint_path().read_text())
+    assert checkpoint["completed"] == ["fliege/1.txt"]
+    assert checkpoint["current"]["path"] == "hans/peter/a.txt"
+    assert not (path_tar / "hans" / "peter" / "a.txt").exists()
+
+    # resume (the first dataset is not converted again)
+    pl2 = DummyRecipe(path_raw, path_tar)
+    with mock.patch.object(pl2, "convert_dataset",
+                           wraps=pl2.convert_dataset) as convert:
+        ret = pl2.cast()
+    assert ret["success"]
+    assert not ret["cancelled"]
+    assert convert.call_count == 1
+    assert not pl2.get_checkpoint_path().exists()
+    assert (path_tar / "hans" / "peter" / "a.txt").read_text() \
+        == "hello world!"
+    assert (path_tar / "other.dat").read_text() == "other data"
+
+
+def test_pipeline_cast_checkpoint_kwargs(tmp_path):
+    path_raw = make_example_data()
+    control = CastControl()
+    control.cancel()
+    pl = DummyRecipe(path_raw, tmp_path)
+    assert pl.cast(control=control, peter=1)["cancelled"]
+    assert pl.get_checkpoint_path().exists()
+    # different keyword arguments do not use the checkpoint
+    assert pl.load_checkpoint(peter=2) == (set(), None)
+    assert pl.load_checkpoint(peter=1)[0] == set()
+
+
+def test_pipeline_cast_pause(tmp_path):
+    path_raw = make_example_data()
+    control = CastControl()
+    control.pause()
+    pl = DummyRecipe(path_raw, tmp_path)
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(
+        pl.cast(control=control)))
+    thread.start()
+    thread.join(timeout=0.5)
+    # paused at the first checkpoint
+    assert thread.is_alive()
+    assert pl.get_checkpoint_path().exists()
+    assert not (tmp_path / "fliege" / "1.txt").exists()
+    control.resume()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert result["success"]
+    assert (tmp_path / "fliege" / "1.txt").exists()
+    assert not pl.get_checkpoint_path().exists()
+
+
+def test_pipeline_cast_resume_offset(tmp_path):
+    path_raw = tmp_path / "raw"
+    path_raw.mkdir()
+    data = os.urandom(10 * 1024**2 + 17)
+    (path_raw / "large.bin").write_bytes(data)
+    path_tar = tmp_path / "tar"
+    control = CastControl()
+
+    def checkpoint(path=None, offset=0):
+        if offset >= 4 * 1024**2:
+            control.cancel()
+        Recipe.checkpoint(pl, path, offset)
+
+    pl = DummyRecipe(path_raw, path_tar)
+    with mock.patch.object(pl, "checkpoint", side_effect=checkpoint):
+        assert pl.cast(control=control)["cancelled"]
+    state = json.loads(pl.get_checkpoint_path().read_text())
+    assert state["current"]["path"] == "large.bin"
+    assert state["current"]["offset"] == 4 * 1024**2
+    # the partial file is kept
+    assert (path_tar / "large.bin").stat().st_size == 4 * 1024**2
+
+    pl2 = DummyRecipe(path_raw, path_tar)
+    with mock.patch("mpl_data_cast.recipe.copyhashfile",
+                    wraps=copyhashfile) as chf:
+        assert pl2.cast()["success"]
+    assert chf.call_args.kwargs["offset"] == 4 * 1024**2
+    assert (path_tar / "large.bin").read_bytes() == data
+
+
+def test_recipe_registry_lazy():
+    # listing the recipes must not import the recipe modules
+    code = "\n".join([
+        "import sys",
+        "from mpl_data_cast import recipe",
+        "names = recipe.get_available_recipe_names()",
+        "assert {'CatchAll', 'OAH', 'QLSI', 'RTDC'} <= set(names)",
+        "[recipe.get_recipe_description(name) for name in names]",
+        "heavy = ['dclab', 'h5py', 'numpy', 'tifffile']",
+        "assert not [m for m in heavy if m in sys.modules]",
+        "cls = recipe.map_recipe_name_to_class('rtdc')",
+        "assert cls.__name__ == 'RTDCRecipe'",
+        "assert 'dclab' in sys.modules",
+    ])
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_recipe_registry_entry_points():
+    ep = metadata.EntryPoint(
+        name="ThirdParty",
+        value="mpl_data_cast.mod_recipes.rcp_catchall:CatchAllRecipe",
+        group=mpldc_recipe.RECIPE_ENTRY_POINT_GROUP)
+    mpldc_recipe.get_recipe_registry.cache_clear()
+    try:
+        with mock.patch.object(mpldc_recipe.metadata, "entry_points",
+                               return_value=[ep]):
+            assert "ThirdParty" in mpldc_recipe.get_available_recipe_names()
+            cls = mpldc_recipe.map_recipe_name_to_class("ThirdParty")
+            assert cls.__name__ == "CatchAllRecipe"
+            assert mpldc_recipe.get_recipe_description("ThirdParty") == \
+                "Just copy all files, except known junk files"
+    finally:
+        mpldc_recipe.get_recipe_registry.cache_clear()
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from unittest import mock
+
+from mpl_data_cast import scan
+from mpl_data_cast.scan import TreeScanCache, TreeScanService
+
+
+def make_tree(path):
+    (path / "a" / "b").mkdir(parents=True)
+    (path / "c").mkdir()
+    (path / "root.txt").write_text("root")
+    (path / "a" / "a.txt").write_text("hello")
+    (path / "a" / "b" / "b.txt").write_text("world!")
+    (path / "c" / "Thumbs.db").write_text("junk")
+    return path
+
+
+def age_tree(path, seconds=60):
+    """Set the modification time of all directories to the past"""
+    for pdir in [path] + [pp for pp in path.rglob("*") if pp.is_dir()]:
+        mtime = pdir.stat().st_mtime - seconds
+        os.utime(pdir, (mtime, mtime))
+
+
+def test_cache_count(tmp_path):
+    make_tree(tmp_path)
+    cache = TreeScanCache()
+    assert cache.count(tmp_path) == (4, 19)
+    assert cache.count(tmp_path, ignored_names=["Thumbs.db"]) == (3, 15)
+    assert sorted(cache.iter_files(tmp_path, ignored_names=["Thumbs.db"])) \
+        == [tmp_path / "a" / "a.txt",
+            tmp_path / "a" / "b" / "b.txt",
+            tmp_path / "root.txt"]
+
+
+def test_cache_only_lists_modified_directories(tmp_path):
+    make_tree(tmp_path)
+    age_tree(tmp_path)
+    cache = TreeScanCache()
+    with mock.patch.object(scan.os, "scandir", wraps=os.scandir) as sd:
+        cache.count(tmp_path)
+        assert sd.call_count == 4
+        assert cache.count(tmp_path) == (4, 19)
+        assert sd.call_count == 4  # everything cached
+        (tmp_path / "a" / "new.txt").write_text("new")
+        assert cache.count(tmp_path) == (5, 22)
+        assert sd.call_count == 5  # only "a" was listed again
+
+
+def test_cache_racy_directories_not_cached(tmp_path):
+    make_tree(tmp_path)
+    cache = TreeScanCache()
+    with mock.patch.object(scan.os, "scandir", wraps=os.scandir) as sd:
+        cache.count(tmp_path)
+        cache.count(tmp_path)
+        # the directories were just modified
+        assert sd.call_count == 8
+
+
+def test_cache_invalidate(tmp_path):
+    make_tree(tmp_path)
+    age_tree(tmp_path)
+    cache = TreeScanCache()
+    cache.count(tmp_path)
+    # modifying a file does not change the mtime of its directory
+    (tmp_path / "a" / "a.txt").write_text("hello again")
+    assert cache.count(tmp_path) == (4, 19)
+    cache.invalidate(tmp_path / "a")
+    assert cache.count(tmp_path) == (4, 25)
+
+
+def test_cache_refresh(tmp_path):
+    make_tree(tmp_path)
+    age_tree(tmp_path)
+    cache = TreeScanCache()
+    cache.count(tmp_path)
+    # a new file on a file system that did not update the mtime
+    mtime_ns = (tmp_path / "a").stat().st_mtime_ns
+    (tmp_path / "a" / "new.txt").write_text("new")
+    os.utime(tmp_path / "a", ns=(mtime_ns, mtime_ns))
+    assert cache.count(tmp_path) == (4, 19)
+    files = list(cache.iter_files(tmp_path, refresh=True))
+    assert tmp_path / "a" / "new.txt" in files
+    # the cache was updated
+    assert cache.count(tmp_path) == (5, 22)
+
+
+def test_cache_iter_entries(tmp_path):
+    make_tree(tmp_path)
+    cache = TreeScanCache()
+    entries = sorted(cache.iter_entries(tmp_path, pattern="*.txt"))
+    assert [(pp.name, size) for pp, size, _ in entries] == \
+        [("a.txt", 5), ("b.txt", 6), ("root.txt", 4)]
+    assert entries[0][2] == (tmp_path / "a" / "a.txt").stat().st_mtime_ns
+
+
+def test_cache_walk_concurrent(tmp_path):
+    """Directories are listed concurrently (e.g. on network shares)"""
+    for ii in range(8):
+        for jj in range(4):
+            (tmp_path / f"dir{ii}" / f"sub{jj}").mkdir(parents=True)
+    cache = TreeScanCache()
+    list_directory = cache.list_directory
+
+    def slow_list_directory(path):
+        time.sleep(0.2)  # latency of a network share
+        return list_directory(path)
+
+    t0 = time.monotonic()
+    with mock.patch.object(cache, "list_directory", slow_list_directory):
+        dirs = [pdir for pdir, _ in cache.walk(tmp_path)]
+    # sequential listing would take 41 * 0.2 s = 8.2 s
+    assert time.monotonic() - t0 < 4
+    assert len(dirs) == 41
+    assert len(set(dirs)) == 41
+
+
+def test_cache_walk_abort(tmp_path):
+    for ii in range(10):
+        (tmp_path / f"dir{ii}").mkdir()
+    cache = TreeScanCache()
+    seen = []
+    for pdir, _ in cache.walk(tmp_path, abort=lambda: len(seen) == 3):
+        seen.append(pdir)
+    assert len(seen) == 3
+
+
+def test_service_request(tmp_path):
+    make_tree(tmp_path)
+    service = TreeScanService(cache=TreeScanCache())
+    service.start()
+    done = threading.Event()
+    results = []
+
+    def callback(num, size, finished):
+        results.append((num, size, finished))
+        if finished:
+            done.set()
+
+    client = object()
+    service.request(client, tmp_path, ["Thumbs.db"], callback)
+    assert done.wait(timeout=5)
+    assert results[-1] == (3, 15, True)
+    assert all(not finished for _, _, finished in results[:-1])
+    service.stop()
+    service.join(timeout=5)
+    assert not service.is_alive()
+
+
+def test_service_superseded_request(tmp_path):
+    make_tree(tmp_path / "one")
+    make_tree(tmp_path / "two")
+    (tmp_path / "two" / "extra.txt").write_text("extra")
+    service = TreeScanService(cache=TreeScanCache())
+    results = []
+    client = object()
+    # the second request supersedes the first one
+    service.request(client, tmp_path / "one", [],
+                    lambda *args: results.append(("one", args)))
+    service.request(client, tmp_path / "two", [],
+                    lambda *args: results.append(("two", args)))
+    service.process_pending()
+    assert results
+    assert all(name == "two" for name, _ in results)
+    assert results[-1] == ("two", (5, 24, True))
+
+
+def test_service_failing_job(tmp_path):
+    make_tree(tmp_path / "one")
+    make_tree(tmp_path / "two")
+    service = TreeScanService(cache=TreeScanCache())
+    results = []
+
+    def failing_callback(num, size, finished):
+        results.append(("one", (num, size, finished)))
+        if not finished:
+            raise ValueError("Cannot count")
+
+    # the failing job is dropped and reported as complete
+    service.request(object(), tmp_path / "one", [], failing_callback)
+    service.request(object(), tmp_path / "two", [],
+                    lambda *args: results.append(("two", args)))
+    service.process_pending()
+    assert results[-1] == ("two", (4, 19, True))
+    assert ("one", (0, 0, True)) in results
+    assert not service._jobs
@@ -0,0 +1,113 @@
+import json
+import pathlib
+import tempfile
+from unittest import mock
+
+from mpl_data_cast.control import CastControl
+from mpl_data_cast.mod_recipes import CatchAllRecipe
+from mpl_data_cast.worker import CastWorker, get_default_cpu_affinity
+
+
+def make_input():
+    tmpdir = pathlib.Path(tempfile.mkdtemp(prefix="worker"))
+    one = tmpdir / "input" / "folder" / "a.txt"
+    one.parent.mkdir(parents=True)
+    one.write_text("hello testing world")
+    two = tmpdir / "input" / "1.txt"
+    two.write_text("Another file!")
+    target = tmpdir / "output"
+    target.mkdir(parents=True)
+    return tmpdir / "input", target
+
+
+def test_worker_cast():
+    path_raw, target = make_input()
+    paths = []
+    worker = CastWorker("CatchAll", path_raw, target)
+    result = worker.cast(path_callback=paths.append)
+    assert result["success"]
+    assert not result["errors"]
+    assert (target / "folder" / "a.txt").read_text() == "hello testing world"
+    assert (target / "1.txt").read_text() == "Another file!"
+    assert sorted(paths) == [[path_raw / "1.txt"],
+                             [path_raw / "folder" / "a.txt"]]
+    assert worker.process is None
+    assert worker.stage is None
+
+
+def test_worker_cancel():
+    path_raw, target = make_input()
+    control = CastControl()
+    control.cancel()
+    worker = CastWorker("CatchAll", path_raw, target)
+    result = worker.cast(control=control)
+    assert not result["success"]
+    assert result["cancelled"]
+    assert not (target / "1.txt").exists()
+
+
+def test_worker_memory_limit_restart():
+    path_raw, target = make_input()
+    # any process exceeds this limit
+    worker = CastWorker("CatchAll", path_raw, target, max_rss=1,
+                        max_restarts=1)
+    result = worker.cast()
+    assert not result["success"]
+    assert not result["cancelled"]
+    # at least one error for the first run and one for the restart
+    assert len(result["errors"]) >= 2
+    assert all("memory limit" in tb for _, tb in result["errors"])
+
+
+def test_worker_restart_skips_crashed_dataset():
+    path_raw, target = make_input()
+    crashed = path_raw / "folder" / "a.txt"
+    runs = []
+
+    def run_worker(path_callback, control, error_callback, seen, skip,
+                   kwargs):
+        runs.append(set(skip))
+        if len(runs) == 1:
+            # the first dataset was copied, the worker died in the second
+            seen.update([path_raw / "1.txt", crashed])
+            return None, (crashed, "The worker process exited (-11).")
+        # the checkpoint of the restarted worker
+        path_checkpoint = CatchAllRecipe(path_raw,
+                                         target).get_checkpoint_path()
+        state = json.loads(path_checkpoint.read_text())
+        assert state["completed"] == ["1.txt"]
+        return {"success": True, "cancelled": False, "errors": []}, None
+
+    errors = []
+    worker = CastWorker("CatchAll", path_raw, target, max_restarts=0)
+    with mock.patch.object(worker, "run_worker", side_effect=run_worker):
+        result = worker.cast(error_callback=lambda *args: errors.append(args))
+    # the crashed dataset is skipped by the restarted worker
+    assert runs == [set(), {crashed}]
+    assert not result["success"]
+    assert result["errors"] == [(crashed, "The worker process exited (-11).")]
+    assert errors == result["errors"]
+
+
+def test_worker_restart_limit():
+    path_raw, target = make_input()
+    calls = []
+
+    def run_worker(**kwargs):
+        calls.append(kwargs)
+        # the worker died before it processed any dataset
+        return None, (None, "The worker process exited (1).")
+
+    worker = CastWorker("CatchAll", path_raw, target, max_restarts=2)
+    with mock.patch.object(worker, "run_worker", side_effect=run_worker):
+        result = worker.cast()
+    assert len(calls) == 3
+    assert not result["success"]
+    assert len(result["errors"]) == 3
+
+
+def test_default_cpu_affinity():
+    cpus = get_default_cpu_affinity()
+    if cpus is not None:
+        assert len(cpus) >= 1
+        assert get_default_cpu_affinity(num_cpus=1) == cpus[-1:]